@@ -1,3 +1,8 @@
 # Package initialization 
+import sys
+from pathlib import Path
 
-# Empty file to mark as package 
\ No newline at end of file
+# Make the shared `core` package at the project root importable from the backend
+project_root = str(Path(__file__).resolve().parents[2])
+if project_root not in sys.path:
+    sys.path.append(project_root)
@@ -1,9 +1,21 @@
-from opensearchpy import OpenSearch
+from functools import lru_cache
+from typing import Optional
+from fastapi import Header
 from config.settings import OPENSEARCH_HOST, OPENSEARCH_PORT
+from core.tenancy import TENANT_HEADER
 
+@lru_cache(maxsize=None)
 def get_opensearch_client():
-    # Placeholder for OpenSearch client setup
+    # Created on the first request and shared afterwards; opensearchpy is imported
+    # here so it isn't loaded at app startup
+    from opensearchpy import OpenSearch
+    from core.serialization import get_serializer
     client = OpenSearch(
-        hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}]
+        hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
+        serializer=get_serializer()
     )
-    return client 
\ No newline at end of file
+    return client
+
+def get_user_id(user_id: Optional[str] = Header(default=None, alias=TENANT_HEADER)) -> Optional[str]:
+    # Requests carrying a user id only read and write that user's indexes (see core.tenancy)
+    return user_id
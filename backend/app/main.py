@@ -1,8 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import themes, conversations, search, upload
+from fastapi.responses import PlainTextResponse
+from app.responses import DefaultJSONResponse
+from app.routers import analytics, themes, conversations, search, upload
+from core.metrics import render_prometheus
 
-app = FastAPI(title="Chat Analysis API")
+# orjson renders responses (and any numpy arrays in them) much faster than the stdlib encoder
+app = FastAPI(title="Chat Analysis API", default_response_class=DefaultJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -18,7 +22,13 @@ app.include_router(themes.router, prefix="/api/themes", tags=["themes"])
 app.include_router(conversations.router, prefix="/api/conversations", tags=["conversations"])
 app.include_router(search.router, prefix="/api/search", tags=["search"])
 app.include_router(upload.router, prefix="/api/upload", tags=["upload"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to Chat Analysis API"} 
\ No newline at end of file
+    return {"message": "Welcome to Chat Analysis API"} 
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    # Prometheus text exposition of the in-process counters and histograms
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
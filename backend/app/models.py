@@ -19,4 +19,46 @@ class SearchQuery(BaseModel):
     query: str
     filters: Optional[dict] = None
     size: int = 10
-    from_: int = 0 
\ No newline at end of file
+    from_: int = 0 
+
+class RelatedTheme(BaseModel):
+    id: str
+    score: float
+    theme: str
+    subthemes: List[str] = []
+    summary: Optional[str] = None
+    conversation_id: Optional[str] = None
+    conversation_title: Optional[str] = None
+
+class TimelineBucket(BaseModel):
+    bucket: str
+    count: int
+
+class ThemeSeries(BaseModel):
+    theme: str
+    count: int
+    buckets: List[TimelineBucket]
+
+class ThemeTimeline(BaseModel):
+    interval: str
+    total: List[TimelineBucket]
+    themes: List[ThemeSeries]
+
+class ThemeSuggestions(BaseModel):
+    term: str
+    source: str
+    suggestions: List[str]
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    status: str
+    error: Optional[str] = None
+    bytes_total: int
+    fraction_read: float
+    conversations: int
+    conversations_completed: int
+    chunks: int
+    themes: int
+    elapsed_seconds: float
+    conversations_per_second: float
+    eta_seconds: Optional[float] = None
@@ -0,0 +1,21 @@
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+
+class OrjsonResponse(JSONResponse):
+    """
+    JSON response rendered with orjson, much faster than the stdlib encoder and able
+    to write numpy arrays directly. Used instead of FastAPI's deprecated ORJSONResponse.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+# Response class for the app: orjson when installed
+DefaultJSONResponse = OrjsonResponse if orjson is not None else JSONResponse
@@ -0,0 +1,32 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from app.dependencies import get_opensearch_client, get_user_id
+from app.models import ThemeTimeline
+from app.services.theme_analytics import ThemeRollups
+from core.tenancy import tenant_index
+
+router = APIRouter()
+
+@router.get("/themes", response_model=ThemeTimeline)
+async def get_theme_timeline(
+    interval: Literal["week", "month"] = Query(default="month"),
+    start: Optional[str] = Query(default=None, description="ISO date, inclusive"),
+    end: Optional[str] = Query(default=None, description="ISO date, inclusive"),
+    top: int = Query(default=10, ge=1, le=100, description="Number of themes to chart"),
+    theme: Optional[str] = Query(default=None, description="Chart only this theme"),
+    client = Depends(get_opensearch_client),
+    user_id: Optional[str] = Depends(get_user_id)
+):
+    # Theme frequency per week/month by conversation date, read from the rollup index
+    try:
+        return await run_in_threadpool(ThemeRollups(client).timeline, tenant_index("themes", user_id),
+                                       interval, start, end, top, theme)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/themes/rebuild")
+async def rebuild_theme_rollups(client = Depends(get_opensearch_client), user_id: Optional[str] = Depends(get_user_id)):
+    # Recompute the rollups from all stored themes (backfill for themes indexed before rollups existed)
+    rollups = await run_in_threadpool(ThemeRollups(client).rebuild, tenant_index("themes", user_id))
+    return {"rollups": rollups}
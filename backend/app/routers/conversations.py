@@ -1,17 +1,19 @@
 from fastapi import APIRouter, Depends
-from app.dependencies import get_opensearch_client
+from typing import Optional
+from app.dependencies import get_opensearch_client, get_user_id
+from core.tenancy import tenant_index
 from app.models import Conversation
 
 router = APIRouter()
 
 @router.get("/", response_model=list[Conversation])
-async def get_conversations(client = Depends(get_opensearch_client)):
+async def get_conversations(client = Depends(get_opensearch_client), user_id: Optional[str] = Depends(get_user_id)):
     # Get all conversations from the OpenSearch database
-    conversations = client.search(index="conversations", body={})
+    conversations = client.search(index=tenant_index("conversations", user_id), body={})
     return [Conversation(**conversation) for conversation in conversations]
 
 @router.get("/{conversation_id}", response_model=Conversation)
-async def get_conversation(conversation_id: str, client = Depends(get_opensearch_client)):
+async def get_conversation(conversation_id: str, client = Depends(get_opensearch_client), user_id: Optional[str] = Depends(get_user_id)):
     # Get a specific conversation by ID from the OpenSearch database
-    conversation = client.get(index="conversations", id=conversation_id)
+    conversation = client.get(index=tenant_index("conversations", user_id), id=conversation_id)
     return Conversation(**conversation) 
\ No newline at end of file
@@ -1,44 +1,40 @@
 from fastapi import APIRouter, Depends, Query
-from app.dependencies import get_opensearch_client
-from app.models import SearchQuery
+from fastapi.concurrency import run_in_threadpool
+from app.dependencies import get_opensearch_client, get_user_id
+from app.models import SearchQuery, ThemeSuggestions
+from app.services.theme_suggestions import chatgpt_suggestions, opensearch_suggestions, theme_suggester
 from enum import Enum
-from typing import Literal
+from typing import Literal, Optional
+from core.tenancy import tenant_index
 
 router = APIRouter()
 
 @router.post("/")
-async def search(query: SearchQuery, client = Depends(get_opensearch_client)):
+async def search(query: SearchQuery, client = Depends(get_opensearch_client), user_id: Optional[str] = Depends(get_user_id)):
     # Perform a full text search on the OpenSearch database
-    results = client.search(index="themes", body=query.model_dump())
+    results = client.search(index=tenant_index("themes", user_id), body=query.model_dump())
 
     return results
 
-@router.get("/suggestions")
+@router.get("/suggestions", response_model=ThemeSuggestions)
 async def get_suggestions(
     term: str, 
-    source: Literal["opensearch", "chatgpt"] = Query(default="opensearch", description="Source for suggestions"),
-    client = Depends(get_opensearch_client)
+    source: Literal["local", "opensearch", "chatgpt"] = Query(default="local", description="Source for suggestions"),
+    size: int = Query(default=5, ge=1, le=20),
+    client = Depends(get_opensearch_client),
+    user_id: Optional[str] = Depends(get_user_id)
 ):
-    if source == "opensearch":
-        # Build a search query for suggestions from the themes index
-        suggestion_query = {
-            "suggest": {
-                "theme-suggest": {
-                    "prefix": term,
-                    "completion": {
-                        "field": "suggest",
-                        "size": 5,
-                        "skip_duplicates": True
-                    }
-                }
-            }
-        }
-        
-        results = client.search(index="themes", body=suggestion_query)
-        return results
+    index_name = tenant_index("themes", user_id)
+    if source == "local":
+        # In-process prefix index over theme names and subthemes. Once loaded it answers
+        # in well under a millisecond; the first load scans the themes index, off the event loop
+        if theme_suggester.ready(index_name):
+            suggestions = theme_suggester.suggest(client, index_name, term, size)
+        else:
+            suggestions = await run_in_threadpool(theme_suggester.suggest, client, index_name, term, size)
+    elif source == "opensearch":
+        # Completion suggester on the themes index's `suggest` field
+        suggestions = await run_in_threadpool(opensearch_suggestions, client, index_name, term, size)
     else:  # chatgpt
-        
-
-        raise NotImplementedError("ChatGPT suggestions not yet implemented")
-
-
+        suggestions = await run_in_threadpool(chatgpt_suggestions, term, size)
+    return ThemeSuggestions(term=term, source=source, suggestions=suggestions)
@@ -1,17 +1,31 @@
-from fastapi import APIRouter, Depends
-from app.dependencies import get_opensearch_client
-from app.models import Theme
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from app.dependencies import get_opensearch_client, get_user_id
+from core.tenancy import tenant_index
+from app.models import RelatedTheme, Theme
+from app.services.opensearch_service import OpenSearchService
 
 router = APIRouter()
 
 @router.get("/", response_model=list[Theme])
-async def get_themes(client = Depends(get_opensearch_client)):
+async def get_themes(client = Depends(get_opensearch_client), user_id: Optional[str] = Depends(get_user_id)):
     # Get all themes from the OpenSearch database   
-    themes = client.search(index="themes", body={})
+    themes = client.search(index=tenant_index("themes", user_id), body={})
     return [Theme(**theme) for theme in themes]
 
 @router.get("/{theme_id}", response_model=Theme)
-async def get_theme(theme_id: str, client = Depends(get_opensearch_client)):
+async def get_theme(theme_id: str, client = Depends(get_opensearch_client), user_id: Optional[str] = Depends(get_user_id)):
     # Get a specific theme by ID from the OpenSearch database
-    theme = client.get(index="themes", id=theme_id)
-    return Theme(**theme)
\ No newline at end of file
+    theme = client.get(index=tenant_index("themes", user_id), id=theme_id)
+    return Theme(**theme)
+
+@router.get("/{theme_id}/related", response_model=list[RelatedTheme])
+async def get_related_themes(theme_id: str, k: int = Query(default=10, ge=1, le=100),
+                             client = Depends(get_opensearch_client), user_id: Optional[str] = Depends(get_user_id)):
+    # Nearest themes by summary embedding (kNN), across all of the user's conversations
+    from opensearchpy.exceptions import NotFoundError
+    try:
+        related = OpenSearchService(client).related_themes(theme_id, k, index_name=tenant_index("themes", user_id))
+    except NotFoundError:
+        raise HTTPException(status_code=404, detail="Theme not found")
+    return [RelatedTheme(**theme) for theme in related]
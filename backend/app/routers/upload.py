@@ -1,8 +1,38 @@
-from fastapi import APIRouter, UploadFile, File
-from app.models import UploadRequest
+import hashlib
+import os
+import uuid
+from typing import Optional
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from app.dependencies import get_user_id
+from app.models import IngestJobStatus
+from app.services.ingest_jobs import job_manager
+from config.settings import UPLOAD_DIR, UPLOAD_CHUNK_SIZE
 
 router = APIRouter()
 
-@router.post("/")
-async def upload_conversation(file: UploadFile = File(...)):
-    pass 
\ No newline at end of file
+@router.post("/", status_code=202)
+async def upload_conversation(file: UploadFile = File(...), user_id: Optional[str] = Depends(get_user_id)):
+    # Stream the export to disk in fixed-size chunks, then ingest it in the background.
+    # The content checksum keys the job's checkpoint, so re-uploading an export resumes it
+    if not (file.filename or "").endswith(".json"):
+        raise HTTPException(status_code=400, detail="Expected a ChatGPT conversations .json export")
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.json")
+    checksum = hashlib.sha256()
+    with open(file_path, "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            checksum.update(chunk)
+            out.write(chunk)
+    await file.close()
+
+    job = job_manager.submit(file_path, user_id=user_id, checksum=checksum.hexdigest())
+    return {"job_id": job.id, "status": job.status}
+
+@router.get("/jobs/{job_id}", response_model=IngestJobStatus)
+async def get_upload_job(job_id: str, user_id: Optional[str] = Depends(get_user_id)):
+    # Report progress of a background ingest job; only to the user who submitted it
+    job = job_manager.get(job_id, user_id=user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_manager.progress(job)
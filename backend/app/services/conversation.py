@@ -1,12 +1,23 @@
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+from . import models
+
+# API schemas for the internal models in models.py. Conversions use
+# model_construct, skipping validation: the source objects are already typed.
 
 class Message(BaseModel):
     author: str
     content: str
     timestamp: str
 
+    @classmethod
+    def from_model(cls, message: models.Message) -> "Message":
+        return cls.model_construct(author=message.author, content=message.content, timestamp=message.timestamp)
+
+    def to_model(self) -> models.Message:
+        return models.Message(self.author, self.content, self.timestamp)
+
 class Conversation(BaseModel):
     title: str
     create_time: str
@@ -22,6 +33,14 @@ class Theme(BaseModel):
     summary: str
     nodeType: str = "informational"  # or "personal"
 
+    @classmethod
+    def from_model(cls, theme: models.Theme) -> "Theme":
+        return cls.model_construct(theme=theme.theme, subthemes=theme.subthemes,
+                                   summary=theme.summary, nodeType=theme.nodeType)
+
+    def to_model(self) -> models.Theme:
+        return models.Theme(self.theme, self.subthemes, self.summary, self.nodeType)
+
 class ThemeResponse(BaseModel):
     themes: List[Theme]
 
@@ -32,5 +51,20 @@ class Chunk(BaseModel):
     end_index: int
     messages: List[Message]
 
+    @classmethod
+    def from_model(cls, chunk: models.Chunk) -> "Chunk":
+        return cls.model_construct(
+            text=chunk.text,
+            themes=[Theme.from_model(t) for t in chunk.themes],
+            start_index=chunk.start_index,
+            end_index=chunk.end_index,
+            messages=[Message.from_model(m) for m in chunk.messages]
+        )
+
+    def to_model(self) -> models.Chunk:
+        lines = self.text.split('\n')
+        return models.Chunk(lines=lines, start_index=0, end_index=len(lines),
+                            themes=[t.to_model() for t in self.themes])
+
     def __str__(self):
-        return f"Chunk(messages={len(self.messages)}, themes={len(self.themes)})" 
\ No newline at end of file
+        return f"Chunk(messages={len(self.messages)}, themes={len(self.themes)})" 
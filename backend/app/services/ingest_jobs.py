@@ -0,0 +1,164 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional
+
+from config.settings import INGEST_JOB_MAX_FINISHED, INGEST_JOB_TTL, INGEST_JOB_WORKERS
+from core.tenancy import tenant_index
+from app.services.ingest_pipeline import IngestPipeline, run_ingest
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestJob:
+    id: str
+    file_path: str
+    bytes_total: int
+    status: str = "queued"  # queued | running | completed | partial | failed
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    chars_read: int = 0
+    user_id: Optional[str] = None
+    checksum: Optional[str] = None
+    pipeline: Optional[IngestPipeline] = None
+
+
+class IngestJobManager:
+    """
+    Runs uploaded exports through the ingest pipeline on a local worker pool
+    and keeps in-memory progress for each job, for INGEST_JOB_TTL seconds after it
+    finishes (and for at most INGEST_JOB_MAX_FINISHED finished jobs). A job whose stages dropped items is
+    reported as partial (or failed if nothing completed). The uploaded file is
+    removed once the job finishes; its checkpoint is keyed by the export's checksum
+    and target index, so uploading the same export again resumes a failed job, and
+    it is removed once a job completes.
+    """
+
+    def __init__(self, max_workers: int = INGEST_JOB_WORKERS, ttl: float = INGEST_JOB_TTL,
+                 max_finished: int = INGEST_JOB_MAX_FINISHED):
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_path: str, user_id: Optional[str] = None, checksum: Optional[str] = None) -> IngestJob:
+        """
+        Enqueue an ingest job for an export already written to disk, into user_id's
+        themes index. `checksum` (of the file's content) keys the checkpoint.
+        """
+        job = IngestJob(
+            id=uuid.uuid4().hex,
+            file_path=file_path,
+            bytes_total=os.path.getsize(file_path),
+            user_id=user_id,
+            checksum=checksum
+        )
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[IngestJob]:
+        """The job with this id, if it was submitted for user_id (None if not, or evicted)."""
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def _evict(self) -> None:
+        # Called with the lock held; running and queued jobs are kept
+        finished = sorted((job for job in self._jobs.values() if job.finished_at is not None),
+                          key=lambda job: job.finished_at)
+        cutoff = time.time() - self.ttl
+        excess = len(finished) - self.max_finished
+        for i, job in enumerate(finished):
+            if i < excess or job.finished_at < cutoff:
+                del self._jobs[job.id]
+
+    @staticmethod
+    def _checkpoint_path(job: IngestJob, index_name: str) -> Path:
+        if job.checksum is None:
+            return Path(f"{job.file_path}.checkpoint")
+        return Path(job.file_path).parent / f"{job.checksum}-{index_name}.checkpoint"
+
+    def _run(self, job: IngestJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        index_name = tenant_index("themes", job.user_id)
+        checkpoint_path = self._checkpoint_path(job, index_name)
+        try:
+            job.pipeline = IngestPipeline(checkpoint_path=checkpoint_path, index_name=index_name)
+            stats = run_ingest(job.file_path, pipeline=job.pipeline, on_read=lambda n: self._on_read(job, n))
+            # Stages log and count failed batches instead of raising
+            failed = {name: stage["errors"] for name, stage in stats["stages"].items() if stage["errors"]}
+            if stats.get("extract_failures"):
+                failed["extract"] = failed.get("extract", 0) + stats["extract_failures"]
+            if failed:
+                job.status = "partial" if stats["completed"] else "failed"
+                job.error = "Items failed in stages: " + ", ".join(f"{name} ({count})" for name, count in failed.items())
+                logger.error(f"Ingest job {job.id} {job.status}: {job.error}")
+            else:
+                job.status = "completed"
+                checkpoint_path.unlink(missing_ok=True)
+        except Exception as e:
+            logger.error(f"Ingest job {job.id} failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            try:
+                os.remove(job.file_path)
+            except OSError as e:
+                logger.warning(f"Could not remove upload {job.file_path}: {str(e)}")
+
+    def _on_read(self, job: IngestJob, chars: int) -> None:
+        job.chars_read += chars
+
+    def progress(self, job: IngestJob) -> Dict:
+        """
+        Progress snapshot for a job. The total number of conversations is not known
+        up front, so it is estimated from the fraction of the file read so far.
+        """
+        counters = dict(job.pipeline.counters) if job.pipeline else {}
+        conversations = counters.get("conversations", 0) + counters.get("skipped", 0)
+        completed = counters.get("completed", 0)
+        end = job.finished_at or time.time()
+        elapsed = end - job.started_at if job.started_at else 0.0
+
+        # Characters read only approximate bytes for non-ASCII exports
+        fraction_read = min(1.0, job.chars_read / job.bytes_total) if job.bytes_total else 1.0
+        if job.status in ("completed", "partial"):
+            fraction_read = 1.0
+        throughput = completed / elapsed if elapsed else 0.0
+        eta_seconds = None
+        if job.status == "running" and fraction_read > 0 and throughput > 0:
+            estimated_total = conversations / fraction_read
+            eta_seconds = round(max(0.0, estimated_total - completed - counters.get("skipped", 0)) / throughput, 1)
+
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "error": job.error,
+            "bytes_total": job.bytes_total,
+            "fraction_read": round(fraction_read, 4),
+            "conversations": conversations,
+            "conversations_completed": completed,
+            "chunks": counters.get("chunks", 0),
+            "themes": counters.get("themes", 0),
+            "elapsed_seconds": round(elapsed, 1),
+            "conversations_per_second": round(throughput, 3),
+            "eta_seconds": eta_seconds
+        }
+
+
+job_manager = IngestJobManager()
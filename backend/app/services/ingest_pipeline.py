@@ -0,0 +1,361 @@
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.services.models import Chunk, Theme
+from app.services import parse_chatgpt_conversation as conversation_parser
+from app.services.pii_filter import PII_FILTER_ENABLED, filter_pii
+from core.metrics import STAGE_SECONDS, counter, gauge
+
+logger = logging.getLogger(__name__)
+
+INGEST_ITEMS = counter("ingest_items_total", "Items processed by each ingest stage, by outcome")
+INGEST_QUEUE_DEPTH = gauge("ingest_queue_depth", "Items waiting in each ingest stage's input queue")
+
+# --- Configuration ---
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))
+INGEST_PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", "1"))
+INGEST_CHUNK_WORKERS = int(os.getenv("INGEST_CHUNK_WORKERS", "1"))
+INGEST_EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", "8"))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "1"))
+INGEST_INDEX_WORKERS = int(os.getenv("INGEST_INDEX_WORKERS", "1"))
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+INGEST_INDEX_BATCH_SIZE = int(os.getenv("INGEST_INDEX_BATCH_SIZE", "200"))
+INGEST_BATCH_TIMEOUT = float(os.getenv("INGEST_BATCH_TIMEOUT", "2.0"))
+# Embed theme summaries in the embed stage (one request per batch) for related-theme search
+INGEST_EMBED_THEMES = os.getenv("INGEST_EMBED_THEMES", "true").lower() in ("1", "true", "yes")
+
+_DONE = object()
+
+
+@dataclass(slots=True)
+class ChunkTask:
+    """A single chunk of a conversation travelling through the pipeline."""
+    conversation_id: str
+    conversation_title: str
+    chunk_index: int
+    chunk: Chunk
+    theme: Optional[Theme] = None
+    # Theme extraction gave up on the chunk
+    failed: bool = False
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
+class IngestCheckpoint:
+    """
+    Append-only record of fully indexed conversation ids.
+    A crashed run is resumed by skipping every id already in the file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.completed = set()
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.completed = {line.strip() for line in file if line.strip()}
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return conversation_id in self.completed
+
+    def mark_done(self, conversation_id: str) -> None:
+        with self._lock:
+            if conversation_id in self.completed:
+                return
+            self.completed.add(conversation_id)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(conversation_id + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+
+@dataclass
+class StageStats:
+    processed: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+
+
+class Stage:
+    """
+    One pipeline stage: `workers` threads reading from a bounded input queue.
+    `func` receives a batch (list) of items and returns the items to pass on.
+    Puts into the next stage's bounded queue block when it is full, which is what
+    provides backpressure to the stages upstream.
+    """
+
+    def __init__(self, name: str, func: Callable[[List], Iterable], workers: int = 1,
+                 batch_size: int = 1, queue_size: int = INGEST_QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.input: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.next_stage: Optional["Stage"] = None
+        self.stats = StageStats()
+        self._stats_lock = threading.Lock()
+        self._finished_workers = 0
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self) -> None:
+        for thread in self._threads:
+            thread.join()
+
+    def _next_batch(self) -> Tuple[List, bool]:
+        """Collect up to batch_size items; returns (batch, saw_done)."""
+        item = self.input.get()
+        if item is _DONE:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + INGEST_BATCH_TIMEOUT
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.input.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        done = False
+        while not done:
+            batch, done = self._next_batch()
+            if not batch:
+                continue
+            INGEST_QUEUE_DEPTH.set(self.input.qsize(), stage=self.name)
+            started = time.monotonic()
+            try:
+                results = list(self.func(batch) or [])
+            except Exception as e:
+                logger.error(f"[{self.name}] stage failed on batch of {len(batch)}: {str(e)}")
+                elapsed = time.monotonic() - started
+                STAGE_SECONDS.observe(elapsed, stage=f"ingest_{self.name}")
+                INGEST_ITEMS.inc(len(batch), stage=self.name, outcome="error")
+                with self._stats_lock:
+                    self.stats.errors += len(batch)
+                    self.stats.busy_seconds += elapsed
+                continue
+            elapsed = time.monotonic() - started
+            STAGE_SECONDS.observe(elapsed, stage=f"ingest_{self.name}")
+            INGEST_ITEMS.inc(len(batch), stage=self.name, outcome="ok")
+            with self._stats_lock:
+                self.stats.processed += len(batch)
+                self.stats.busy_seconds += elapsed
+            if self.next_stage is not None:
+                for result in results:
+                    self.next_stage.input.put(result)
+
+        with self._stats_lock:
+            self._finished_workers += 1
+            last = self._finished_workers == self.workers
+        if last and self.next_stage is not None:
+            self.next_stage.close()
+
+    def close(self) -> None:
+        """Signal that no more input will arrive."""
+        for _ in range(self.workers):
+            self.input.put(_DONE)
+
+
+class IngestPipeline:
+    """
+    Staged ingest of a ChatGPT export: parse -> chunk -> extract -> embed -> index.
+    Stages are connected by bounded queues and each runs its own worker threads.
+    Conversations are checkpointed once all of their chunks are indexed. A conversation
+    with a chunk whose theme extraction gave up is not, so a resumed run retries it;
+    such chunks are counted in `extract_failures`.
+    """
+
+    def __init__(self, opensearch_service=None, checkpoint_path: Optional[Path] = None,
+                 embed_func: Optional[Callable[[List[Theme]], None]] = None,
+                 index_name: str = "themes"):
+        self.opensearch_service = opensearch_service or conversation_parser.get_opensearch_service()
+        self.checkpoint = IngestCheckpoint(checkpoint_path) if checkpoint_path else None
+        if embed_func is None and INGEST_EMBED_THEMES:
+            embed_func = conversation_parser.embed_theme_summaries
+        self.embed_func = embed_func
+        self.index_name = index_name
+        self.counters = {"conversations": 0, "skipped": 0, "completed": 0, "chunks": 0, "themes": 0,
+                         "extract_failures": 0}
+        self._pending: Dict[str, int] = {}
+        self._failed: Set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._started_at: Optional[float] = None
+
+        self.stages = [
+            Stage("parse", self._parse, INGEST_PARSE_WORKERS),
+            Stage("chunk", self._chunk, INGEST_CHUNK_WORKERS),
+            Stage("extract", self._extract, INGEST_EXTRACT_WORKERS),
+            Stage("embed", self._embed, INGEST_EMBED_WORKERS, batch_size=INGEST_EMBED_BATCH_SIZE),
+            Stage("index", self._index, INGEST_INDEX_WORKERS, batch_size=INGEST_INDEX_BATCH_SIZE),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+
+    # --- Stage functions ---
+
+    def _parse(self, batch: List[Dict]) -> List[Dict]:
+        return conversation_parser.parse_conversations(batch)
+
+    def _chunk(self, batch: List[Dict]) -> List[ChunkTask]:
+        tasks = []
+        for convo in batch:
+            full_text = "\n".join(msg["content"] for msg in convo["messages"])
+            # Redact before the text is sent for extraction or stored as text_data
+            if PII_FILTER_ENABLED:
+                full_text = filter_pii(full_text)
+                convo["title"] = filter_pii(convo["title"])
+            chunks = conversation_parser.chunk_conversation(full_text)
+            if not chunks:
+                self._complete(convo["id"])
+                continue
+            with self._pending_lock:
+                self._pending[convo["id"]] = len(chunks)
+                self.counters["chunks"] += len(chunks)
+            tasks.extend(
+                ChunkTask(convo["id"], convo["title"], idx, chunk,
+                          created_at=convo.get("created_at"), updated_at=convo.get("updated_at"))
+                for idx, chunk in enumerate(chunks)
+            )
+        return tasks
+
+    def _extract(self, batch: List[ChunkTask]) -> List[ChunkTask]:
+        for task in batch:
+            chunk_text = task.chunk.text
+            themes_data = conversation_parser.extract_themes_from_chunk(chunk_text)
+            if themes_data is None:
+                task.failed = True
+                with self._pending_lock:
+                    self.counters["extract_failures"] += 1
+                continue
+            task.theme = Theme(
+                theme=themes_data["theme"],
+                subthemes=themes_data["subthemes"],
+                summary=themes_data["summary"],
+                nodeType=themes_data["nodeType"],
+                text_data=chunk_text,
+                conversation_title=task.conversation_title,
+                conversation_id=task.conversation_id,
+                chunk_index=task.chunk_index,
+                conversation_created_at=task.created_at,
+                conversation_updated_at=task.updated_at
+            )
+            task.chunk.themes = [task.theme]
+        return batch
+
+    def _embed(self, batch: List[ChunkTask]) -> List[ChunkTask]:
+        if self.embed_func is not None:
+            themes = [task.theme for task in batch if task.theme is not None]
+            if themes:
+                self.embed_func(themes)
+        return batch
+
+    def _index(self, batch: List[ChunkTask]) -> List[ChunkTask]:
+        themes = [task.theme for task in batch if task.theme is not None]
+        if themes:
+            result = self.opensearch_service.bulk_insert_themes(themes, index_name=self.index_name)
+            if result['errors']:
+                raise RuntimeError(f"{result['errors']} themes failed to index")
+            with self._pending_lock:
+                self.counters["themes"] += result['indexed']
+        for task in batch:
+            self._ack(task.conversation_id, task.failed)
+        return []
+
+    # --- Completion tracking ---
+
+    def _ack(self, conversation_id: str, failed: bool = False) -> None:
+        with self._pending_lock:
+            if failed:
+                self._failed.add(conversation_id)
+            self._pending[conversation_id] -= 1
+            finished = self._pending[conversation_id] == 0
+            if finished:
+                del self._pending[conversation_id]
+                failed = conversation_id in self._failed
+                self._failed.discard(conversation_id)
+        if finished and not failed:
+            self._complete(conversation_id)
+
+    def _complete(self, conversation_id: str) -> None:
+        with self._pending_lock:
+            self.counters["completed"] += 1
+        if self.checkpoint is not None:
+            self.checkpoint.mark_done(conversation_id)
+
+    # --- Running ---
+
+    def run(self, conversations: Iterable[Dict]) -> Dict:
+        """
+        Feed raw export conversations through the pipeline and block until done.
+        Conversations already recorded in the checkpoint are skipped.
+        """
+        self._started_at = time.monotonic()
+        for stage in self.stages:
+            stage.start()
+
+        head = self.stages[0]
+        try:
+            for raw in conversations:
+                if self.checkpoint is not None and conversation_parser.conversation_id(raw) in self.checkpoint:
+                    self.counters["skipped"] += 1
+                    continue
+                self.counters["conversations"] += 1
+                head.input.put(raw)
+        finally:
+            head.close()
+            for stage in self.stages:
+                stage.join()
+
+        return self.stats()
+
+    def stats(self) -> Dict:
+        """Per-stage throughput and queue depth plus overall counters."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        stages = {}
+        for stage in self.stages:
+            stages[stage.name] = {
+                "workers": stage.workers,
+                "processed": stage.stats.processed,
+                "errors": stage.stats.errors,
+                "queue_depth": stage.input.qsize(),
+                "queue_size": stage.input.maxsize,
+                "busy_seconds": round(stage.stats.busy_seconds, 3),
+                "throughput_per_s": round(stage.stats.processed / elapsed, 2) if elapsed else 0.0
+            }
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            **self.counters,
+            "stages": stages
+        }
+
+
+def run_ingest(file_path: str, checkpoint_path: Optional[str] = None,
+               on_read: Optional[Callable[[int], None]] = None,
+               pipeline: Optional[IngestPipeline] = None, **kwargs) -> Dict:
+    """
+    Entry point for ingesting a ChatGPT export file through the staged pipeline.
+    The checkpoint defaults to `<file_path>.checkpoint` next to the export.
+    """
+    if pipeline is None:
+        checkpoint_path = Path(checkpoint_path or f"{file_path}.checkpoint")
+        pipeline = IngestPipeline(checkpoint_path=checkpoint_path, **kwargs)
+    pipeline.opensearch_service.ensure_index(pipeline.index_name)
+    return pipeline.run(conversation_parser.iter_chatgpt_json(file_path, on_read=on_read))
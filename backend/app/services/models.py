@@ -1,13 +1,22 @@
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import List, Optional
 
-@dataclass
+# Slotted dataclasses: no per-instance __dict__, which matters when an import
+# holds hundreds of thousands of these at once.
+
+@dataclass(slots=True)
 class Message:
     author: str
     content: str
     timestamp: str
 
-@dataclass
+    @classmethod
+    def from_line(cls, line: str) -> "Message":
+        """Build a message from an 'author: content' line of conversation text."""
+        author, sep, content = line.partition(': ')
+        return cls(author=author, content=content if sep else line, timestamp="N/A")
+
+@dataclass(slots=True)
 class Theme:
     theme: str
     subthemes: List[str]
@@ -15,11 +24,33 @@ class Theme:
     nodeType: str = "informational"
     text_data: str = ""
     conversation_title: str = "Untitled"
+    conversation_id: str = ""
+    chunk_index: int = 0
+    # Source conversation's create/update times (ISO 8601, UTC)
+    conversation_created_at: Optional[str] = None
+    conversation_updated_at: Optional[str] = None
+    # Embedding of the theme name and summary, for related-theme (kNN) search
+    summary_embedding: Optional[List[float]] = None
 
-@dataclass
+@dataclass(slots=True)
 class Chunk:
-    text: str
-    themes: List[Theme]
+    """
+    A span of lines [start_index, end_index) of a conversation. The lines list is
+    shared by every chunk of the conversation, so text is not copied per chunk;
+    `text` and `messages` are built on access.
+    """
+    lines: List[str]
     start_index: int
     end_index: int
-    messages: List[Message] 
\ No newline at end of file
+    themes: List[Theme] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self.lines[self.start_index:self.end_index])
+
+    @property
+    def messages(self) -> List[Message]:
+        return [Message.from_line(line) for line in self.lines[self.start_index:self.end_index]]
+
+    def __len__(self) -> int:
+        return self.end_index - self.start_index
@@ -1,4 +1,3 @@
-from opensearchpy import OpenSearch
 import sys
 from pathlib import Path
 
@@ -8,13 +7,30 @@ if backend_dir not in sys.path:
     sys.path.append(backend_dir)
 
 from .models import Theme, Message
-from typing import List
+from typing import TYPE_CHECKING, Dict, List, Set
 import json
+import logging
 from datetime import datetime
+from config.settings import VECTOR_DIMENSION
+from core.metrics import opensearch_call
+from core.tenancy import drop_tenant, ensure_index
+from .theme_analytics import ThemeRollups, rollup_index, theme_time
+from .theme_suggestions import suggest_inputs, theme_suggester
+
+if TYPE_CHECKING:
+    from opensearchpy import OpenSearch
+
+logger = logging.getLogger(__name__)
+
+# Themes indexes whose summary_embedding can't be made a knn_vector (created without
+# k-NN). Embeddings are left out of their documents: dynamic mapping would otherwise
+# make the field a plain float array that can never become a knn_vector.
+_indexes_without_knn: Set[str] = set()
 
 class OpenSearchService:
-    def __init__(self, client: OpenSearch):
+    def __init__(self, client: "OpenSearch"):
         self.client = client
+        self.rollups = ThemeRollups(client)
 
     async def store_conversation(self, messages: List[Message]):
         pass
@@ -22,48 +38,194 @@ class OpenSearchService:
     async def search_conversations(self, query: str):
         pass
 
-    def insert_data_into_opensearch(self, themes: List[Theme], index_name: str = "themes") -> None:
+    def ensure_index(self, index_name: str = "themes") -> None:
         """
-        Insert theme data into OpenSearch
+        Create the themes index if it doesn't exist (behind an alias for a tenant index)
         """
-        try:
-            # Create index if it doesn't exist
-            if not self.client.indices.exists(index=index_name):
-                mapping = {
-                    "mappings": {
-                        "properties": {
-                            "theme": {"type": "text"},
-                            "subthemes": {"type": "keyword"},
-                            "summary": {"type": "text"},
-                            "nodeType": {"type": "keyword"},
-                            "text_data": {"type": "text"},
-                            "conversation_title": {"type": "keyword"},
-                            "timestamp": {"type": "date"}
+        mapping = {
+            "settings": {
+                "index": {
+                    "knn": True  # Enable k-NN for summary_embedding
+                }
+            },
+            "mappings": {
+                "properties": {
+                    "theme": {"type": "text"},
+                    "subthemes": {"type": "keyword"},
+                    "summary": {"type": "text"},
+                    "nodeType": {"type": "keyword"},
+                    "text_data": {"type": "text"},
+                    "conversation_title": {"type": "keyword"},
+                    "conversation_id": {"type": "keyword"},
+                    # Source conversation's create time (insert time if the export had none)
+                    "timestamp": {"type": "date"},
+                    "conversation_updated_at": {"type": "date"},
+                    "indexed_at": {"type": "date"},
+                    # Theme name and subthemes, for prefix suggestions (/api/search/suggestions)
+                    "suggest": {"type": "completion"},
+                    # Embedded theme name and summary, for related themes (/api/themes/{id}/related)
+                    "summary_embedding": {
+                        "type": "knn_vector",
+                        "dimension": VECTOR_DIMENSION,
+                        # faiss: Lucene on OpenSearch 2.9 is limited to 1024 dimensions. Embeddings
+                        # are unit length, so l2 ranks as cosine similarity would
+                        "method": {
+                            "name": "hnsw",
+                            "engine": "faiss",
+                            "space_type": "l2"
                         }
                     }
                 }
-                self.client.indices.create(index=index_name, body=mapping)
+            }
+        }
+        if ensure_index(self.client, index_name, mapping):
+            _indexes_without_knn.discard(index_name)
+            return
+        # Indexes created before these fields existed: new fields can be added in place
+        # (summary_embedding only if the index was created with k-NN enabled)
+        with opensearch_call("get_mapping"):
+            current = self.client.indices.get_mapping(index=index_name)
+        existing = next(iter(current.values()), {}).get("mappings", {}).get("properties", {})
+        for field in ("suggest", "summary_embedding"):
+            if field in existing:
+                if field == "summary_embedding" and existing[field].get("type") != "knn_vector":
+                    logger.warning(f"{field} in {index_name} is not a knn_vector, recreate the index to use it")
+                    _indexes_without_knn.add(index_name)
+                continue
+            try:
+                with opensearch_call("put_mapping"):
+                    self.client.indices.put_mapping(index=index_name, body={
+                        "properties": {field: mapping["mappings"]["properties"][field]}
+                    })
+            except Exception as e:
+                logger.warning(f"Could not add {field} to {index_name}, recreate the index to use it: {str(e)}")
+                if field == "summary_embedding":
+                    _indexes_without_knn.add(index_name)
+
+    def drop_user(self, user_id: str) -> List[str]:
+        """
+        Delete all of a user's themes and conversations by deleting their indexes
+        """
+        return drop_tenant(self.client, ["themes", rollup_index("themes"), "conversations"], user_id)
+
+    @staticmethod
+    def _theme_id(theme: Theme) -> str:
+        return f"{theme.conversation_id}-{theme.chunk_index}"
+
+    def _theme_document(self, theme: Theme, index_name: str) -> dict:
+        inputs = suggest_inputs(theme.theme, theme.subthemes)
+        document = {
+            "theme": theme.theme,
+            "subthemes": theme.subthemes,
+            "summary": theme.summary,
+            "nodeType": theme.nodeType,
+            "text_data": theme.text_data,
+            "conversation_title": theme.conversation_title,
+            "conversation_id": theme.conversation_id,
+            "timestamp": theme_time(theme),
+            "conversation_updated_at": theme.conversation_updated_at,
+            "indexed_at": datetime.utcnow().isoformat(),
+            "suggest": {"input": inputs}
+        }
+        if theme.summary_embedding is not None and index_name not in _indexes_without_knn:
+            document["summary_embedding"] = theme.summary_embedding
+        return document
+
+    def _record_suggestions(self, themes: List[Theme], index_name: str) -> None:
+        # Keep this process's in-memory prefix index current without reloading it
+        theme_suggester.record(index_name, [term for theme in themes
+                                            for term in suggest_inputs(theme.theme, theme.subthemes)])
+
+    def insert_data_into_opensearch(self, themes: List[Theme], index_name: str = "themes") -> None:
+        """
+        Insert theme data into OpenSearch
+        """
+        try:
+            self.ensure_index(index_name)
 
             # Insert each theme as a document
             for theme in themes:
-                document = {
-                    "theme": theme.theme,
-                    "subthemes": theme.subthemes,
-                    "summary": theme.summary,
-                    "nodeType": theme.nodeType,
-                    "text_data": theme.text_data,
-                    "conversation_title": theme.conversation_title,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-                
-                self.client.index(
-                    index=index_name,
-                    body=document,
-                    refresh=True
-                )
+                with opensearch_call("index"):
+                    self.client.index(
+                        index=index_name,
+                        body=self._theme_document(theme, index_name),
+                        refresh=True
+                    )
+            self._record_suggestions(themes, index_name)
+            self.rollups.record(index_name, themes)
             
-            print(f"Successfully inserted {len(themes)} themes into OpenSearch")
+            logger.info(f"Successfully inserted {len(themes)} themes into OpenSearch")
             
         except Exception as e:
-            print(f"Error inserting data into OpenSearch: {str(e)}")
-            raise 
\ No newline at end of file
+            logger.error(f"Error inserting data into OpenSearch: {str(e)}")
+            raise
+
+    def bulk_insert_themes(self, themes: List[Theme], index_name: str = "themes") -> dict:
+        """
+        Insert themes with a single bulk request and no per-document refresh.
+        Themes carrying a conversation_id get a deterministic _id and are created only
+        if absent, so re-running an interrupted ingest neither duplicates them nor
+        counts them twice in the theme rollups.
+        """
+        actions = []
+        for theme in themes:
+            action = {
+                "_op_type": "index",
+                "_index": index_name,
+                "_source": self._theme_document(theme, index_name)
+            }
+            if theme.conversation_id:
+                action["_op_type"] = "create"
+                action["_id"] = self._theme_id(theme)
+            actions.append(action)
+
+        if not actions:
+            return {'indexed': 0, 'errors': 0, 'duplicates': 0}
+
+        from opensearchpy import helpers
+        inserted = []
+        errors = duplicates = 0
+        with opensearch_call("bulk"):
+            # Results come back in action order, so each theme gets its own outcome (themes
+            # without a conversation_id have no _id to match a failure to)
+            for theme, (ok, result) in zip(themes, helpers.streaming_bulk(self.client, actions, raise_on_error=False)):
+                if ok:
+                    inserted.append(theme)
+                elif next(iter(result.values())).get("status") == 409:
+                    duplicates += 1
+                else:
+                    errors += 1
+        self._record_suggestions(inserted, index_name)
+        self.rollups.record(index_name, inserted)
+        return {
+            'indexed': len(inserted),
+            'errors': errors,
+            'duplicates': duplicates
+        }
+
+    def related_themes(self, theme_id: str, k: int = 10, index_name: str = "themes") -> List[Dict]:
+        """
+        The k themes whose summary embeddings are nearest to theme_id's, from any
+        conversation. Returns an empty list if the theme has no embedding.
+        """
+        with opensearch_call("get"):
+            source = self.client.get(index=index_name, id=theme_id, _source_includes=["summary_embedding"])["_source"]
+        embedding = source.get("summary_embedding")
+        if not embedding:
+            return []
+        query = {
+            "size": k,
+            "_source": {"excludes": ["summary_embedding", "text_data", "suggest"]},
+            "query": {
+                "knn": {
+                    "summary_embedding": {
+                        "vector": embedding,
+                        "k": k,
+                        "filter": {"bool": {"must_not": {"ids": {"values": [theme_id]}}}}
+                    }
+                }
+            }
+        }
+        with opensearch_call("knn_search"):
+            response = self.client.search(index=index_name, body=query)
+        return [{"id": hit["_id"], "score": hit["_score"], **hit["_source"]} for hit in response["hits"]["hits"]]
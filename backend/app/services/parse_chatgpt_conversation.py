@@ -1,11 +1,11 @@
+import hashlib
 import json
 from datetime import datetime
-from typing import List, Dict
-import openai
+from functools import lru_cache
+from typing import Callable, List, Dict, Iterator, Optional
 from dotenv import load_dotenv
 import os
-from models import Message, Theme, Chunk
-from openai import OpenAI
+import logging
 from pathlib import Path
 import sys
 
@@ -14,8 +14,22 @@ backend_dir = str(Path(__file__).resolve().parents[2])
 if backend_dir not in sys.path:
     sys.path.append(backend_dir)
 
+from app.services.models import Theme, Chunk
+from app.services.structured_output import THEME_JSON_SCHEMA, parse_json_object, validate_theme
 from app.services.opensearch_service import OpenSearchService
-from opensearchpy import OpenSearch
+from app.services.pii_filter import PII_FILTER_ENABLED, filter_pii
+from config.settings import (
+    COMPLETION_PROVIDER,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DEVICE,
+    EMBEDDING_MODEL,
+    EMBEDDING_PROVIDER,
+    OPENAI_BASE_URL,
+    VECTOR_DIMENSION
+)
+from core import providers
+from core.metrics import counter, log_event, timed
+from core.providers import CompletionProvider, EmbeddingProvider, ProviderError, UnsupportedResponseFormat
 
 # --- Configuration ---
 # Load environment variables
@@ -24,6 +38,13 @@ load_dotenv()
 # Get OpenAI settings from environment
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 COMPLETION_MODEL = os.getenv("COMPLETION_MODEL", "gpt-4-turbo-preview")
+THEME_EXTRACTION_MAX_RETRIES = int(os.getenv("THEME_EXTRACTION_MAX_RETRIES", "2"))
+
+logger = logging.getLogger(__name__)
+
+# Theme extraction events (requests, retries, parse/validation failures, ...)
+EXTRACTION_EVENTS = counter("theme_extraction_events_total", "Theme extraction requests, retries and failures by event")
+_json_schema_supported = True
 
 # OpenSearch settings
 OPENSEARCH_HOST = os.getenv("OPENSEARCH_HOST", "localhost")
@@ -31,13 +52,32 @@ OPENSEARCH_PORT = int(os.getenv("OPENSEARCH_PORT", "9200"))
 OPENSEARCH_USER = os.getenv("OPENSEARCH_USERNAME", "admin")
 OPENSEARCH_PASS = os.getenv("OPENSEARCH_PASSWORD", "admin")
 
-# Initialize OpenSearch client
-opensearch_client = OpenSearch(
-    hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
-    http_auth=(OPENSEARCH_USER, OPENSEARCH_PASS),
-    use_ssl=False
-)
-opensearch_service = OpenSearchService(opensearch_client)
+# Clients are created on first use rather than at import, so importing this module
+# (e.g. at API startup) neither loads a model SDK nor needs OpenSearch to be up.
+
+@lru_cache(maxsize=None)
+def get_opensearch_service() -> OpenSearchService:
+    """Shared OpenSearchService for the configured cluster."""
+    from opensearchpy import OpenSearch
+    from core.serialization import get_serializer
+    client = OpenSearch(
+        hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
+        http_auth=(OPENSEARCH_USER, OPENSEARCH_PASS),
+        use_ssl=False,
+        serializer=get_serializer()
+    )
+    return OpenSearchService(client)
+
+def get_completion_provider() -> CompletionProvider:
+    """Shared completion provider (COMPLETION_PROVIDER); it is thread-safe and reuses connections."""
+    return providers.get_completion_provider(COMPLETION_PROVIDER, COMPLETION_MODEL,
+                                             api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """Shared embedding provider (EMBEDDING_PROVIDER) for theme summaries."""
+    return providers.get_embedding_provider(EMBEDDING_PROVIDER, EMBEDDING_MODEL, api_key=OPENAI_API_KEY,
+                                            base_url=OPENAI_BASE_URL, batch_size=EMBEDDING_BATCH_SIZE,
+                                            device=EMBEDDING_DEVICE, dimension=VECTOR_DIMENSION)
 
 # --- Conversation Parsing Functions ---
 
@@ -48,6 +88,55 @@ def load_chatgpt_json(file_path: str) -> List[Dict]:
     with open(file_path, 'r', encoding='utf-8') as file:
         return json.load(file)
 
+def iter_chatgpt_json(file_path: str, read_size: int = 1 << 20,
+                      on_read: Optional[Callable[[int], None]] = None) -> Iterator[Dict]:
+    """
+    Stream conversations from a ChatGPT JSON export one at a time.
+    The export is a top-level JSON array; items are decoded incrementally so the
+    whole file never has to be held in memory. `on_read` is called with the number
+    of characters consumed after each read, for progress reporting.
+    """
+    decoder = json.JSONDecoder()
+    separators = " \t\r\n,"
+    with open(file_path, 'r', encoding='utf-8') as file:
+        buffer = file.read(read_size)
+        if on_read:
+            on_read(len(buffer))
+        buffer = buffer.lstrip()
+        if not buffer.startswith("["):
+            raise ValueError("Expected a JSON array of conversations")
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in separators:
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            try:
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                data = file.read(read_size)
+                if on_read:
+                    on_read(len(data))
+                eof = not data
+                buffer = buffer[pos:] + data
+                pos = 0
+                continue
+            yield item
+
+def conversation_id(convo: Dict) -> str:
+    """
+    Return a stable id for a raw conversation: the export's own id when present,
+    otherwise a hash of its title and creation time.
+    """
+    convo_id = convo.get("id") or convo.get("conversation_id")
+    if convo_id:
+        return str(convo_id)
+    key = f"{convo.get('title', '')}|{convo.get('create_time', '')}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
 def format_timestamp(timestamp) -> str:
     """
     Convert a timestamp to a readable string.
@@ -56,6 +145,14 @@ def format_timestamp(timestamp) -> str:
         return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
     return "N/A"
 
+def iso_timestamp(timestamp) -> Optional[str]:
+    """
+    Convert an export epoch timestamp to an ISO 8601 UTC string (None if missing).
+    """
+    if timestamp:
+        return datetime.utcfromtimestamp(timestamp).isoformat()
+    return None
+
 def process_content_parts(parts: List) -> str:
     """
     Process content parts to ensure all items are strings.
@@ -94,8 +191,12 @@ def parse_conversations(data: List[Dict]) -> List[Dict]:
                     "timestamp": timestamp
                 })
         conversations.append({
+            "id": conversation_id(convo),
             "title": title,
             "create_time": create_time,
+            # Machine-readable times, stored on the conversation's themes
+            "created_at": iso_timestamp(convo.get("create_time")),
+            "updated_at": iso_timestamp(convo.get("update_time")),
             "messages": messages
         })
     return conversations
@@ -115,64 +216,56 @@ def display_conversations(conversations: List[Dict]):
 # --- Theme Extraction Functions ---
 
 def chunk_conversation(conversation_text: str, max_length: int = 1000) -> List[Chunk]:
-    """Split conversation into chunks with metadata."""
+    """Split conversation into chunks of line spans over a shared list of lines."""
     chunks = []
-    current_chunk = []
+    lines = conversation_text.split('\n')
+    start = 0
     current_length = 0
-    messages = conversation_text.split('\n')
-    
-    for i, message in enumerate(messages):
-        message_length = len(message)
-        if current_length + message_length > max_length and current_chunk:
-            # Create a new chunk from the current set of messages.
-            chunk_text = '\n'.join(current_chunk)
-            chunk_messages = [
-                Message(
-                    author=msg.split(': ')[0],
-                    content=': '.join(msg.split(': ')[1:]) if ': ' in msg else msg,
-                    timestamp="N/A"
-                ) for msg in current_chunk
-            ]
-            chunks.append(Chunk(
-                text=chunk_text,
-                themes=[],
-                start_index=i - len(current_chunk),
-                end_index=i,
-                messages=chunk_messages
-            ))
-            current_chunk = []
+
+    for i, line in enumerate(lines):
+        line_length = len(line)
+        if current_length + line_length > max_length and i > start:
+            chunks.append(Chunk(lines=lines, start_index=start, end_index=i))
+            start = i
             current_length = 0
-        
-        current_chunk.append(message)
-        current_length += message_length
-    
+        current_length += line_length
+
     # Process the final chunk
-    if current_chunk:
-        chunk_text = '\n'.join(current_chunk)
-        chunk_messages = [
-            Message(
-                author=msg.split(': ')[0],
-                content=': '.join(msg.split(': ')[1:]) if ': ' in msg else msg,
-                timestamp="N/A"
-            ) for msg in current_chunk
-        ]
-        chunks.append(Chunk(
-            text=chunk_text,
-            themes=[],
-            start_index=len(messages) - len(current_chunk),
-            end_index=len(messages),
-            messages=chunk_messages
-        ))
-    
+    if start < len(lines):
+        chunks.append(Chunk(lines=lines, start_index=start, end_index=len(lines)))
+
     return chunks
 
-def extract_themes_from_chunk(chunk_text: str) -> Dict:
+def _request_theme_completion(provider: CompletionProvider, prompt: str) -> str:
+    """
+    Request a theme completion, using the JSON-schema response format when the model
+    supports it and falling back to plain JSON mode otherwise.
     """
-    Uses the OpenAI API to extract a theme and sub-themes from a conversation chunk.
-    The prompt instructs the API to return a JSON structure with theme details.
+    global _json_schema_supported
+    messages = [
+        {"role": "system", "content": "You are an assistant that extracts structured themes from conversations."},
+        {"role": "user", "content": prompt}
+    ]
+    if _json_schema_supported:
+        try:
+            return provider.complete(messages, "theme_extraction", temperature=0.2, max_tokens=500,
+                                     response_format={"type": "json_schema", "json_schema": THEME_JSON_SCHEMA})
+        except UnsupportedResponseFormat:
+            logger.warning(f"Model {provider.model} does not support json_schema, falling back to json_object")
+            _json_schema_supported = False
+            EXTRACTION_EVENTS.inc(event="schema_fallbacks")
+
+    return provider.complete(messages, "theme_extraction", temperature=0.2, max_tokens=500,
+                             response_format={"type": "json_object"})
+
+def extract_themes_from_chunk(chunk_text: str) -> Optional[Dict]:
     """
-    extracted_content = ""
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    Uses the completion provider to extract a theme and sub-themes from a conversation chunk.
+    The response is parsed tolerantly and validated against the Theme fields; failed
+    attempts are retried up to THEME_EXTRACTION_MAX_RETRIES times.
+    Returns None if no valid theme could be extracted.
+    """
+    provider = get_completion_provider()
     prompt = f"""
     You are an AI that analyzes conversations and extracts a theme. Given the conversation below, identify the main theme and sub-themes, and provide a short summary.
     Please respond with valid JSON in the following format:
@@ -188,56 +281,93 @@ def extract_themes_from_chunk(chunk_text: str) -> Dict:
     \"\"\"{chunk_text}\"\"\"
     """
 
+    for attempt in range(THEME_EXTRACTION_MAX_RETRIES + 1):
+        if attempt:
+            EXTRACTION_EVENTS.inc(event="retries")
+        EXTRACTION_EVENTS.inc(event="requests")
+        extracted_content = ""
+        try:
+            extracted_content = _request_theme_completion(provider, prompt)
+        except ProviderError as e:
+            EXTRACTION_EVENTS.inc(event="api_errors")
+            logger.warning(f"Error extracting themes (attempt {attempt + 1}): {str(e)}")
+            continue
+
+        try:
+            data = parse_json_object(extracted_content)
+        except ValueError as e:
+            EXTRACTION_EVENTS.inc(event="parse_failures")
+            log_event(logger, "theme_parse_failure", level=logging.WARNING,
+                      attempt=attempt + 1, error=str(e), response=extracted_content[:500])
+            continue
+
+        try:
+            return validate_theme(data)
+        except ValueError as e:
+            EXTRACTION_EVENTS.inc(event="validation_failures")
+            log_event(logger, "theme_validation_failure", level=logging.WARNING,
+                      attempt=attempt + 1, error=str(e))
+
+    EXTRACTION_EVENTS.inc(event="gave_up")
+    return None
+
+def theme_embedding_text(theme: Theme) -> str:
+    return f"{theme.theme}: {theme.summary}"
+
+def embed_theme_summaries(themes: List[Theme]) -> None:
+    """
+    Set summary_embedding on each theme with a single embeddings call.
+    On provider errors the themes are left without embeddings (they are still indexed,
+    but won't appear in related-theme results).
+    """
+    themes = [theme for theme in themes if theme.summary_embedding is None]
+    if not themes:
+        return
     try:
-        response = client.chat.completions.create(
-            model=COMPLETION_MODEL,
-            messages=[
-                {"role": "system", "content": "You are an assistant that extracts structured themes from conversations."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=500,
-        )
-        extracted_content = response.choices[0].message.content
-        print("\nRaw OpenAI response:", extracted_content)
-
-        # Clean and parse the JSON
-        extracted_content = extracted_content.strip()
-        start = extracted_content.find("{")
-        end = extracted_content.rfind("}")
-        if start != -1 and end != -1:
-            extracted_content = extracted_content[start:end + 1]
-            return json.loads(extracted_content)
-        else:
-            raise ValueError("No valid JSON found in response")
-    except Exception as e:
-        print(f"Error extracting themes: {str(e)}")
-        print(f"Raw response was: {extracted_content}")
-        return {"theme": "", "subthemes": [], "summary": "", "nodeType": "informational"}
+        embeddings = get_embedding_provider().embed([theme_embedding_text(theme) for theme in themes],
+                                                    "theme_embeddings")
+    except ProviderError as e:
+        EXTRACTION_EVENTS.inc(len(themes), event="embedding_failures")
+        logger.warning(f"Error embedding {len(themes)} theme summaries: {str(e)}")
+        return
+    for theme, embedding in zip(themes, embeddings):
+        theme.summary_embedding = list(embedding)
+
+def get_extraction_stats() -> Dict[str, int]:
+    """Return a snapshot of the theme extraction counters."""
+    return {dict(key)["event"]: int(value) for key, value in EXTRACTION_EVENTS.values().items()}
 
 def process_conversation(conversation_text: str, conversation_title: str = "Untitled") -> List[Theme]:
     """
     Processes a conversation text by splitting it into chunks,
     extracting themes from each chunk, and combining the results.
+    PII is redacted first unless PII_FILTER_ENABLED is off.
     """
+    if PII_FILTER_ENABLED:
+        conversation_text = filter_pii(conversation_text)
+        conversation_title = filter_pii(conversation_title)
     chunks = chunk_conversation(conversation_text)
     all_themes = []
     for idx, chunk in enumerate(chunks):
-        print(f"\nProcessing chunk {idx+1}/{len(chunks)}...")
-        themes_data = extract_themes_from_chunk(chunk.text)
+        chunk_text = chunk.text
+        with timed("theme_extraction"):
+            themes_data = extract_themes_from_chunk(chunk_text)
+        if themes_data is None:
+            log_event(logger, "chunk_skipped", sample_rate=1.0, level=logging.WARNING,
+                      conversation_title=conversation_title, chunk=idx + 1, chunks=len(chunks))
+            continue
         theme_obj = Theme(
             theme=themes_data.get("theme", ""),
             subthemes=themes_data.get("subthemes", []),
             summary=themes_data.get("summary", ""),
             nodeType=themes_data.get("nodeType", "informational"),
-            text_data=chunk.text,
+            text_data=chunk_text,
             conversation_title=conversation_title
         )
         chunk.themes = [theme_obj]
-        print("\nExtracted Theme for this chunk:")
-        print(json.dumps([vars(t) for t in chunk.themes], indent=2))
         all_themes.append(theme_obj)
-        print("All themes so far:", all_themes)
+        log_event(logger, "theme_extracted", conversation_title=conversation_title,
+                  chunk=idx + 1, chunks=len(chunks), theme=theme_obj.theme)
     return all_themes
 
 # --- Entry Points for API Integration ---
@@ -259,19 +389,18 @@ def run_theme_extraction(conversation_text: str) -> List[Theme]:
 
 # --- Main Function for Testing Purposes ---
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     try:
+        # Imported here: the pipeline imports this module by name, so stats must be
+        # read from that module rather than from __main__
+        from app.services.ingest_pipeline import run_ingest
+        from app.services import parse_chatgpt_conversation as conversation_parser
+
         # Get the absolute path to the project root
         project_root = Path(__file__).resolve().parents[3]
         file_path = project_root / "userdata" / "conversations.json"
-        parsed_convos = run_conversation_parsing(file_path)
-        # Process all conversations
-        print(f"\nFound {len(parsed_convos)} conversations to analyze")
-        for convo in parsed_convos:
-            print(f"\n\nAnalyzing conversation: {convo['title']}\n")
-            print("=" * 50)
-            full_text = "\n".join(msg["content"] for msg in convo["messages"])
-            data_obj = process_conversation(full_text, conversation_title=convo['title'])
-            opensearch_service.insert_data_into_opensearch(data_obj)
-            print("=" * 50)
+        stats = run_ingest(str(file_path))
+        print(json.dumps(stats, indent=2))
+        print("Theme extraction stats:", conversation_parser.get_extraction_stats())
     except Exception as e:
         print("Conversation parsing test failed:", e)
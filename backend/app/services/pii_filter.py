@@ -1,5 +1,171 @@
+import heapq
+import os
+import re
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from core.metrics import counter
+
+PII_FILTER_ENABLED = os.getenv("PII_FILTER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+PII_REDACTIONS = counter("pii_redactions_total", "PII matches redacted, by type")
+
+# Order matters: earlier alternatives win when several could match at the same position
+# (API keys before card numbers, card numbers and SSNs before phone numbers).
+PII_PATTERNS: Dict[str, str] = {
+    "EMAIL": r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}",
+    "API_KEY": (
+        r"\b(?:sk-(?:proj-)?[A-Za-z0-9_-]{20,}"
+        r"|AKIA[0-9A-Z]{16}"
+        r"|gh[pousr]_[A-Za-z0-9]{36,}"
+        r"|xox[abpr]-[A-Za-z0-9-]{10,}"
+        r"|AIza[0-9A-Za-z_-]{35})"
+    ),
+    "CARD": r"\b(?:\d[ -]?){12,18}\d\b",
+    "SSN": r"\b\d{3}-\d{2}-\d{4}\b",
+    # Separated numbers, or 10 unseparated digits shaped like a NANP number (area code and
+    # exchange not starting with 0 or 1, which also leaves Unix timestamps alone)
+    "PHONE": (
+        r"(?<![\w+])(?:(?:\+\d{1,3}[ .-]?)?(?:\(\d{2,4}\)[ .-]?|\d{2,4}[ .-])\d{3,4}[ .-]?\d{3,4}"
+        r"|(?:\+\d{1,3})?[2-9]\d{2}[2-9]\d{6})\b"
+    ),
+    "IP_ADDRESS": r"\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b",
+    "ADDRESS": (
+        r"\b\d{1,6}[ \t]+(?:[A-Z][a-z]+[ \t]+){1,4}"
+        r"(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Lane|Ln|Drive|Dr|Court|Ct|Way|Place|Pl|Terrace)\b"
+    ),
+}
+
+# Every match of the patterns above contains an '@', a digit, '_' or '-', or one of the
+# literal key prefixes, so only text around these needs to be run through the full pattern.
+# The trigger is a single character class so the regex engine can scan for it quickly;
+# the literal prefixes are found with str.find.
+PII_TRIGGER = r"[@\d_-]"
+PII_TRIGGER_LITERALS = ("AKIA", "AIza")
+
+
+def luhn_valid(number: str) -> bool:
+    """Luhn checksum over the digits of `number`."""
+    digits = [int(c) for c in number if c.isdigit()]
+    if len(digits) < 13:
+        return False
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+class PIIFilter:
+    """
+    Redacts PII with a single compiled regex: every pattern is a named group in one
+    alternation. Python's regex engine tries the whole alternation at every position,
+    so a cheap trigger regex first finds the characters any match must contain and the
+    full pattern only runs over windows around them. A window starts at the whitespace
+    before its trigger, however far back (no pattern but card numbers, phone numbers and
+    addresses crosses whitespace, and those start with a trigger), and ends at
+    whitespace, so word boundaries and lookbehinds see the same context as on the whole
+    text.
+    Card matches are only redacted if they pass the Luhn check (when validate_cards is set).
+    """
+
+    # How far past a trigger character a match may extend
+    WINDOW_AFTER = 64
+
+    def __init__(self, patterns: Optional[Dict[str, str]] = None, validate_cards: bool = True,
+                 trigger: str = PII_TRIGGER, trigger_literals: Tuple[str, ...] = PII_TRIGGER_LITERALS):
+        self.patterns = dict(patterns or PII_PATTERNS)
+        self.validate_cards = validate_cards
+        self.regex = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in self.patterns.items()))
+        self.trigger = re.compile(trigger)
+        self.trigger_literals = trigger_literals
+        self._whitespace = re.compile(r"\s")
+
+    def _replace(self, match: re.Match) -> str:
+        kind = match.lastgroup
+        if kind == "CARD" and self.validate_cards and not luhn_valid(match.group()):
+            return match.group()
+        PII_REDACTIONS.inc(type=kind)
+        return f"[{kind}]"
+
+    def _window_end(self, text: str, pos: int) -> int:
+        match = self._whitespace.search(text, min(pos + self.WINDOW_AFTER, len(text)))
+        return match.start() if match else len(text)
+
+    def _trigger_positions(self, text: str) -> Iterator[int]:
+        def literal_positions(literal: str) -> Iterator[int]:
+            pos = text.find(literal)
+            while pos != -1:
+                yield pos
+                pos = text.find(literal, pos + 1)
+
+        positions = [(m.start() for m in self.trigger.finditer(text))]
+        positions.extend(literal_positions(literal) for literal in self.trigger_literals if literal in text)
+        return heapq.merge(*positions) if len(positions) > 1 else positions[0]
+
+    def _windows(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yield sorted, non-overlapping (start, end) spans around trigger characters."""
+        start = end = -1
+        for pos in self._trigger_positions(text):
+            if pos < end:
+                end = max(end, self._window_end(text, pos))
+                continue
+            if end >= 0:
+                yield start, end
+            # Windows are disjoint, so the backward scans cover the text at most once
+            lower = max(0, end)
+            boundary = max(text.rfind(" ", lower, pos), text.rfind("\n", lower, pos), text.rfind("\t", lower, pos))
+            start = boundary + 1 if boundary != -1 else lower
+            end = self._window_end(text, pos)
+        if end >= 0:
+            yield start, end
+
+    def redact(self, text: str) -> str:
+        """Return `text` with every PII match replaced by its `[TYPE]` placeholder."""
+        if not text:
+            return text
+        pieces = []
+        last = 0
+        for start, end in self._windows(text):
+            for match in self.regex.finditer(text, start, end):
+                pieces.append(text[last:match.start()])
+                pieces.append(self._replace(match))
+                last = match.end()
+        if not pieces:
+            return text
+        pieces.append(text[last:])
+        return "".join(pieces)
+
+    def redact_stream(self, chunks: Iterable[str], max_buffer: int = 1 << 20) -> Iterator[str]:
+        """
+        Redact text arriving in arbitrary chunks in one pass. Text is released up to the
+        last newline in the buffer (patterns never span lines), so matches are not split
+        across chunk boundaries; a line longer than max_buffer is cut at whitespace.
+        """
+        buffer = ""
+        for chunk in chunks:
+            buffer += chunk
+            cut = buffer.rfind("\n") + 1
+            if not cut and len(buffer) > max_buffer:
+                cut = max(buffer.rfind(" "), buffer.rfind("\t")) + 1
+            if cut:
+                yield self.redact(buffer[:cut])
+                buffer = buffer[cut:]
+        if buffer:
+            yield self.redact(buffer)
+
+
+_default_filter = PIIFilter()
+
+
 def filter_pii(text: str) -> str:
     """
     Remove personally identifiable information from text
     """
-    pass 
\ No newline at end of file
+    return _default_filter.redact(text)
+
+
+def redaction_counts() -> Dict[str, int]:
+    """Number of redactions made so far, by PII type."""
+    return {dict(key)["type"]: int(value) for key, value in PII_REDACTIONS.values().items()}
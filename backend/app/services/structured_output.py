@@ -0,0 +1,166 @@
+import json
+from typing import Dict, List
+
+# JSON schema sent with `response_format` so the API constrains the output
+# to a single Theme object.
+THEME_JSON_SCHEMA = {
+    "name": "theme",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "theme": {"type": "string"},
+            "subthemes": {"type": "array", "items": {"type": "string"}},
+            "summary": {"type": "string"},
+            "nodeType": {"type": "string", "enum": ["informational", "personal"]}
+        },
+        "required": ["theme", "subthemes", "summary", "nodeType"],
+        "additionalProperties": False
+    }
+}
+
+NODE_TYPES = ("informational", "personal")
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _strip_code_fences(text: str) -> str:
+    """Remove a surrounding ```json ... ``` fence if present."""
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        fence = text.rfind("```")
+        if fence != -1:
+            text = text[:fence]
+    return text.strip()
+
+
+def _repair_json(text: str) -> str:
+    """
+    Repair common defects in a JSON object in a single pass: trailing commas,
+    and output truncated mid-string or mid-object (closes open strings and brackets).
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]":
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                break
+            continue
+        out.append(ch)
+
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+
+    # Drop a dangling comma or an unfinished key/value separator
+    while out and (out[-1].isspace() or out[-1] in ",:"):
+        if out[-1] == ":":
+            out.append(" null")
+            break
+        out.pop()
+
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def parse_json_object(text: str) -> Dict:
+    """
+    Extract the first JSON object from a model response.
+    Tries strict decoding and then repair from the first '{', so a truncated object
+    is completed rather than replaced by one nested in it; then strict decoding at
+    each later '{' (for prose before the JSON). Raises ValueError if no object can
+    be recovered.
+    """
+    if not text:
+        raise ValueError("Empty response")
+
+    text = _strip_code_fences(text.strip())
+    decoder = json.JSONDecoder()
+
+    first = text.find("{")
+    if first == -1:
+        raise ValueError("No JSON object found in response")
+
+    try:
+        obj, _ = decoder.raw_decode(text, first)
+        if isinstance(obj, dict):
+            return obj
+    except json.JSONDecodeError:
+        pass
+
+    try:
+        obj = json.loads(_repair_json(text[first:]))
+        if isinstance(obj, dict):
+            return obj
+        error = "Response JSON is not an object"
+    except json.JSONDecodeError as e:
+        error = f"Could not repair JSON in response: {e}"
+
+    idx = text.find("{", first + 1)
+    while idx != -1:
+        try:
+            obj, _ = decoder.raw_decode(text, idx)
+            if isinstance(obj, dict):
+                return obj
+        except json.JSONDecodeError:
+            pass
+        idx = text.find("{", idx + 1)
+    raise ValueError(error)
+
+
+def validate_theme(data: Dict) -> Dict:
+    """
+    Validate a parsed response against the Theme model fields.
+    Returns a normalized dict, raises ValueError if required fields are missing or empty.
+    """
+    theme = data.get("theme")
+    if not isinstance(theme, str) or not theme.strip():
+        raise ValueError("Missing or empty 'theme'")
+
+    summary = data.get("summary")
+    if not isinstance(summary, str) or not summary.strip():
+        raise ValueError("Missing or empty 'summary'")
+
+    subthemes = data.get("subthemes", [])
+    if isinstance(subthemes, str):
+        subthemes = [subthemes]
+    if not isinstance(subthemes, list):
+        raise ValueError("'subthemes' must be a list of strings")
+    subthemes = [str(s).strip() for s in subthemes if s is not None and str(s).strip()]
+
+    node_type = data.get("nodeType") or "informational"
+    if node_type not in NODE_TYPES:
+        node_type = "informational"
+
+    return {
+        "theme": theme.strip(),
+        "subthemes": subthemes,
+        "summary": summary.strip(),
+        "nodeType": node_type
+    }
@@ -0,0 +1,237 @@
+import hashlib
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from core.metrics import opensearch_call
+from core.tenancy import TENANT_MARKER, ensure_index
+from .models import Theme
+from .theme_suggestions import normalize
+
+if TYPE_CHECKING:
+    from opensearchpy import OpenSearch
+
+logger = logging.getLogger(__name__)
+
+# Theme frequency per calendar week (starting Monday, as in OpenSearch) and month, by
+# the source conversation's create time. Counts are kept in a rollup index next to each
+# themes index, with one document per (interval, bucket, theme) updated as themes are
+# inserted, so timelines read a few thousand small documents instead of aggregating
+# every theme ever extracted.
+
+INTERVALS = ("week", "month")
+
+ROLLUP_MAPPING = {
+    "mappings": {
+        "properties": {
+            "interval": {"type": "keyword"},
+            "bucket": {"type": "date", "format": "strict_date"},
+            "theme_key": {"type": "keyword"},
+            "theme": {"type": "keyword"},
+            "count": {"type": "long"}
+        }
+    }
+}
+
+_INCREMENT = "ctx._source.count += params.count"
+
+
+def rollup_index(themes_index: str) -> str:
+    """Rollup index for a themes index ("themes" -> "themes-rollups", tenants keep their suffix)."""
+    base, marker, key = themes_index.partition(TENANT_MARKER)
+    return f"{base}-rollups{marker}{key}"
+
+
+def bucket_start(timestamp: str, interval: str) -> str:
+    """First day (YYYY-MM-DD) of the week or month containing an ISO timestamp."""
+    day = datetime.fromisoformat(timestamp).date()
+    if interval == "week":
+        day -= timedelta(days=day.weekday())
+    elif interval == "month":
+        day = day.replace(day=1)
+    else:
+        raise ValueError(f"Unknown interval {interval!r}, expected one of {INTERVALS}")
+    return day.isoformat()
+
+
+def theme_time(theme: Theme) -> str:
+    """A theme's timestamp: its conversation's create time, or now if the export had none."""
+    return theme.conversation_created_at or datetime.utcnow().isoformat()
+
+
+def rollup_counts(entries: Iterable[Tuple[str, Optional[str]]]) -> Tuple[Counter, Dict[str, str]]:
+    """
+    Count (theme name, ISO timestamp) pairs per (interval, bucket, theme key).
+    Returns the counts and a display name for each theme key; entries without a
+    timestamp are skipped.
+    """
+    counts: Counter = Counter()
+    names: Dict[str, str] = {}
+    for name, timestamp in entries:
+        key = normalize(name or "")
+        if not key or not timestamp:
+            continue
+        names.setdefault(key, name)
+        for interval in INTERVALS:
+            counts[(interval, bucket_start(timestamp, interval), key)] += 1
+    return counts, names
+
+
+def _rollup_id(interval: str, bucket: str, key: str) -> str:
+    return f"{interval}|{bucket}|{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+
+
+class ThemeRollups:
+    """Maintains and queries the rollup index of a themes index."""
+
+    def __init__(self, client: "OpenSearch"):
+        self.client = client
+
+    def ensure_index(self, themes_index: str) -> str:
+        index_name = rollup_index(themes_index)
+        ensure_index(self.client, index_name, ROLLUP_MAPPING)
+        return index_name
+
+    def record(self, themes_index: str, themes: List[Theme]) -> int:
+        """
+        Add newly inserted themes to the rollups with scripted upserts (one bulk request).
+        Callers must only pass themes that weren't counted before. Returns the number
+        of rollup documents that failed to update.
+        """
+        counts, names = rollup_counts((theme.theme, theme_time(theme)) for theme in themes)
+        if not counts:
+            return 0
+        index_name = self.ensure_index(themes_index)
+        actions = [
+            {
+                "_op_type": "update",
+                "_index": index_name,
+                "_id": _rollup_id(interval, bucket, key),
+                "script": {"source": _INCREMENT, "lang": "painless", "params": {"count": count}},
+                "upsert": {"interval": interval, "bucket": bucket, "theme_key": key,
+                           "theme": names[key], "count": count},
+                "retry_on_conflict": 5
+            }
+            for (interval, bucket, key), count in counts.items()
+        ]
+        from opensearchpy import helpers
+        with opensearch_call("bulk"):
+            _, failed = helpers.bulk(self.client, actions, stats_only=True, raise_on_error=False)
+        if failed:
+            logger.error(f"{failed} theme rollups failed to update in {index_name}; run rebuild() to repair")
+        return failed
+
+    def rebuild(self, themes_index: str) -> int:
+        """
+        Recompute the rollups from every theme in `themes_index` (backfill or repair).
+        The rollups are written to a new index that then replaces the old one behind
+        the rollup alias in one atomic alias update, so timelines never see an empty
+        or partial index. Themes inserted while the rebuild runs may be missed; run it
+        again to include them. Returns the number of rollup documents written.
+        """
+        from opensearchpy import helpers
+        with opensearch_call("scan"):
+            entries = [
+                (hit["_source"].get("theme"), hit["_source"].get("timestamp"))
+                for hit in helpers.scan(self.client, index=themes_index, _source=["theme", "timestamp"],
+                                        query={"query": {"match_all": {}}}, size=1000)
+            ]
+        counts, names = rollup_counts(entries)
+        index_name = rollup_index(themes_index)
+        target = f"{index_name}-{datetime.utcnow():%Y%m%d%H%M%S%f}"
+        with opensearch_call("create_index"):
+            self.client.indices.create(index=target, body=ROLLUP_MAPPING)
+        actions = (
+            {
+                "_op_type": "index",
+                "_index": target,
+                "_id": _rollup_id(interval, bucket, key),
+                "_source": {"interval": interval, "bucket": bucket, "theme_key": key,
+                            "theme": names[key], "count": count}
+            }
+            for (interval, bucket, key), count in counts.items()
+        )
+        try:
+            with opensearch_call("bulk"):
+                success, _ = helpers.bulk(self.client, actions, stats_only=True, refresh=True)
+        except Exception:
+            with opensearch_call("delete_index"):
+                self.client.indices.delete(index=target, ignore_unavailable=True)
+            raise
+        self._swap(index_name, target)
+        logger.info(f"Rebuilt {index_name} from {len(entries)} themes ({success} rollups in {target})")
+        return success
+
+    def _swap(self, index_name: str, target: str) -> None:
+        """Point `index_name` at `target`, deleting the indexes it replaces (an alias's, or a plain index)."""
+        alias_actions: List[Dict] = [{"add": {"index": target, "alias": index_name}}]
+        if self.client.indices.exists_alias(name=index_name):
+            with opensearch_call("get_alias"):
+                old = list(self.client.indices.get_alias(name=index_name))
+            alias_actions.extend({"remove_index": {"index": old_index}} for old_index in old)
+        elif self.client.indices.exists(index=index_name):
+            # A rollup index created before rebuilds used aliases
+            alias_actions.append({"remove_index": {"index": index_name}})
+        with opensearch_call("update_aliases"):
+            self.client.indices.update_aliases(body={"actions": alias_actions})
+
+    def timeline(self, themes_index: str, interval: str = "month", start: Optional[str] = None,
+                 end: Optional[str] = None, top: int = 10, theme: Optional[str] = None) -> Dict:
+        """
+        Theme counts per bucket between `start` and `end` (inclusive dates): the total
+        over all themes, and the series of the `top` most frequent themes in the range
+        (or of `theme` only).
+        """
+        if interval not in INTERVALS:
+            raise ValueError(f"Unknown interval {interval!r}, expected one of {INTERVALS}")
+        filters: List[Dict] = [{"term": {"interval": interval}}]
+        if start or end:
+            bounds = {}
+            if start:
+                bounds["gte"] = bucket_start(start, interval)
+            if end:
+                bounds["lte"] = datetime.fromisoformat(end).date().isoformat()
+            filters.append({"range": {"bucket": bounds}})
+        if theme:
+            filters.append({"term": {"theme_key": normalize(theme)}})
+        histogram = {"date_histogram": {"field": "bucket", "calendar_interval": interval, "format": "yyyy-MM-dd"},
+                     "aggs": {"count": {"sum": {"field": "count"}}}}
+        body = {
+            "size": 0,
+            "query": {"bool": {"filter": filters}},
+            "aggs": {
+                "total": histogram,
+                "themes": {
+                    "terms": {"field": "theme_key", "size": top, "order": {"count": "desc"}},
+                    "aggs": {
+                        "count": {"sum": {"field": "count"}},
+                        "name": {"terms": {"field": "theme", "size": 1}},
+                        "buckets": histogram
+                    }
+                }
+            }
+        }
+        index_name = rollup_index(themes_index)
+        if not self.client.indices.exists(index=index_name):
+            return {"interval": interval, "total": [], "themes": []}
+        with opensearch_call("search"):
+            response = self.client.search(index=index_name, body=body, request_cache=True)
+        aggs = response["aggregations"]
+
+        def series(buckets: List[Dict]) -> List[Dict]:
+            return [{"bucket": b["key_as_string"], "count": int(b["count"]["value"])}
+                    for b in buckets if b["doc_count"]]
+
+        return {
+            "interval": interval,
+            "total": series(aggs["total"]["buckets"]),
+            "themes": [
+                {
+                    "theme": (b["name"]["buckets"] or [{"key": b["key"]}])[0]["key"],
+                    "count": int(b["count"]["value"]),
+                    "buckets": series(b["buckets"]["buckets"])
+                }
+                for b in aggs["themes"]["buckets"]
+            ]
+        }
@@ -0,0 +1,261 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from functools import lru_cache
+from heapq import nlargest
+from typing import TYPE_CHECKING, Dict, Iterable, List
+
+from config.settings import THEME_SUGGEST_RELOAD_SECONDS
+from core.metrics import histogram, opensearch_call
+
+if TYPE_CHECKING:
+    from opensearchpy import OpenSearch
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LATENCY = histogram("theme_suggest_seconds", "Theme suggestion latency by source",
+                            buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+
+# Separates the searchable key from the canonical term in PrefixIndex entries
+_SEP = "\x00"
+
+
+def normalize(term: str) -> str:
+    return " ".join(term.lower().split())
+
+
+def suggest_inputs(theme: str, subthemes: Iterable[str]) -> List[str]:
+    """Distinct non-empty terms a theme can be suggested under (its name and subthemes)."""
+    inputs: List[str] = []
+    seen = set()
+    for term in [theme, *(subthemes or [])]:
+        term = " ".join((term or "").split())
+        if term and normalize(term) not in seen:
+            seen.add(normalize(term))
+            inputs.append(term)
+    return inputs
+
+
+class PrefixIndex:
+    """
+    Sorted array of theme/subtheme terms for typeahead. Every term is stored under
+    each of its word starts ("machine learning" is found by "mach" and "lear"), so a
+    prefix lookup is two binary searches plus a scan of the matching range.
+    Suggestions are ranked by how many themes use the term. Ranking a large range
+    (one or two letter prefixes) takes a while, so those results are memoized until
+    the next add.
+    """
+
+    # Matching ranges at least this long have their ranked suggestions memoized
+    MEMO_MIN_RANGE = 2000
+
+    def __init__(self):
+        self._entries: List[str] = []
+        self._counts: Dict[str, int] = {}
+        self._display: Dict[str, str] = {}
+        self._memo: Dict[tuple, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    @staticmethod
+    def _keys(key: str) -> List[str]:
+        words = key.split(" ")
+        return [f"{' '.join(words[i:])}{_SEP}{key}" for i in range(len(words))]
+
+    def add(self, terms: Iterable[str]) -> None:
+        """Add terms incrementally (one insort per new term and word start)."""
+        with self._lock:
+            self._memo.clear()
+            for term in terms:
+                key = normalize(term)
+                if not key:
+                    continue
+                if key in self._counts:
+                    self._counts[key] += 1
+                    continue
+                self._counts[key] = 1
+                self._display[key] = term
+                for entry in self._keys(key):
+                    insort(self._entries, entry)
+
+    @classmethod
+    def build(cls, terms: Iterable[str]) -> "PrefixIndex":
+        """Build an index from many terms with a single sort."""
+        index = cls()
+        for term in terms:
+            key = normalize(term)
+            if not key:
+                continue
+            index._counts[key] = index._counts.get(key, 0) + 1
+            index._display.setdefault(key, term)
+        index._entries = sorted(entry for key in index._counts for entry in cls._keys(key))
+        return index
+
+    def suggest(self, prefix: str, size: int = 5) -> List[str]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            memoized = self._memo.get((prefix, size))
+            if memoized is not None:
+                return memoized
+            start = bisect_left(self._entries, prefix)
+            end = bisect_left(self._entries, prefix + "\uffff", lo=start)
+            matches = {entry.split(_SEP, 1)[1] for entry in self._entries[start:end]}
+            best = nlargest(size, matches, key=lambda key: (self._counts[key], -len(key)))
+            suggestions = [self._display[key] for key in best]
+            if end - start >= self.MEMO_MIN_RANGE:
+                self._memo[(prefix, size)] = suggestions
+            return suggestions
+
+
+class ThemeSuggester:
+    """
+    In-process prefix indexes, one per themes index (tenants have their own).
+    An index is loaded from OpenSearch on first use and then kept current by
+    OpenSearchService, which records themes as they are inserted. Themes written by
+    other processes are picked up when the index is reloaded, every
+    THEME_SUGGEST_RELOAD_SECONDS, in a background thread while the loaded index keeps
+    serving. Only one load per index runs at a time; requests arriving during a first
+    load wait for it.
+    """
+
+    def __init__(self, reload_seconds: float = THEME_SUGGEST_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._indexes: Dict[str, PrefixIndex] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._pending: Dict[str, List[str]] = {}
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def record(self, index_name: str, terms: Iterable[str]) -> None:
+        """Add newly inserted terms to the loaded index (and queue them for a load in progress)."""
+        terms = list(terms)
+        with self._lock:
+            if index_name in self._pending:
+                self._pending[index_name].extend(terms)
+            index = self._indexes.get(index_name)
+        if index is not None:
+            index.add(terms)
+
+    def ready(self, index_name: str) -> bool:
+        """True if suggestions for `index_name` can be served without loading it first."""
+        with self._lock:
+            return index_name in self._indexes
+
+    def _load(self, client: "OpenSearch", index_name: str) -> PrefixIndex:
+        from opensearchpy import helpers
+        with self._lock:
+            self._pending.setdefault(index_name, [])
+        terms: List[str] = []
+        try:
+            if client.indices.exists(index=index_name):
+                with opensearch_call("scan"):
+                    for hit in helpers.scan(client, index=index_name, _source=["theme", "subthemes"],
+                                            query={"query": {"match_all": {}}}, size=1000):
+                        source = hit.get("_source", {})
+                        terms.extend(suggest_inputs(source.get("theme", ""), source.get("subthemes", [])))
+            index = PrefixIndex.build(terms)
+        except Exception:
+            with self._lock:
+                self._pending.pop(index_name, None)
+            raise
+        with self._lock:
+            # Themes inserted during the scan may be counted twice; counts only rank suggestions
+            index.add(self._pending.pop(index_name, []))
+            self._indexes[index_name] = index
+            self._loaded_at[index_name] = time.monotonic()
+        logger.info(f"Loaded {len(index)} suggestion terms from {index_name}")
+        return index
+
+    def _run_load(self, client: "OpenSearch", index_name: str, loading: threading.Event) -> None:
+        try:
+            self._load(client, index_name)
+        finally:
+            with self._lock:
+                self._loading.pop(index_name, None)
+            loading.set()
+
+    def _reload_in_background(self, client: "OpenSearch", index_name: str, loading: threading.Event) -> None:
+        try:
+            self._run_load(client, index_name, loading)
+        except Exception:
+            logger.exception(f"Reloading suggestions from {index_name} failed, serving the loaded terms")
+            with self._lock:
+                # Retry after another reload interval rather than on every request
+                self._loaded_at[index_name] = time.monotonic()
+
+    def index(self, client: "OpenSearch", index_name: str) -> PrefixIndex:
+        with self._lock:
+            index = self._indexes.get(index_name)
+            stale = time.monotonic() - self._loaded_at.get(index_name, 0.0) >= self.reload_seconds
+            loading = self._loading.get(index_name)
+            start = loading is None and (index is None or stale)
+            if start:
+                loading = self._loading[index_name] = threading.Event()
+        if index is not None:
+            if start:
+                threading.Thread(target=self._reload_in_background, args=(client, index_name, loading),
+                                 name=f"suggest-reload-{index_name}", daemon=True).start()
+            return index
+        if start:
+            self._run_load(client, index_name, loading)
+        else:
+            loading.wait()
+        with self._lock:
+            index = self._indexes.get(index_name)
+        if index is None:
+            raise RuntimeError(f"Loading suggestions from {index_name} failed")
+        return index
+
+    def suggest(self, client: "OpenSearch", index_name: str, prefix: str, size: int = 5) -> List[str]:
+        start = time.perf_counter()
+        suggestions = self.index(client, index_name).suggest(prefix, size)
+        SUGGEST_LATENCY.observe(time.perf_counter() - start, source="local")
+        return suggestions
+
+
+def opensearch_suggestions(client: "OpenSearch", index_name: str, prefix: str, size: int = 5) -> List[str]:
+    """Suggestions from the themes index's `suggest` completion field."""
+    start = time.perf_counter()
+    body = {
+        "_source": False,
+        "suggest": {
+            "theme-suggest": {
+                "prefix": prefix,
+                "completion": {"field": "suggest", "size": size, "skip_duplicates": True}
+            }
+        }
+    }
+    with opensearch_call("suggest"):
+        results = client.search(index=index_name, body=body)
+    options = results.get("suggest", {}).get("theme-suggest", [{}])[0].get("options", [])
+    SUGGEST_LATENCY.observe(time.perf_counter() - start, source="opensearch")
+    return [option["text"] for option in options]
+
+
+@lru_cache(maxsize=1024)
+def _chatgpt_suggestions(prefix: str, size: int) -> tuple:
+    from app.services.parse_chatgpt_conversation import get_completion_provider
+    from app.services.structured_output import parse_json_object
+    prompt = (f"Suggest up to {size} short topic names (1-4 words) that complete or closely relate to "
+              f"the partial topic \"{prefix}\". "
+              "Respond with JSON in the format {\"suggestions\": [\"Topic 1\", \"Topic 2\"]}.")
+    content = get_completion_provider().prompt(prompt, "theme_suggestions", temperature=0, max_tokens=100,
+                                               response_format={"type": "json_object"})
+    suggestions = parse_json_object(content).get("suggestions", [])
+    return tuple(str(s) for s in suggestions if s)[:size]
+
+
+def chatgpt_suggestions(prefix: str, size: int = 5) -> List[str]:
+    """Model-generated completions for prefixes with no indexed themes; cached per prefix."""
+    start = time.perf_counter()
+    suggestions = list(_chatgpt_suggestions(normalize(prefix), size))
+    SUGGEST_LATENCY.observe(time.perf_counter() - start, source="chatgpt")
+    return suggestions
+
+
+theme_suggester = ThemeSuggester()
@@ -19,13 +19,71 @@ INDEX_NAME = os.getenv('OPENSEARCH_INDEX', 'papers-index')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
 COMPLETION_MODEL = os.getenv('COMPLETION_MODEL', 'gpt-4o-mini')
+# OpenAI-compatible server (vLLM, llama.cpp, Ollama, ...) to use instead of api.openai.com
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# Model providers (core.providers): "openai", "sentence-transformers" (local, embeddings
+# only; set EMBEDDING_MODEL and VECTOR_DIMENSION to match, e.g. all-MiniLM-L6-v2 / 384)
+# or "fake" (deterministic, offline)
+EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', 'openai')
+COMPLETION_PROVIDER = os.getenv('COMPLETION_PROVIDER', 'openai')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '256'))
+EMBEDDING_DEVICE = os.getenv('EMBEDDING_DEVICE', 'cpu')
 
 # Vector settings
-VECTOR_DIMENSION = 1536
+VECTOR_DIMENSION = int(os.getenv('VECTOR_DIMENSION', '1536'))
 MAX_CHUNKS_PER_QUERY = int(os.getenv('MAX_CHUNKS_PER_QUERY', '5'))
 
 # PDF Loader Configuration
 PDF_LOADER_TYPE = os.getenv('PDF_LOADER_TYPE', 'docling')  # Default to fitz loader 
+# Layout-aware chunking (PDF_LOADER_TYPE=layout, core.pdf_layout): table and figure
+# extraction runs in this many processes, over batches of this many pages
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '8'))
+
+# Upload / ingest job settings
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', '/tmp/chat-analysis-uploads')
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+INGEST_JOB_WORKERS = int(os.getenv('INGEST_JOB_WORKERS', '2'))
+# Finished jobs are forgotten after INGEST_JOB_TTL seconds, or sooner beyond INGEST_JOB_MAX_FINISHED
+INGEST_JOB_TTL = float(os.getenv('INGEST_JOB_TTL', '86400'))
+INGEST_JOB_MAX_FINISHED = int(os.getenv('INGEST_JOB_MAX_FINISHED', '1000'))
+
+# Retrieval cache (QAService): entries are keyed by query embedding and search
+# parameters, and dropped when the index version changes
+RETRIEVAL_CACHE_SIZE = int(os.getenv('RETRIEVAL_CACHE_SIZE', '1024'))
+RETRIEVAL_CACHE_TTL = float(os.getenv('RETRIEVAL_CACHE_TTL', '300'))
+# How long the index version read from OpenSearch is trusted before re-checking
+RETRIEVAL_CACHE_VERSION_TTL = float(os.getenv('RETRIEVAL_CACHE_VERSION_TTL', '5'))
+
+# QA context assembly: token budget for retrieved context in the answer prompt,
+# MMR relevance/diversity trade-off, and similarity above which chunks are duplicates
+QA_CONTEXT_TOKEN_BUDGET = int(os.getenv('QA_CONTEXT_TOKEN_BUDGET', '3000'))
+QA_MMR_LAMBDA = float(os.getenv('QA_MMR_LAMBDA', '0.7'))
+QA_DEDUPE_SIMILARITY = float(os.getenv('QA_DEDUPE_SIMILARITY', '0.95'))
+
+# Batch question answering (QAService.answer_questions / core.batch_qa)
+QA_BATCH_CONCURRENCY = int(os.getenv('QA_BATCH_CONCURRENCY', '8'))
+QA_BATCH_EMBED_SIZE = int(os.getenv('QA_BATCH_EMBED_SIZE', '256'))
+QA_BATCH_SEARCH_SIZE = int(os.getenv('QA_BATCH_SEARCH_SIZE', '50'))
+
+# Document deletion / replacement in the papers index (IndexingService): delete_by_query
+# runs as a sliced background task, throttled to leave capacity for search
+INDEX_DELETE_SLICES = os.getenv('INDEX_DELETE_SLICES', 'auto')
+INDEX_DELETE_REQUESTS_PER_SECOND = float(os.getenv('INDEX_DELETE_REQUESTS_PER_SECOND', '1000'))
+INDEX_TASK_POLL_INTERVAL = float(os.getenv('INDEX_TASK_POLL_INTERVAL', '1.0'))
+
+# Bulk indexing of chunks (IndexingService.index_chunks): items rejected with 429 are
+# retried with exponential backoff, and actions that still fail are appended to a
+# dead-letter file per index in INDEX_DEAD_LETTER_DIR for replay
+INDEX_BULK_MAX_RETRIES = int(os.getenv('INDEX_BULK_MAX_RETRIES', '5'))
+INDEX_BULK_INITIAL_BACKOFF = float(os.getenv('INDEX_BULK_INITIAL_BACKOFF', '1.0'))
+INDEX_BULK_MAX_BACKOFF = float(os.getenv('INDEX_BULK_MAX_BACKOFF', '60'))
+INDEX_DEAD_LETTER_DIR = os.getenv('INDEX_DEAD_LETTER_DIR', '/tmp/chat-analysis-dead-letters')
+
+# Theme suggestions: the in-process prefix index is reloaded from OpenSearch this
+# often to pick up themes inserted by other processes
+THEME_SUGGEST_RELOAD_SECONDS = float(os.getenv('THEME_SUGGEST_RELOAD_SECONDS', '600'))
 
 # Define private settings that shouldn't be displayed
 PRIVATE_SETTINGS = {
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import random
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+
+def _vector(text: str, dimension: int) -> List[float]:
+    seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dimension)]
+
+
+class _Embeddings:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+
+    def create(self, model: str, input, **kwargs):
+        self._owner._wait()
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [SimpleNamespace(index=i, embedding=_vector(t, self._owner.dimension)) for i, t in enumerate(texts)]
+        tokens = sum(len(t) // 4 + 1 for t in texts)
+        return SimpleNamespace(data=data, model=model,
+                               usage=SimpleNamespace(prompt_tokens=tokens, completion_tokens=0, total_tokens=tokens))
+
+
+class _Completions:
+    def __init__(self, owner: "FakeOpenAI"):
+        self._owner = owner
+
+    def create(self, model: str, messages: List[Dict], **kwargs):
+        self._owner._wait()
+        prompt = messages[-1]["content"]
+        words = [w.strip('.,"') for w in prompt.split()[-40:] if len(w) > 3]
+        theme = " ".join(words[:3]).title() or "General"
+        content = json.dumps({
+            "theme": theme,
+            "subthemes": words[3:6],
+            "summary": " ".join(words[:25]) or "Summary.",
+            "nodeType": "informational"
+        })
+        if self._owner.malformed_rate and random.random() < self._owner.malformed_rate:
+            content = "Here is the theme: " + content[:-20]
+        prompt_tokens = len(prompt) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens)
+        )
+
+
+class FakeOpenAI:
+    """
+    Local stand-in for the OpenAI client with configurable per-call latency.
+    Embeddings are deterministic per input text; chat completions return a theme
+    JSON object built from the prompt (optionally truncated at `malformed_rate`).
+    """
+
+    def __init__(self, latency: float = 0.0, dimension: int = 1536, malformed_rate: float = 0.0, **kwargs):
+        self.latency = latency
+        self.dimension = dimension
+        self.malformed_rate = malformed_rate
+        self.embeddings = _Embeddings(self)
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class _Serializer:
+    mimetype = "application/json"
+
+    def dumps(self, data) -> str:
+        # numpy arrays (embeddings) are written as lists, as the real serializers do
+        return data if isinstance(data, str) else json.dumps(data, default=lambda o: o.tolist())
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class _Indices:
+    def __init__(self, owner: "FakeOpenSearch"):
+        self._owner = owner
+        self._existing = set()
+
+    def exists(self, index: str, **kwargs) -> bool:
+        self._owner._wait()
+        return index in self._existing
+
+    def create(self, index: str, body: Optional[Dict] = None, **kwargs) -> Dict:
+        self._owner._wait()
+        self._existing.add(index)
+        return {"acknowledged": True, "index": index}
+
+    def put_mapping(self, *args, **kwargs) -> Dict:
+        self._owner._wait()
+        return {"acknowledged": True}
+
+    def get_mapping(self, index: str, **kwargs) -> Dict:
+        self._owner._wait()
+        return {index: {"mappings": {"_meta": {}}}}
+
+    def refresh(self, *args, **kwargs) -> Dict:
+        self._owner._wait()
+        return {}
+
+
+class FakeOpenSearch:
+    """
+    Local stand-in for the OpenSearch client with configurable per-call latency.
+    Searches return `hits` synthetic chunk documents; bulk requests acknowledge
+    every action. Calls are counted in `calls` by method name.
+    """
+
+    def __init__(self, latency: float = 0.0, hits: int = 5, **kwargs):
+        self.latency = latency
+        self.hits = hits
+        self.calls: Dict[str, int] = {}
+        self.indices = _Indices(self)
+        self.tasks = SimpleNamespace(get=self._get_task)
+        self.transport = SimpleNamespace(serializer=_Serializer())
+
+    def _wait(self, method: Optional[str] = None) -> None:
+        if method:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _hits(self, size: int) -> List[Dict]:
+        return [
+            {
+                "_id": f"doc-{i}",
+                "_score": 1.0 - i * 0.01,
+                "_source": {
+                    "title": f"paper-{i % 7}.pdf",
+                    "page_number": i % 20 + 1,
+                    "text_content": f"Synthetic passage {i} about vectors, caches and latency. " * 8,
+                    "documentChecksum": f"checksum-{i % 7}",
+                    "is_chart": False
+                }
+            }
+            for i in range(min(size, self.hits))
+        ]
+
+    def search(self, index: Optional[str] = None, body: Optional[Dict] = None, **kwargs) -> Dict:
+        self._wait("search")
+        size = (body or {}).get("size", 10)
+        hits = self._hits(size)
+        return {"took": 1, "hits": {"total": {"value": len(hits)}, "hits": hits}}
+
+    def msearch(self, body, index: Optional[str] = None, **kwargs) -> Dict:
+        self._wait("msearch")
+        lines = body if isinstance(body, list) else [json.loads(l) for l in body.splitlines() if l.strip()]
+        queries = lines[1::2]
+        return {"responses": [
+            {"took": 1, "hits": {"total": {"value": 0}, "hits": self._hits(q.get("size", 10))}}
+            for q in queries
+        ]}
+
+    def bulk(self, body=None, *args, **kwargs) -> Dict:
+        self._wait("bulk")
+        lines = body if isinstance(body, list) else [l for l in (body or "").splitlines() if l.strip()]
+        items = []
+        i = 0
+        while i < len(lines):
+            action = lines[i]
+            action = json.loads(action) if isinstance(action, (str, bytes)) else action
+            op = next(iter(action))
+            items.append({op: {"_id": action[op].get("_id"), "status": 201, "result": "created"}})
+            i += 1 if op == "delete" else 2
+        return {"took": 1, "errors": False, "items": items}
+
+    def index(self, *args, **kwargs) -> Dict:
+        self._wait("index")
+        return {"result": "created"}
+
+    def delete_by_query(self, *args, **kwargs) -> Dict:
+        self._wait("delete_by_query")
+        return {"deleted": 0, "failures": [], "task": "fake:1"}
+
+    def _get_task(self, task_id: str, **kwargs) -> Dict:
+        self._wait("tasks.get")
+        return {"completed": True, "task": {"status": {"total": 0, "deleted": 0, "version_conflicts": 0}},
+                "response": {"deleted": 0, "failures": []}}
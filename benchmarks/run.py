@@ -0,0 +1,426 @@
+"""
+Benchmarks for the parsing, chunking, extraction and retrieval hot paths.
+
+Each case runs in a fresh process so peak RSS is attributable to it. OpenAI and
+OpenSearch are replaced with local fakes with configurable latency. Results are
+written to benchmarks/results/<commit>.json; pass --compare to diff against an
+earlier run.
+
+    python benchmarks/run.py --export-mb 50 --pdf-pages 200
+    python benchmarks/run.py --cases parse chunk --compare benchmarks/results/<sha>.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+BACKEND_DIR = PROJECT_ROOT / "backend"
+DATA_DIR = PROJECT_ROOT / "benchmarks" / ".data"
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+
+for path in (str(PROJECT_ROOT), str(BACKEND_DIR)):
+    if path not in sys.path:
+        sys.path.append(path)
+
+# core/ modules are imported as src.core.* (see src/__init__.py), as they import src.config and src.models
+
+# Top-level packages of this repo; an ImportError naming one of them is a bug, not a skip
+PROJECT_PACKAGES = {"src", "core", "models", "config", "app", "benchmarks"}
+
+from benchmarks import fakes, synthetic  # noqa: E402
+
+
+# --- Helpers ---
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def export_path(args) -> Path:
+    path = DATA_DIR / f"export-{args.export_mb}mb-seed{args.seed}.json"
+    if not path.exists():
+        synthetic.generate_export(path, int(args.export_mb * 1024 * 1024), seed=args.seed)
+    return path
+
+
+def pii_export_path(args) -> Path:
+    path = DATA_DIR / f"export-{args.export_mb}mb-seed{args.seed}-pii.json"
+    if not path.exists():
+        synthetic.generate_export(path, int(args.export_mb * 1024 * 1024), seed=args.seed, pii_rate=0.2)
+    return path
+
+
+def pdf_path(args) -> Path:
+    path = DATA_DIR / f"doc-{args.pdf_pages}p-seed{args.seed}.pdf"
+    if not path.exists():
+        synthetic.generate_pdf(path, args.pdf_pages, seed=args.seed)
+    return path
+
+
+def _patch_openai(args) -> None:
+    # The OpenAI providers are kept, so request batching and metrics are measured too
+    from app.services import parse_chatgpt_conversation as conversation_parser
+    from core.providers import OpenAICompletions, OpenAIEmbeddings
+    fake = fakes.FakeOpenAI(latency=args.openai_latency_ms / 1000.0, malformed_rate=args.malformed_rate)
+    completions = OpenAICompletions(conversation_parser.COMPLETION_MODEL, client=fake)
+    embeddings = OpenAIEmbeddings(conversation_parser.EMBEDDING_MODEL, client=fake)
+    conversation_parser.get_completion_provider = lambda: completions
+    conversation_parser.get_embedding_provider = lambda: embeddings
+
+
+# --- Cases ---
+# Each case returns {"items": n, "bytes": b (optional), "latencies": [seconds per item]}
+
+def case_parse(args) -> Dict:
+    from app.services import parse_chatgpt_conversation as conversation_parser
+    path = export_path(args)
+    latencies = []
+    for raw in conversation_parser.iter_chatgpt_json(str(path)):
+        start = time.perf_counter()
+        conversation_parser.parse_conversations([raw])
+        latencies.append(time.perf_counter() - start)
+    return {"items": len(latencies), "bytes": path.stat().st_size, "latencies": latencies}
+
+
+def case_chunk(args) -> Dict:
+    from app.services import parse_chatgpt_conversation as conversation_parser
+    path = export_path(args)
+    latencies = []
+    chunks = 0
+    text_bytes = 0
+    for raw in conversation_parser.iter_chatgpt_json(str(path)):
+        convo = conversation_parser.parse_conversations([raw])[0]
+        full_text = "\n".join(msg["content"] for msg in convo["messages"])
+        start = time.perf_counter()
+        chunks += len(conversation_parser.chunk_conversation(full_text))
+        latencies.append(time.perf_counter() - start)
+        text_bytes += len(full_text)
+    return {"items": len(latencies), "bytes": text_bytes, "latencies": latencies, "chunks": chunks}
+
+
+def case_extract(args) -> Dict:
+    from app.services import parse_chatgpt_conversation as conversation_parser
+    _patch_openai(args)
+    path = export_path(args)
+    latencies = []
+    failed = 0
+    for raw in conversation_parser.iter_chatgpt_json(str(path)):
+        convo = conversation_parser.parse_conversations([raw])[0]
+        full_text = "\n".join(msg["content"] for msg in convo["messages"])
+        for chunk in conversation_parser.chunk_conversation(full_text):
+            start = time.perf_counter()
+            if conversation_parser.extract_themes_from_chunk(chunk.text) is None:
+                failed += 1
+            latencies.append(time.perf_counter() - start)
+            if len(latencies) >= args.extract_limit:
+                break
+        if len(latencies) >= args.extract_limit:
+            break
+    return {"items": len(latencies), "latencies": latencies, "failed": failed,
+            "extraction_stats": conversation_parser.get_extraction_stats()}
+
+
+def case_ingest(args) -> Dict:
+    from itertools import islice
+    from app.services import parse_chatgpt_conversation as conversation_parser
+    from app.services.ingest_pipeline import IngestPipeline
+    from app.services.opensearch_service import OpenSearchService
+    _patch_openai(args)
+    client = fakes.FakeOpenSearch(latency=args.opensearch_latency_ms / 1000.0)
+    pipeline = IngestPipeline(opensearch_service=OpenSearchService(client))
+    conversations = islice(conversation_parser.iter_chatgpt_json(str(export_path(args))), args.ingest_limit)
+    stats = pipeline.run(conversations)
+    return {"items": stats["completed"], "latencies": [], "pipeline": stats}
+
+
+def case_pdf(args) -> Dict:
+    from src.core.pdf_parser import PDFParser
+    path = pdf_path(args)
+    parser = PDFParser()
+    start = time.perf_counter()
+    chunks = parser.parse_pdf_old(path, parser.compute_checksum(path))
+    elapsed = time.perf_counter() - start
+    return {"items": args.pdf_pages, "bytes": path.stat().st_size, "latencies": [elapsed / args.pdf_pages] * args.pdf_pages,
+            "chunks": len(chunks)}
+
+
+def case_pdf_layout(args) -> Dict:
+    from src.core.pdf_layout import layout_chunks
+    path = pdf_path(args)
+    start = time.perf_counter()
+    chunks = layout_chunks(str(path), workers=args.pdf_workers)
+    elapsed = time.perf_counter() - start
+    return {"items": args.pdf_pages, "bytes": path.stat().st_size, "latencies": [elapsed / args.pdf_pages] * args.pdf_pages,
+            "chunks": len(chunks), "tables_and_figures": sum(chunk["type"] != "text" for chunk in chunks)}
+
+
+def case_retrieval(args) -> Dict:
+    from src.core.providers import OpenAIEmbeddings
+    from src.core.qa_service import QAService
+    from src.core.retrieval_cache import retrieval_cache
+    service = QAService.__new__(QAService)
+    service.client = fakes.FakeOpenSearch(latency=args.opensearch_latency_ms / 1000.0)
+    service.embeddings = OpenAIEmbeddings("text-embedding-3-small",
+                                          client=fakes.FakeOpenAI(latency=args.openai_latency_ms / 1000.0))
+    latencies = []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        service._search_similar_chunks(f"synthetic question {i % 50} about retrieval latency")
+        latencies.append(time.perf_counter() - start)
+    return {"items": len(latencies), "latencies": latencies, "retrieval_cache": retrieval_cache.stats()}
+
+
+def case_pii(args) -> Dict:
+    from app.services import parse_chatgpt_conversation as conversation_parser
+    from app.services.pii_filter import PIIFilter, redaction_counts
+    path = pii_export_path(args)
+    pii_filter = PIIFilter()
+    latencies = []
+    text_bytes = 0
+    redact_seconds = 0.0
+    # Time only the redaction of each conversation's text, as done in the ingest chunk stage
+    for raw in conversation_parser.iter_chatgpt_json(str(path)):
+        convo = conversation_parser.parse_conversations([raw])[0]
+        full_text = "\n".join(msg["content"] for msg in convo["messages"])
+        start = time.perf_counter()
+        pii_filter.redact(full_text)
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        redact_seconds += elapsed
+        text_bytes += len(full_text.encode('utf-8'))
+    return {"items": len(latencies), "bytes": text_bytes, "latencies": latencies,
+            "redact_mb_per_s": round(text_bytes / 1024 / 1024 / redact_seconds, 2) if redact_seconds else 0.0,
+            "redactions": redaction_counts()}
+
+
+def case_serialize(args) -> Dict:
+    import numpy as np
+    from opensearchpy.serializer import JSONSerializer
+    from core.serialization import get_serializer
+    from models.chunk import ParagraphChunk
+    rng = np.random.default_rng(args.seed)
+    chunks = [
+        ParagraphChunk(title=f"paper-{i % 7}.pdf", documentChecksum=f"checksum-{i % 7}", is_chart=False,
+                       page_number=i % 20 + 1, paragraph_or_chart_index=str(i),
+                       text_content=f"Synthetic passage {i} about vectors, caches and latency. " * 8,
+                       embedding_model="text-embedding-3-small", pdf_loader="pymupdf",
+                       embedding=rng.uniform(-1.0, 1.0, 1536))
+        for i in range(args.serialize_chunks)
+    ]
+
+    def bulk_cpu_seconds(serializer) -> float:
+        # Serialize the same (action, source) pairs IndexingService.index_chunks sends through helpers.bulk
+        start = time.process_time()
+        size = 0
+        for chunk in chunks:
+            size += len(serializer.dumps({"index": {"_index": "chunks", "_id": chunk.paragraph_or_chart_index}}))
+            size += len(serializer.dumps({
+                "title": chunk.title, "documentChecksum": chunk.documentChecksum, "is_chart": chunk.is_chart,
+                "page_number": chunk.page_number, "paragraph_or_chart_index": chunk.paragraph_or_chart_index,
+                "text_content": chunk.text_content, "embedding_model": chunk.embedding_model,
+                "embedding": chunk.embedding, "pdf_loader": chunk.pdf_loader
+            }))
+        return time.process_time() - start
+
+    stdlib_seconds = bulk_cpu_seconds(JSONSerializer())
+    fast = get_serializer()
+    fast_seconds = bulk_cpu_seconds(fast)
+    per_10k = 10000 / len(chunks) if chunks else 0
+    return {"items": len(chunks), "latencies": [], "serializer": type(fast).__name__,
+            "stdlib_cpu_s_per_10k": round(stdlib_seconds * per_10k, 3),
+            "fast_cpu_s_per_10k": round(fast_seconds * per_10k, 3),
+            "speedup": round(stdlib_seconds / fast_seconds, 2) if fast_seconds else 0.0}
+
+
+# Modules loaded at startup by the API server and the CLI entry points
+STARTUP_MODULES = (
+    "app.main",
+    "app.services.parse_chatgpt_conversation",
+    "app.services.ingest_pipeline",
+    "app.services.delete_themes_index",
+)
+
+
+def case_startup(args) -> Dict:
+    # Each import runs in a fresh interpreter; the bare interpreter start-up is subtracted
+    def cold_start(statement: str) -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=BACKEND_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+    baseline = percentile([cold_start("pass") for _ in range(args.startup_runs)], 50)
+    import_ms = {}
+    latencies = []
+    for module in STARTUP_MODULES:
+        try:
+            runs = [cold_start(f"import {module}") - baseline for _ in range(args.startup_runs)]
+        except subprocess.CalledProcessError:
+            import_ms[module] = None
+            continue
+        latencies.extend(runs)
+        import_ms[module] = round(percentile(runs, 50) * 1000, 1)
+    return {"items": len(latencies), "latencies": latencies, "interpreter_ms": round(baseline * 1000, 1),
+            "import_ms": import_ms}
+
+
+CASES: Dict[str, Callable[[argparse.Namespace], Dict]] = {
+    "parse": case_parse,
+    "chunk": case_chunk,
+    "extract": case_extract,
+    "ingest": case_ingest,
+    "pdf": case_pdf,
+    "pdf_layout": case_pdf_layout,
+    "retrieval": case_retrieval,
+    "pii": case_pii,
+    "serialize": case_serialize,
+    "startup": case_startup,
+}
+
+
+# --- Runner ---
+
+def _child(name: str, args: argparse.Namespace, results) -> None:
+    try:
+        start = time.perf_counter()
+        raw = CASES[name](args)
+        elapsed = time.perf_counter() - start
+    except ImportError as e:
+        if e.name and e.name.split(".")[0] not in PROJECT_PACKAGES:
+            results.put({"skipped": f"missing dependency: {e}"})
+        else:
+            results.put({"error": f"{type(e).__name__}: {e}"})
+        return
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+        return
+
+    latencies = raw.pop("latencies", [])
+    items = raw.pop("items", 0)
+    nbytes = raw.pop("bytes", None)
+    result = {
+        "seconds": round(elapsed, 4),
+        "items": items,
+        "items_per_s": round(items / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if nbytes:
+        result["mb_per_s"] = round(nbytes / 1024 / 1024 / elapsed, 2) if elapsed else 0.0
+    result.update(raw)
+    results.put(result)
+
+
+def run_case(name: str, args: argparse.Namespace) -> Dict:
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=_child, args=(name, args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+COMPARED_METRICS = (("items_per_s", True), ("mb_per_s", True), ("p50_ms", False), ("p99_ms", False), ("peak_rss_mb", False))
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print per-metric changes against a baseline run; returns the regressions found."""
+    regressions = []
+    print(f"\nComparison against {baseline.get('commit')} (threshold {threshold:.0%}):")
+    for name, result in current["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if not base or "seconds" not in result or "seconds" not in base:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            if metric not in result or not base.get(metric):
+                continue
+            change = (result[metric] - base[metric]) / base[metric]
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > threshold else ""
+            print(f"  {name:<12} {metric:<12} {base[metric]:>12} -> {result[metric]:>12} ({change:+.1%}) {flag}")
+            if flag:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run hot-path benchmarks")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--export-mb", type=float, default=10.0, help="Size of the synthetic ChatGPT export")
+    parser.add_argument("--pdf-pages", type=int, default=100)
+    parser.add_argument("--pdf-workers", type=int, default=4, help="Table/figure extraction processes (pdf_layout)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--openai-latency-ms", type=float, default=0.0)
+    parser.add_argument("--opensearch-latency-ms", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of fake completions returned truncated")
+    parser.add_argument("--extract-limit", type=int, default=2000, help="Chunks to run through extraction")
+    parser.add_argument("--ingest-limit", type=int, default=500, help="Conversations to run through the pipeline")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--startup-runs", type=int, default=5, help="Cold interpreter starts per module")
+    parser.add_argument("--serialize-chunks", type=int, default=10000, help="Chunks with 1536-dim embeddings to serialize")
+    parser.add_argument("--output", type=Path, help="Results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change reported as a regression")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "params": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items() if k not in ("output", "compare")},
+        "cases": {}
+    }
+    # Generate synthetic inputs up front so it isn't timed as part of a case
+    if set(args.cases) & {"parse", "chunk", "extract", "ingest"}:
+        export_path(args)
+    if "pii" in args.cases:
+        pii_export_path(args)
+    if set(args.cases) & {"pdf", "pdf_layout"}:
+        try:
+            pdf_path(args)
+        except ImportError:
+            pass
+
+    for name in args.cases:
+        print(f"Running {name}...", flush=True)
+        result = run_case(name, args)
+        report["cases"][name] = result
+        print("  " + json.dumps(result, default=str)[:400])
+
+    output = args.output or RESULTS_DIR / f"{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, default=str))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import copy
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SEED_EXPORT = PROJECT_ROOT / "userdata" / "test_conversations.json"
+
+_WORDS = (
+    "model data index query theme vector chunk search python research paper idea "
+    "project travel budget recipe workout meeting email phone weather design system "
+    "latency throughput memory cache network graph node summary question answer"
+).split()
+
+# Synthetic PII inserted into message text when generating exports with pii_rate > 0
+_PII_SAMPLES = (
+    "jane.doe{n}@example.com",
+    "+1 (415) 555-{n:04d}",
+    "4111 1111 1111 1111",
+    "sk-test{n:020d}",
+    "{n} Market Street",
+)
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _message_text(rng: random.Random, min_words: int, max_words: int) -> str:
+    total = rng.randint(min_words, max_words)
+    sentences = []
+    while total > 0:
+        n = min(total, rng.randint(6, 18))
+        sentences.append(_sentence(rng, n))
+        total -= n
+    return " ".join(sentences)
+
+
+def _with_pii(text: str, rng: random.Random, pii_rate: float) -> str:
+    if pii_rate and rng.random() < pii_rate:
+        text += " Contact " + rng.choice(_PII_SAMPLES).format(n=rng.randint(0, 9999)) + "."
+    return text
+
+
+def _scaled_conversation(template: Dict, rng: random.Random, idx: int,
+                         min_words: int, max_words: int, extra_messages: int,
+                         pii_rate: float = 0.0) -> Dict:
+    convo = copy.deepcopy(template)
+    convo["id"] = f"synthetic-{idx}"
+    convo["title"] = f"{template.get('title', 'Conversation')} #{idx}"
+    convo["create_time"] = (template.get("create_time") or 1700000000) + idx * 3600
+
+    mapping = convo.get("mapping", {})
+    for node in mapping.values():
+        message = node.get("message")
+        if message:
+            message["content"]["parts"] = [_with_pii(_message_text(rng, min_words, max_words), rng, pii_rate)]
+
+    # Append extra message pairs so conversations span several chunks
+    for n in range(extra_messages):
+        msg_id = f"synthetic-{idx}-{n}"
+        mapping[msg_id] = {
+            "id": msg_id,
+            "message": {
+                "id": msg_id,
+                "author": {"role": "user" if n % 2 == 0 else "assistant", "name": None, "metadata": {}},
+                "create_time": convo["create_time"] + n,
+                "content": {"content_type": "text",
+                            "parts": [_with_pii(_message_text(rng, min_words, max_words), rng, pii_rate)]},
+            },
+            "parent": None,
+            "children": []
+        }
+    return convo
+
+
+def generate_export(path: Path, target_bytes: int, seed: int = 0,
+                    min_words: int = 20, max_words: int = 200, extra_messages: int = 6,
+                    pii_rate: float = 0.0) -> Dict:
+    """
+    Write a synthetic ChatGPT export of roughly `target_bytes` to `path` by scaling up
+    userdata/test_conversations.json. The file is written incrementally so exports far
+    larger than memory can be generated. `pii_rate` is the fraction of messages that get
+    a synthetic email, phone, card, key or address. Returns {"conversations": n, "bytes": size}.
+    """
+    rng = random.Random(seed)
+    with open(SEED_EXPORT, 'r', encoding='utf-8') as file:
+        templates: List[Dict] = json.load(file)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    count = 0
+    with open(path, 'w', encoding='utf-8') as out:
+        out.write("[")
+        written += 1
+        while written < target_bytes:
+            convo = _scaled_conversation(templates[count % len(templates)], rng, count,
+                                         min_words, max_words, extra_messages, pii_rate)
+            text = ("," if count else "") + json.dumps(convo, ensure_ascii=False)
+            out.write(text)
+            written += len(text.encode('utf-8'))
+            count += 1
+        out.write("]")
+    return {"conversations": count, "bytes": path.stat().st_size}
+
+
+def generate_pdf(path: Path, pages: int, seed: int = 0, columns: int = 2, image_every: int = 5) -> Dict:
+    """
+    Write a synthetic multi-column PDF with `pages` pages using PyMuPDF.
+    Every `image_every`-th page gets an embedded image so the figure path is exercised.
+    """
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), 0)
+    pixmap.clear_with(200)
+    margin, gutter = 50, 20
+
+    for page_num in range(pages):
+        page = doc.new_page()
+        width = (page.rect.width - 2 * margin - gutter * (columns - 1)) / columns
+        for col in range(columns):
+            x0 = margin + col * (width + gutter)
+            rect = fitz.Rect(x0, margin, x0 + width, page.rect.height - margin)
+            text = "\n\n".join(_message_text(rng, 40, 120) for _ in range(4))
+            page.insert_textbox(rect, text, fontsize=9)
+        if image_every and page_num % image_every == 0:
+            page.insert_image(fitz.Rect(margin, margin, margin + 120, margin + 120), pixmap=pixmap)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(path)
+    doc.close()
+    return {"pages": pages, "bytes": path.stat().st_size}
@@ -0,0 +1,71 @@
+"""
+Answer a file of questions offline and write the results as JSONL.
+
+    python -m src.core.batch_qa questions.txt --output answers.jsonl --concurrency 16
+
+The input is either plain text (one question per line) or JSONL with a "question"
+field. Each output line holds the question, its refined queries, the answer (without
+terminal colors), its references and context token counts, or an "error".
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import List
+from ..config.settings import QA_BATCH_CONCURRENCY
+from .qa_service import QAService
+from .search_filters import SearchFilters
+
+logger = logging.getLogger(__name__)
+
+
+def load_questions(path: Path) -> List[str]:
+    questions = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["question"]
+            questions.append(line)
+    return questions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Answer a file of questions and write JSONL results")
+    parser.add_argument("questions", type=Path, help="Text file (one question per line) or JSONL with a 'question' field")
+    parser.add_argument("--output", "-o", type=Path, help="Output JSONL file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=QA_BATCH_CONCURRENCY,
+                        help="Questions refined / answered in parallel")
+    parser.add_argument("--documents", nargs="+", metavar="CHECKSUM", help="Only search these documents")
+    parser.add_argument("--exclude-charts", action="store_true", help="Don't use chart/figure chunks as context")
+    parser.add_argument("--user", help="Search this user's papers index instead of the shared one")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    questions = load_questions(args.questions)
+    service = QAService(colors=False, user_id=args.user)
+    filters = SearchFilters(document_checksums=args.documents, exclude_charts=args.exclude_charts)
+
+    start = time.perf_counter()
+    failed = 0
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for count, result in enumerate(service.answer_questions(questions, concurrency=args.concurrency, filters=filters), 1):
+            failed += "error" in result
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if count % 100 == 0:
+                print(f"{count}/{len(questions)} answered", file=sys.stderr, flush=True)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Answered {len(questions) - failed}/{len(questions)} questions in {time.perf_counter() - start:.1f}s "
+          f"({failed} failed)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from .metrics import counter, opensearch_call
+
+logger = logging.getLogger(__name__)
+
+# Bulk indexing that survives overload and restarts:
+#   bulk_with_retries  retries items rejected with 429 (es_rejected_execution_exception,
+#                      a full write queue) with exponential backoff and jitter
+#   DeadLetterFile     JSONL of actions that still failed, with their error, for replay
+#   ProgressCursor     append-only log of acknowledged batches, so a long ingest
+#                      resumes after the last batch OpenSearch answered for
+# Actions must carry a deterministic _id: a resumed or replayed batch then overwrites
+# what was already written instead of duplicating it. This module reads no settings.
+
+BULK_RETRIES = counter("opensearch_bulk_retries_total", "Bulk actions resent after a 429 rejection")
+DEAD_LETTERS = counter("opensearch_dead_letters_total", "Bulk actions written to a dead-letter file")
+
+
+class BulkIndexingError(Exception):
+    """Some bulk actions failed permanently; `failures` holds their dead-letter records."""
+
+    def __init__(self, message: str, failures: List[Dict]):
+        super().__init__(message)
+        self.failures = failures
+
+
+def _backoff(attempt: int, initial: float, maximum: float) -> float:
+    """Delay before retry `attempt` (1-based): exponential up to `maximum`, jittered so clients don't retry in step."""
+    delay = min(maximum, initial * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def bulk_with_retries(client, actions: List[Dict], max_retries: int = 5, initial_backoff: float = 1.0,
+                      max_backoff: float = 60.0, **kwargs) -> Tuple[int, List[Dict]]:
+    """
+    Send `actions` with helpers.streaming_bulk. Items rejected with 429, and whole
+    requests rejected with 429, are resent up to `max_retries` times after a growing
+    delay; other item errors are not retried. Returns the number of successful
+    actions and a dead-letter record ({"action", "status", "error", "failed_at"})
+    for each action that failed permanently. Other transport errors (OpenSearch
+    unreachable, ...) are raised, leaving the batch unacknowledged.
+    """
+    from opensearchpy import helpers
+    from opensearchpy.exceptions import TransportError
+    by_id = {action["_id"]: action for action in actions}
+    pending = actions
+    success = 0
+    failures: List[Dict] = []
+    for attempt in range(max_retries + 1):
+        if attempt:
+            BULK_RETRIES.inc(len(pending))
+            time.sleep(_backoff(attempt, initial_backoff, max_backoff))
+        rejected: List[Dict] = []
+        handled: Set[str] = set()
+        try:
+            with opensearch_call("bulk"):
+                for ok, item in helpers.streaming_bulk(client, pending, raise_on_error=False, max_retries=0, **kwargs):
+                    info = next(iter(item.values()))
+                    handled.add(info["_id"])
+                    if ok:
+                        success += 1
+                    elif info.get("status") == 429 and attempt < max_retries:
+                        rejected.append(by_id[info["_id"]])
+                    else:
+                        failures.append(dead_letter_record(by_id[info["_id"]], info))
+        except TransportError as e:
+            if e.status_code != 429 or attempt == max_retries:
+                raise
+            rejected.extend(action for action in pending if action["_id"] not in handled)
+        if not rejected:
+            break
+        logger.warning(f"{len(rejected)} bulk actions rejected (429), retry {attempt + 1} of {max_retries}")
+        pending = rejected
+    return success, failures
+
+
+def dead_letter_record(action: Dict, info: Dict) -> Dict:
+    return {"action": action, "status": info.get("status"), "error": info.get("error"),
+            "failed_at": datetime.utcnow().isoformat()}
+
+
+class DeadLetterFile:
+    """
+    Bulk actions that failed permanently, one JSON record per line. Records are
+    appended as failures happen; replay() resends them and keeps the ones that
+    still fail. A replay interrupted midway leaves its records in `<path>.replaying`,
+    which the next replay picks up.
+    """
+
+    def __init__(self, path: str, serializer=None):
+        self.path = path
+        self.replaying_path = f"{path}.replaying"
+        self.serializer = serializer
+        self._lock = threading.Lock()
+
+    def _dumps(self, record: Dict) -> str:
+        # The client's serializer handles numpy embeddings
+        return self.serializer.dumps(record) if self.serializer is not None else json.dumps(record)
+
+    def append(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        lines = "".join(self._dumps(record) + "\n" for record in records)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(lines)
+                file.flush()
+                os.fsync(file.fileno())
+        DEAD_LETTERS.inc(len(records))
+        logger.error(f"Wrote {len(records)} failed bulk actions to {self.path}")
+
+    @staticmethod
+    def _read(path: str) -> List[Dict]:
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def read(self) -> List[Dict]:
+        return self._read(self.replaying_path) + self._read(self.path)
+
+    def __len__(self) -> int:
+        return len(self.read())
+
+    def replay(self, client, **bulk_kwargs) -> Dict:
+        """
+        Resend every dead-lettered action with bulk_with_retries (keyword arguments
+        are passed on). Actions that fail again are appended back to the file.
+        """
+        with self._lock:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as src, \
+                        open(self.replaying_path, "a", encoding="utf-8") as dst:
+                    dst.write(src.read())
+                os.remove(self.path)
+        records = self._read(self.replaying_path)
+        if not records:
+            return {"replayed": 0, "indexed": 0, "errors": 0}
+        success, failures = bulk_with_retries(client, [record["action"] for record in records], **bulk_kwargs)
+        self.append(failures)
+        os.remove(self.replaying_path)
+        logger.info(f"Replayed {len(records)} actions from {self.path}: {success} indexed, {len(failures)} failed")
+        return {"replayed": len(records), "indexed": success, "errors": len(failures)}
+
+
+class ProgressCursor:
+    """
+    Progress of a long ingest, persisted as an append-only JSONL log: one line per
+    acknowledged batch of a document ({"key", "batch"}) and one when the document is
+    done ({"key", "done": true}). Each line is flushed to disk before the next batch
+    starts, so after a crash a run skips finished documents and resumes the current
+    one after its last acknowledged batch.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Set[str] = set()
+        self._batches: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut off by the crash
+                    if entry.get("done"):
+                        self.completed.add(entry["key"])
+                        self._batches.pop(entry["key"], None)
+                    else:
+                        self._batches[entry["key"]] = entry["batch"] + 1
+
+    def is_completed(self, key: str) -> bool:
+        return key in self.completed
+
+    def acknowledged(self, key: str) -> int:
+        """Number of leading batches of `key` already acknowledged."""
+        return self._batches.get(key, 0)
+
+    def _write(self, entry: Dict) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def ack(self, key: str, batch: int) -> None:
+        """Record that batch `batch` (0-based) of `key` was acknowledged by OpenSearch."""
+        self._write({"key": key, "batch": batch})
+        self._batches[key] = batch + 1
+
+    def complete(self, key: str, batches: Optional[int] = None) -> None:
+        self._write({"key": key, "done": True, "batches": batches})
+        self.completed.add(key)
+        self._batches.pop(key, None)
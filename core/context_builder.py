@@ -0,0 +1,158 @@
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from ..config.settings import COMPLETION_MODEL, QA_CONTEXT_TOKEN_BUDGET, QA_DEDUPE_SIMILARITY, QA_MMR_LAMBDA
+from .metrics import counter, log_event
+
+logger = logging.getLogger(__name__)
+
+QA_CONTEXT_TOKENS = counter("qa_context_tokens_total", "Context tokens retrieved (candidate), sent (packed) and saved per QA prompt")
+
+# Tokens added per chunk by the "[RefN] " tag and the separator between chunks
+CHUNK_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        name = tiktoken.encoding_name_for_model(COMPLETION_MODEL)
+    except KeyError:
+        name = "cl100k_base"
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # Encodings are downloaded on first use, which fails offline
+        logger.warning(f"Could not load tiktoken encoding, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise ~4 characters per token."""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def as_vector(embedding) -> Optional[np.ndarray]:
+    """Embedding as a float32 array (None if missing)."""
+    if embedding is None:
+        return None
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+@dataclass
+class ContextResult:
+    hits: List[dict]
+    candidate_tokens: int
+    packed_tokens: int
+    duplicates: int
+    stats: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.candidate_tokens - self.packed_tokens
+
+
+class ContextBuilder:
+    """
+    Assembles QA prompt context from the hits of every sub-query:
+    1. drops repeated chunks (same id or same text) and near-duplicates whose
+       embeddings have cosine similarity >= dedupe_similarity with a chunk already chosen
+    2. orders the rest by maximal marginal relevance: relevance is the best cosine
+       similarity to any sub-query embedding, penalized by similarity to chosen chunks
+    3. packs chunks in that order until the token budget is used
+    Hits without an `embedding` in `_source` keep their search order and are only
+    de-duplicated by id and text.
+    """
+
+    def __init__(self, token_budget: int = QA_CONTEXT_TOKEN_BUDGET, mmr_lambda: float = QA_MMR_LAMBDA,
+                 dedupe_similarity: float = QA_DEDUPE_SIMILARITY):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.dedupe_similarity = dedupe_similarity
+
+    def _unique(self, hits: List[dict]) -> List[dict]:
+        seen = set()
+        unique = []
+        for hit in hits:
+            text = " ".join(hit['_source'].get('text_content', '').split()).lower()
+            keys = (("id", hit.get('_id')), ("text", text))
+            if any(key in seen for key in keys if key[1]):
+                continue
+            seen.update(keys)
+            unique.append(hit)
+        return unique
+
+    def _mmr_order(self, hits: List[dict], query_embeddings: Sequence) -> List[dict]:
+        """Order hits by maximal marginal relevance, dropping near-duplicates."""
+        vectors = [as_vector(hit['_source'].get('embedding')) for hit in hits]
+        queries = [as_vector(q) for q in query_embeddings if q is not None]
+        if not queries or any(v is None for v in vectors):
+            return hits
+
+        docs = _normalize(np.stack(vectors))
+        relevance = (docs @ _normalize(np.stack(queries)).T).max(axis=1)
+        similarity = docs @ docs.T
+
+        order: List[int] = []
+        remaining = list(range(len(hits)))
+        max_sim = np.full(len(hits), -1.0, dtype=np.float32)
+        while remaining:
+            candidates = np.array(remaining)
+            if order:
+                scores = self.mmr_lambda * relevance[candidates] - (1 - self.mmr_lambda) * max_sim[candidates]
+            else:
+                scores = relevance[candidates]
+            best = int(candidates[int(np.argmax(scores))])
+            remaining.remove(best)
+            if order and max_sim[best] >= self.dedupe_similarity:
+                continue
+            order.append(best)
+            max_sim = np.maximum(max_sim, similarity[best])
+        return [hits[i] for i in order]
+
+    def build(self, hits: List[dict], query_embeddings: Sequence = ()) -> ContextResult:
+        """Select and order the hits to include in the prompt."""
+        if not hits:
+            return ContextResult(hits=[], candidate_tokens=0, packed_tokens=0, duplicates=0)
+
+        tokens = {id(hit): count_tokens(hit['_source'].get('text_content', '')) + CHUNK_OVERHEAD_TOKENS
+                  for hit in hits}
+        candidate_tokens = sum(tokens.values())
+
+        unique = self._unique(hits)
+        ordered = self._mmr_order(unique, query_embeddings)
+        duplicates = len(hits) - len(ordered)
+
+        packed: List[dict] = []
+        packed_tokens = 0
+        for hit in ordered:
+            cost = tokens[id(hit)]
+            # The best chunk is always included, even if it alone exceeds the budget
+            if packed and packed_tokens + cost > self.token_budget:
+                continue
+            packed.append(hit)
+            packed_tokens += cost
+
+        result = ContextResult(hits=packed, candidate_tokens=candidate_tokens, packed_tokens=packed_tokens,
+                               duplicates=duplicates,
+                               stats={"candidates": len(hits), "duplicates": duplicates, "packed": len(packed)})
+        QA_CONTEXT_TOKENS.inc(candidate_tokens, kind="candidate")
+        QA_CONTEXT_TOKENS.inc(packed_tokens, kind="packed")
+        QA_CONTEXT_TOKENS.inc(result.tokens_saved, kind="saved")
+        log_event(logger, "qa_context", sample_rate=1.0, candidate_tokens=candidate_tokens,
+                  packed_tokens=packed_tokens, tokens_saved=result.tokens_saved, **result.stats)
+        return result
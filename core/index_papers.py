@@ -0,0 +1,96 @@
+"""
+Parse, embed and index a set of PDFs into the papers index, resumably.
+
+    python -m src.core.index_papers papers/ --cursor papers.cursor.jsonl
+    python -m src.core.index_papers --replay-dead-letters
+
+Each document's chunks are embedded and indexed in batches. With --cursor, every
+batch OpenSearch acknowledged is recorded, so an interrupted run started again with
+the same cursor skips finished documents and continues the current one after its
+last acknowledged batch (re-sent batches overwrite their chunks, as chunk ids are
+deterministic). Chunks that fail to index go to the index's dead-letter file
+(INDEX_DEAD_LETTER_DIR); fix the cause and replay them with --replay-dead-letters.
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import List
+from .bulk_indexing import ProgressCursor
+from .indexing_service import IndexingService
+from .pdf_parser import PDFParser
+
+logger = logging.getLogger(__name__)
+
+
+def find_pdfs(paths: List[Path]) -> List[Path]:
+    """PDF files given directly or found under directories, in a stable order."""
+    files = []
+    for path in paths:
+        files.extend(sorted(path.rglob("*.pdf")) if path.is_dir() else [path])
+    return files
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Index PDFs into the papers index, resumably")
+    parser.add_argument("paths", nargs="*", type=Path, help="PDF files or directories of PDFs")
+    parser.add_argument("--cursor", type=Path, help="Progress file; resume from it if it exists")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks embedded and indexed per batch")
+    parser.add_argument("--replay-dead-letters", action="store_true",
+                        help="Index the chunks in the dead-letter file again, then exit")
+    parser.add_argument("--user", help="Index into this user's papers index instead of the shared one")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    service = IndexingService(user_id=args.user)
+    if args.replay_dead_letters:
+        result = service.replay_dead_letters()
+        print(f"Replayed {result['replayed']} chunks: {result['indexed']} indexed, {result['errors']} failed",
+              file=sys.stderr)
+        return 1 if result['errors'] else 0
+    if not args.paths:
+        parser.error("give PDF files or directories, or --replay-dead-letters")
+
+    cursor = ProgressCursor(str(args.cursor)) if args.cursor else None
+    pdf_parser = PDFParser()
+    files = find_pdfs(args.paths)
+    start = time.perf_counter()
+    indexed = failed = skipped = 0
+    try:
+        for number, path in enumerate(files, 1):
+            checksum = pdf_parser.compute_checksum(path)
+            if cursor and cursor.is_completed(checksum):
+                skipped += 1
+                continue
+            chunks = pdf_parser.parse_pdf(path, checksum)
+            batches = range(0, len(chunks), args.batch_size)
+            resume_at = cursor.acknowledged(checksum) if cursor else 0
+            if resume_at:
+                logger.info(f"Resuming {path.name} after batch {resume_at} of {len(batches)}")
+            for batch, offset in enumerate(batches):
+                if batch < resume_at:
+                    continue
+                result = service.index_chunks(service.embed_chunks(chunks[offset:offset + args.batch_size]),
+                                              bump_version=False)
+                indexed += result['indexed']
+                failed += result['errors']
+                if cursor:
+                    cursor.ack(checksum, batch)
+            if cursor:
+                cursor.complete(checksum, len(batches))
+            print(f"{number}/{len(files)} documents, {indexed} chunks indexed "
+                  f"({indexed / (time.perf_counter() - start):.0f}/s)", file=sys.stderr, flush=True)
+    finally:
+        # Batches don't invalidate cached searches one by one, the whole run does once
+        if indexed:
+            service.bump_version()
+
+    print(f"Indexed {indexed} chunks from {len(files) - skipped} documents in {time.perf_counter() - start:.1f}s "
+          f"({skipped} already done, {failed} failed"
+          + (f", see {service.dead_letters.path}" if failed else "") + ")", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,72 +1,156 @@
-from typing import List
-from opensearchpy import OpenSearch, helpers
+import os
+import threading
+import time
+import uuid
+from functools import cached_property
+from typing import Dict, List, Optional
+from opensearchpy import OpenSearch
 from ..config.settings import (
     OPENSEARCH_HOST,
     OPENSEARCH_PORT,
     OPENSEARCH_USER,
     OPENSEARCH_PASSWORD,
     INDEX_NAME,
-    VECTOR_DIMENSION
+    VECTOR_DIMENSION,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    EMBEDDING_PROVIDER,
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DEVICE,
+    INDEX_DELETE_REQUESTS_PER_SECOND,
+    INDEX_DELETE_SLICES,
+    INDEX_TASK_POLL_INTERVAL,
+    INDEX_BULK_MAX_RETRIES,
+    INDEX_BULK_INITIAL_BACKOFF,
+    INDEX_BULK_MAX_BACKOFF,
+    INDEX_DEAD_LETTER_DIR
 )
 from ..models.chunk import ParagraphChunk
+from .bulk_indexing import BulkIndexingError, DeadLetterFile, bulk_with_retries
+from .metrics import opensearch_call
+from .providers import EmbeddingProvider, get_embedding_provider
+from .retrieval_cache import bump_index_version
+from .serialization import get_serializer
+from .tenancy import drop_tenant, ensure_index, tenant_index
 import logging
 
 logger = logging.getLogger(__name__)
 chunking_strategy = "basic" #todo: make this dynamic
 
 class IndexingService:
-    def __init__(self):
+    def __init__(self, user_id: Optional[str] = None):
+        # Each user's chunks live in their own index behind an alias (see core.tenancy)
+        self.user_id = user_id
+        self.index_name = tenant_index(INDEX_NAME, user_id)
         self.client = OpenSearch(
             hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
             http_auth=(OPENSEARCH_USER, OPENSEARCH_PASSWORD),
-            use_ssl=False
+            use_ssl=False,
+            serializer=get_serializer()
         )
         self.ensure_index()
         self.chunking_strategy = chunking_strategy
+        # Chunks that fail to index are kept here for replay_dead_letters
+        self.dead_letters = DeadLetterFile(os.path.join(INDEX_DEAD_LETTER_DIR, f"{self.index_name}.jsonl"),
+                                           serializer=self.client.transport.serializer)
 
     def ensure_index(self):
         """Create the index if it doesn't exist."""
-        if not self.client.indices.exists(index=INDEX_NAME):
-            mapping = {
-                "settings": {
-                    "index": {
-                        "knn": True  # Enable k-NN for knn_vector fields
-                    }
-                },
-                "mappings": {
-                    "properties": {
-                        "title": {"type": "keyword"},
-                        "documentChecksum": {"type": "keyword"},
-                        "is_chart": {"type": "boolean"},
-                        "page_number": {"type": "integer"},
-                        "paragraph_or_chart_index": {"type": "keyword"},
-                        "text_content": {"type": "text"},
-                        "embedding_model": {"type": "keyword"},
-                        "embedding": {
-                            "type": "knn_vector",
-                            "dimension": VECTOR_DIMENSION,
-                            "method": {
-                                "name": "hnsw",
-                                "engine": "nmslib",
-                                "space_type": "cosinesimil"
-                            }
-                        },
-                        "pdf_loader": {"type": "keyword"}
-                    }
+        mapping = {
+            "settings": {
+                "index": {
+                    "knn": True  # Enable k-NN for knn_vector fields
+                }
+            },
+            "mappings": {
+                "properties": {
+                    "title": {"type": "keyword"},
+                    "documentChecksum": {"type": "keyword"},
+                    "is_chart": {"type": "boolean"},
+                    "page_number": {"type": "integer"},
+                    "paragraph_or_chart_index": {"type": "keyword"},
+                    "text_content": {"type": "text"},
+                    "embedding_model": {"type": "keyword"},
+                    "embedding": {
+                        "type": "knn_vector",
+                        "dimension": VECTOR_DIMENSION,
+                        # faiss filters during the kNN search (see SearchFilters) and, unlike
+                        # Lucene on OpenSearch 2.9, takes more than 1024 dimensions. It has no
+                        # cosine space; embeddings are unit length, so l2 ranks the same
+                        "method": {
+                            "name": "hnsw",
+                            "engine": "faiss",
+                            "space_type": "l2"
+                        }
+                    },
+                    "pdf_loader": {"type": "keyword"},
+                    # Source regions of layout-parsed chunks, returned with hits but not searchable
+                    "bboxes": {"type": "object", "enabled": False},
+                    # Set by replace_document to tell a document's new chunks from its old ones
+                    "index_generation": {"type": "keyword"}
                 }
             }
-            self.client.indices.create(INDEX_NAME, body=mapping)
-            logger.info(f"Created index {INDEX_NAME} with mapping: {mapping}")
+        }
+        if ensure_index(self.client, self.index_name, mapping):
+            logger.info(f"Created index {self.index_name} with mapping: {mapping}")
+        else:
+            # Indexes created before bboxes existed: the field can be added in place
+            try:
+                with opensearch_call("put_mapping"):
+                    self.client.indices.put_mapping(index=self.index_name, body={
+                        "properties": {"bboxes": mapping["mappings"]["properties"]["bboxes"]}
+                    })
+            except Exception as e:
+                logger.warning(f"Could not add bboxes to {self.index_name}: {str(e)}")
 
-    def index_chunks(self, chunks: List[ParagraphChunk]):
-        """Index a list of chunks into OpenSearch using the bulk helper."""
+    @cached_property
+    def embeddings(self) -> EmbeddingProvider:
+        return get_embedding_provider(EMBEDDING_PROVIDER, EMBEDDING_MODEL, api_key=OPENAI_API_KEY,
+                                      base_url=OPENAI_BASE_URL, batch_size=EMBEDDING_BATCH_SIZE,
+                                      device=EMBEDDING_DEVICE, dimension=VECTOR_DIMENSION)
+
+    def embed_chunks(self, chunks: List[ParagraphChunk]) -> List[ParagraphChunk]:
+        """Embed the chunks' text with the configured provider (batched) and record its model."""
+        vectors = self.embeddings.embed([chunk.text_content for chunk in chunks], "chunk_embeddings")
+        for chunk, vector in zip(chunks, vectors):
+            chunk.set_embedding(vector)
+            chunk.embedding_model = self.embeddings.model
+        return chunks
+
+    def vector_dimension(self) -> Optional[int]:
+        """Dimension of the index's embedding field."""
+        with opensearch_call("get_mapping"):
+            mapping = self.client.indices.get_mapping(index=self.index_name)
+        properties = next(iter(mapping.values()), {}).get("mappings", {}).get("properties", {})
+        return properties.get("embedding", {}).get("dimension")
+
+    def _chunk_id(self, chunk: ParagraphChunk, generation: Optional[str] = None) -> str:
+        chunk_id = (f"{chunk.documentChecksum}-{chunk.embedding_model}-{chunk.page_number}-"
+                    f"{chunk.paragraph_or_chart_index}-{chunk.pdf_loader}-{self.chunking_strategy}")
+        # A generation gets its own ids, so a replacement never overwrites the chunks it replaces
+        return f"{chunk_id}-{generation}" if generation else chunk_id
+
+    def index_chunks(self, chunks: List[ParagraphChunk], generation: Optional[str] = None, refresh: bool = False,
+                     raise_on_failure: bool = False, bump_version: bool = True):
+        """
+        Index a list of chunks into OpenSearch using the bulk helper.
+        `generation` is stored on every chunk (see replace_document); with `refresh`
+        the call returns once the chunks are visible to search. Chunks rejected with
+        429 are retried with backoff; chunks that still fail are written to the
+        dead-letter file (see replay_dead_letters), or with `raise_on_failure` raise a
+        BulkIndexingError instead. Chunk ids are deterministic, so indexing the same
+        chunks again overwrites them. Loops indexing many batches pass
+        `bump_version=False` and call bump_version() once when done, as each bump is a
+        cluster-state update.
+        """
         try:
             # Build bulk actions list with deterministic _id for deduplication
             actions = [
                 {
                     "_op_type": "index",
-                    "_index": INDEX_NAME,
-                    "_id": f"{chunk.documentChecksum}-{chunk.embedding_model}-{chunk.page_number}-{chunk.paragraph_or_chart_index}-{chunk.pdf_loader}-{self.chunking_strategy}",
+                    "_index": self.index_name,
+                    "_id": self._chunk_id(chunk, generation),
                     "_source": {
                         "title": chunk.title,
                         "documentChecksum": chunk.documentChecksum,
@@ -76,7 +160,9 @@ class IndexingService:
                         "text_content": chunk.text_content,
                         "embedding_model": chunk.embedding_model,
                         "embedding": chunk.embedding,
-                        "pdf_loader": chunk.pdf_loader
+                        "pdf_loader": chunk.pdf_loader,
+                        "bboxes": chunk.bboxes,
+                        "index_generation": generation
                     }
                 }
                 for chunk in chunks
@@ -84,23 +170,82 @@ class IndexingService:
             
             if actions:
                 logger.info(f"Indexing {len(actions)} chunks")
-                success, failed = helpers.bulk(self.client, actions, stats_only=True)
+                success, failures = bulk_with_retries(self.client, actions, **self._bulk_options(),
+                                                      refresh="wait_for" if refresh else False)
                 logger.info(f"Successfully indexed: {success} documents")
-                if failed:
-                    logger.error(f"Encountered {failed} errors during bulk indexing")
+                if failures and raise_on_failure:
+                    raise BulkIndexingError(f"{len(failures)} chunks failed to index "
+                                            f"(first: {failures[0]['error']})", failures)
+                if failures:
+                    logger.error(f"Encountered {len(failures)} errors during bulk indexing "
+                                 f"(first: {failures[0]['error']}), see {self.dead_letters.path}")
+                    self.dead_letters.append(failures)
+                if success and bump_version:
+                    self.bump_version()
                 return {
                     'indexed': success,
-                    'errors': failed
+                    'errors': len(failures)
                 }
         except Exception as e:
             logger.error(f"Error during bulk indexing: {str(e)}")
             raise
 
+    @staticmethod
+    def _bulk_options() -> Dict:
+        return {"max_retries": INDEX_BULK_MAX_RETRIES, "initial_backoff": INDEX_BULK_INITIAL_BACKOFF,
+                "max_backoff": INDEX_BULK_MAX_BACKOFF}
+
+    def replay_dead_letters(self) -> Dict:
+        """
+        Index the dead-lettered chunks again (after fixing the cause, e.g. a mapping
+        conflict or a full disk). Chunks that fail again stay in the file.
+        """
+        result = self.dead_letters.replay(self.client, **self._bulk_options())
+        if result['indexed']:
+            self.bump_version()
+        return result
+
+    def bump_version(self) -> None:
+        """
+        Invalidate cached search results of the index after a write. A failure is only
+        logged: the write itself succeeded, and cached results expire after
+        RETRIEVAL_CACHE_TTL anyway.
+        """
+        try:
+            bump_index_version(self.client, self.index_name)
+        except Exception as e:
+            logger.warning(f"Could not bump the version of {self.index_name}: {str(e)}")
+
+    def copy_from(self, source_index: str) -> Dict:
+        """
+        Copy every chunk of `source_index`, embeddings included, into this index with a
+        server-side reindex, e.g. to move an nmslib index to this index's faiss mapping.
+        Waits for the task; returns the number of chunks copied and failed.
+        """
+        with opensearch_call("reindex"):
+            response = self.client.reindex(body={"source": {"index": source_index}, "dest": {"index": self.index_name}},
+                                           wait_for_completion=False, slices=INDEX_DELETE_SLICES, refresh=True)
+        task_id = response['task']
+        logger.info(f"Started reindex task {task_id} from {source_index} to {self.index_name}")
+        while True:
+            with opensearch_call("get_task"):
+                task = self.client.tasks.get(task_id=task_id)
+            status = task.get('task', {}).get('status', {})
+            copied = status.get('created', 0) + status.get('updated', 0)
+            if task.get('completed'):
+                break
+            logger.info(f"Reindex task {task_id}: {copied}/{status.get('total', 0)} copied")
+            time.sleep(INDEX_TASK_POLL_INTERVAL)
+        if copied:
+            self.bump_version()
+        return {'copied': copied,
+                'failed': len(task.get('response', {}).get('failures', [])) + (1 if 'error' in task else 0)}
+
     def get_index_stats(self) -> dict:
         """Get statistics about the index."""
         try:
-            stats = self.client.indices.stats(index=INDEX_NAME)
-            total = stats['indices'][INDEX_NAME]['total']
+            stats = self.client.indices.stats(index=self.index_name)
+            total = stats['_all']['total']
             return {
                 'doc_count': total['docs']['count'],
                 'store_size': total['store']['size_in_bytes']
@@ -112,7 +257,7 @@ class IndexingService:
         """Get a sample of documents from the index."""
         try:
             response = self.client.search(
-                index=INDEX_NAME,
+                index=self.index_name,
                 body={
                     "query": {"match_all": {}},
                     "size": size,
@@ -127,7 +272,7 @@ class IndexingService:
         """Check which checksums from the provided list already exist in the index."""
         try:
             response = self.client.search(
-                index=INDEX_NAME,
+                index=self.index_name,
                 body={
                     "size": 0,
                     "query": {
@@ -150,44 +295,150 @@ class IndexingService:
             print(f"Warning: Could not check checksums: {str(e)}")
             return set() 
 
-    def delete_by_document_ids(self, document_ids: List[str]) -> dict:
-        """Delete all chunks associated with given document IDs."""
-        try:
+    def _document_query(self, checksums: Optional[List[str]] = None, titles: Optional[List[str]] = None,
+                        exclude_generation: Optional[str] = None) -> Dict:
+        clauses = []
+        if checksums:
+            clauses.append({"terms": {"documentChecksum": list(checksums)}})
+        if titles:
+            clauses.append({"terms": {"title": list(titles)}})
+        if not clauses:
+            raise ValueError("Specify the checksums or titles of the documents to delete")
+        query = {"bool": {"should": clauses, "minimum_should_match": 1}}
+        if exclude_generation is not None:
+            query["bool"]["must_not"] = [{"term": {"index_generation": exclude_generation}}]
+        return query
+
+    def _delete_by_query(self, query: Dict, wait: bool) -> Dict:
+        """
+        Run delete_by_query as a background task, sliced and throttled
+        (INDEX_DELETE_SLICES, INDEX_DELETE_REQUESTS_PER_SECOND) so it doesn't starve
+        search traffic. Returns the task id, or the final task status with `wait`.
+        Without `wait`, a background thread follows the task and bumps the index
+        version once it has finished, so results cached while it ran are dropped.
+        """
+        with opensearch_call("delete_by_query"):
             response = self.client.delete_by_query(
-                index=INDEX_NAME,
-                body={
-                    "query": {
-                        "terms": {
-                            "document_id": document_ids
-                        }
-                    }
-                },
-                refresh=True  # Ensure deletion is immediately visible
+                index=self.index_name,
+                body={"query": query},
+                wait_for_completion=False,
+                slices=INDEX_DELETE_SLICES,
+                requests_per_second=INDEX_DELETE_REQUESTS_PER_SECOND,
+                conflicts="proceed",
+                refresh=True  # Deletions are visible once the task completes
             )
-            
+        task_id = response['task']
+        logger.info(f"Started delete task {task_id}")
+        self.bump_version()
+        if wait:
+            return self.wait_for_task(task_id)
+        threading.Thread(target=self._watch_task, args=(task_id,), name=f"delete-task-{task_id}",
+                         daemon=True).start()
+        return {'task_id': task_id, 'completed': False}
+
+    def _watch_task(self, task_id: str) -> None:
+        try:
+            self.wait_for_task(task_id)
+        except Exception as e:
+            logger.warning(f"Stopped following delete task {task_id}: {str(e)}")
+
+    def get_task(self, task_id: str) -> Dict:
+        """Progress of a delete task: documents matched, deleted and failed so far."""
+        with opensearch_call("get_task"):
+            response = self.client.tasks.get(task_id=task_id)
+        status = response.get('task', {}).get('status', {})
+        result = response.get('response', {})
+        total = status.get('total', 0)
+        done = status.get('deleted', 0) + status.get('version_conflicts', 0)
+        return {
+            'task_id': task_id,
+            'completed': response.get('completed', False),
+            'total': total,
+            'total_deleted': status.get('deleted', 0),
+            'version_conflicts': status.get('version_conflicts', 0),
+            'total_failed': len(result.get('failures', [])) + (1 if 'error' in response else 0),
+            'progress': round(done / total, 4) if total else (1.0 if response.get('completed') else 0.0)
+        }
+
+    def wait_for_task(self, task_id: str, poll_interval: float = INDEX_TASK_POLL_INTERVAL,
+                      timeout: Optional[float] = None) -> Dict:
+        """Poll a delete task until it completes (or `timeout` seconds pass)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.get_task(task_id)
+            if status['completed']:
+                # Searches cached while the task ran may still return the deleted chunks
+                if status['total_deleted']:
+                    self.bump_version()
+                return status
+            if deadline is not None and time.monotonic() >= deadline:
+                return status
+            logger.info(f"Delete task {task_id}: {status['total_deleted']}/{status['total']} deleted")
+            time.sleep(poll_interval)
+
+    def delete_documents(self, checksums: Optional[List[str]] = None, titles: Optional[List[str]] = None,
+                         wait: bool = False) -> Dict:
+        """Delete all chunks of the documents with the given checksums and/or titles."""
+        return self._delete_by_query(self._document_query(checksums, titles), wait)
+
+    def replace_document(self, chunks: List[ParagraphChunk], title: Optional[str] = None,
+                         wait: bool = False) -> Dict:
+        """
+        Replace a document's chunks without a window where it is half-indexed: the new
+        chunks are indexed under a new generation and made visible first, then the old
+        chunks (same checksum, or same `title` when a new version of a document replaces
+        an old one) are deleted in the background. The new chunks' ids include the
+        generation, so re-indexing the same checksum doesn't overwrite the old chunks:
+        if indexing fails, the chunks written for the new generation are removed and
+        the old ones are left untouched. The same happens if any chunk fails to index
+        (BulkIndexingError).
+        """
+        if not chunks:
+            raise ValueError("replace_document needs the document's new chunks")
+        checksums = sorted({chunk.documentChecksum for chunk in chunks})
+        generation = uuid.uuid4().hex
+        try:
+            # A partly indexed generation is rolled back too, rather than dead-lettered
+            indexed = self.index_chunks(chunks, generation=generation, refresh=True, raise_on_failure=True)
+        except Exception:
+            logger.error(f"Indexing failed, rolling back generation {generation} of {checksums}")
+            try:
+                self._delete_by_query({"term": {"index_generation": generation}}, wait=True)
+            except Exception as e:
+                logger.error(f"Rollback of generation {generation} failed, its chunks are still indexed: {str(e)}")
+            raise
+        query = self._document_query(checksums, [title] if title else None, exclude_generation=generation)
+        deleted = self._delete_by_query(query, wait)
+        return {'indexed': indexed['indexed'], 'generation': generation, **deleted}
+
+    def delete_other_embedding_models(self, embedding_model: str, wait: bool = False) -> Dict:
+        """Delete chunks embedded with any model other than `embedding_model` (after re-embedding)."""
+        return self._delete_by_query({"bool": {"must_not": [{"term": {"embedding_model": embedding_model}}]}}, wait)
+
+    def delete_by_document_ids(self, document_ids: List[str]) -> dict:
+        """Delete all chunks associated with given document IDs (document checksums)."""
+        try:
+            status = self.delete_documents(checksums=document_ids, wait=True)
             return {
-                'total_deleted': response['deleted'],
-                'total_failed': response['failures']
+                'total_deleted': status['total_deleted'],
+                'total_failed': status['total_failed']
             }
         except Exception as e:
-            raise Exception(f"Failed to delete documents: {str(e)}") 
+            raise Exception(f"Failed to delete documents: {str(e)}")
 
     def delete_all_documents(self) -> dict:
         """Delete all documents from the index."""
         try:
-            response = self.client.delete_by_query(
-                index=INDEX_NAME,
-                body={
-                    "query": {
-                        "match_all": {}
-                    }
-                },
-                refresh=True  # Ensure deletion is immediately visible
-            )
-            
+            status = self._delete_by_query({"match_all": {}}, wait=True)
             return {
-                'total_deleted': response['deleted'],
-                'total_failed': len(response.get('failures', []))
+                'total_deleted': status['total_deleted'],
+                'total_failed': status['total_failed']
             }
         except Exception as e:
-            raise Exception(f"Failed to delete all documents: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Failed to delete all documents: {str(e)}")
+
+    def drop_user(self) -> List[str]:
+        """Delete this user's papers index (all of their chunks) in one operation."""
+        if not self.user_id:
+            raise ValueError("drop_user needs an IndexingService created for a user")
+        return drop_tenant(self.client, [INDEX_NAME], self.user_id)
@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Process-wide metrics registry rendered in the Prometheus text format by /metrics.
+# Kept dependency-free so both the backend and the core services can import it.
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def values(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in self.values().items():
+            yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for key, value in self.values().items():
+            yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[idx] += 1
+            state[-1] += value
+
+    def count(self, **labels) -> int:
+        state = self._values.get(_label_key(labels))
+        return sum(state[:-1]) if state else 0
+
+    def total(self, **labels) -> float:
+        state = self._values.get(_label_key(labels))
+        return state[-1] if state else 0.0
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(key, {'le': str(bound)})} {cumulative}"
+            cumulative += state[len(self.buckets)]
+            yield f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {state[-1]}"
+            yield f"{self.name}_count{_format_labels(key)} {cumulative}"
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(cls, name: str, help: str, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, **kwargs)
+        return metric
+
+
+def counter(name: str, help: str) -> Counter:
+    """Get or create a counter in the process-wide registry."""
+    return _register(Counter, name, help)
+
+
+def gauge(name: str, help: str) -> Gauge:
+    """Get or create a gauge in the process-wide registry."""
+    return _register(Gauge, name, help)
+
+
+def histogram(name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a histogram in the process-wide registry."""
+    return _register(Histogram, name, help, buckets=buckets)
+
+
+def render_prometheus() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Shared metrics ---
+
+STAGE_SECONDS = histogram("stage_seconds", "Latency of instrumented pipeline and QA stages")
+OPENAI_REQUESTS = counter("openai_requests_total", "OpenAI API calls by operation, model and outcome")
+OPENAI_SECONDS = histogram("openai_request_seconds", "OpenAI API call latency")
+OPENAI_TOKENS = counter("openai_tokens_total", "OpenAI tokens used by operation, model and kind")
+OPENSEARCH_REQUESTS = counter("opensearch_requests_total", "OpenSearch calls by operation and outcome")
+OPENSEARCH_SECONDS = histogram("opensearch_request_seconds", "OpenSearch call latency")
+
+
+@contextmanager
+def timed(stage: str, **labels):
+    """Record the duration of the block in the stage_seconds histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+class _OpenAICall:
+    def __init__(self, operation: str, model: str):
+        self.operation = operation
+        self.model = model
+
+    def record_usage(self, usage) -> None:
+        """Record token usage from an OpenAI `usage` object or a dict of the same shape."""
+        if usage is None:
+            return
+        get = usage.get if isinstance(usage, dict) else lambda k: getattr(usage, k, None)
+        for kind, key in (("prompt", "prompt_tokens"), ("completion", "completion_tokens")):
+            tokens = get(key)
+            if tokens:
+                OPENAI_TOKENS.inc(tokens, operation=self.operation, model=self.model, kind=kind)
+
+
+@contextmanager
+def openai_call(operation: str, model: str):
+    """
+    Time an OpenAI API call and count it by outcome. The yielded object's
+    `record_usage` should be called with the response's usage to count tokens.
+    """
+    call = _OpenAICall(operation, model)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield call
+        outcome = "ok"
+    finally:
+        OPENAI_SECONDS.observe(time.perf_counter() - start, operation=operation, model=model)
+        OPENAI_REQUESTS.inc(operation=operation, model=model, outcome=outcome)
+
+
+@contextmanager
+def opensearch_call(operation: str):
+    """Time an OpenSearch call and count it by outcome."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        OPENSEARCH_SECONDS.observe(time.perf_counter() - start, operation=operation)
+        OPENSEARCH_REQUESTS.inc(operation=operation, outcome=outcome)
+
+
+def log_event(logger: logging.Logger, event: str, sample_rate: Optional[float] = None,
+              level: int = logging.INFO, **fields) -> None:
+    """
+    Emit a structured (JSON) log line for `event`, keeping only a random
+    `sample_rate` fraction of them (LOG_SAMPLE_RATE by default).
+    Use sample_rate=1.0 for events that must always be logged.
+    """
+    rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate < 1.0 and random.random() >= rate:
+        return
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, default=str))
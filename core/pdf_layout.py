@@ -0,0 +1,247 @@
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Layout-aware chunking with PyMuPDF. Text blocks are put in reading order per page
+# (columns left to right, split at blocks spanning the page width) and paragraphs
+# broken across a column or page boundary are merged back together. Ruled tables are
+# extracted as pipe-separated rows and images with a "Figure ..." caption become figure
+# chunks; both are slow on rich pages, so they run in a process pool over batches of
+# pages while the main process reads the text. Every chunk keeps its page number and
+# the bounding boxes it was built from. This module reads no settings itself.
+
+# Blocks at least this share of the page width are laid out across all columns
+FULL_WIDTH = 0.6
+# Top/bottom share of the page where bare page numbers are dropped
+MARGIN = 0.08
+# Images smaller than this (points, either side) are icons or decorations
+MIN_FIGURE_SIZE = 50
+# Largest vertical gap (points) between a figure and its caption
+CAPTION_GAP = 40
+# Merged paragraphs stop growing past this many characters
+MAX_PARAGRAPH_CHARS = 4000
+
+_PAGE_NUMBER = re.compile(r"^(page\s*)?\d+(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+_CAPTION = re.compile(r"^(fig(ure)?|chart|graph|plate)\.?\s*[\dIVXivx]", re.IGNORECASE)
+_TERMINAL = tuple('.!?:;"\'”)]')
+
+
+@dataclass(slots=True)
+class Block:
+    kind: str  # "text", "table" or "figure"
+    page: int  # 1-based
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    text: str
+
+    @property
+    def bbox(self) -> Dict:
+        return {"page": self.page, "x0": round(self.x0, 1), "y0": round(self.y0, 1),
+                "x1": round(self.x1, 1), "y1": round(self.y1, 1)}
+
+
+def _clean(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _inside(block: Block, rect: Tuple[float, float, float, float]) -> bool:
+    """True if the block's center lies within `rect`."""
+    cx, cy = (block.x0 + block.x1) / 2, (block.y0 + block.y1) / 2
+    return rect[0] <= cx <= rect[2] and rect[1] <= cy <= rect[3]
+
+
+def _text_blocks(page, page_num: int) -> List[Block]:
+    import fitz  # PyMuPDF, imported on first use as it is slow to load
+    flags = fitz.TEXTFLAGS_BLOCKS | fitz.TEXT_DEHYPHENATE
+    blocks = []
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks", flags=flags):
+        text = _clean(text)
+        if block_type == 0 and text:
+            blocks.append(Block("text", page_num, x0, y0, x1, y1, text))
+    return blocks
+
+
+def _columns(band: List[Block]) -> List[Block]:
+    """Blocks between two full-width blocks, column by column."""
+    columns: List[List] = []  # [x0, x1, blocks]
+    for block in sorted(band, key=lambda b: b.x0):
+        for column in columns:
+            if block.x0 < column[1] and block.x1 > column[0]:
+                column[0], column[1] = min(column[0], block.x0), max(column[1], block.x1)
+                column[2].append(block)
+                break
+        else:
+            columns.append([block.x0, block.x1, [block]])
+    return [block for column in sorted(columns, key=lambda c: c[0])
+            for block in sorted(column[2], key=lambda b: b.y0)]
+
+
+def reading_order(blocks: List[Block], page_width: float, page_height: float) -> List[Block]:
+    """A page's text blocks in reading order, without page numbers in the margins."""
+    blocks = [
+        b for b in blocks
+        if not (_PAGE_NUMBER.match(b.text) and (b.y1 < page_height * MARGIN or b.y0 > page_height * (1 - MARGIN)))
+    ]
+    ordered: List[Block] = []
+    band: List[Block] = []
+    for block in sorted(blocks, key=lambda b: (b.y0, b.x0)):
+        if block.x1 - block.x0 >= FULL_WIDTH * page_width:
+            ordered.extend(_columns(band))
+            band = []
+            ordered.append(block)
+        else:
+            band.append(block)
+    ordered.extend(_columns(band))
+    return ordered
+
+
+def _continues(previous: str, following: str) -> bool:
+    """True if `following` continues the sentence `previous` was cut off in."""
+    if len(previous) + len(following) > MAX_PARAGRAPH_CHARS:
+        return False
+    if previous.endswith("-") and following[:1].isalpha():
+        return True
+    return not previous.endswith(_TERMINAL) and following[:1].islower()
+
+
+def merge_paragraphs(blocks: Iterable[Block]) -> List[List[Block]]:
+    """Group text blocks in reading order into paragraphs, joining blocks cut off at a column or page break."""
+    paragraphs: List[List[Block]] = []
+    for block in blocks:
+        if paragraphs and _continues(paragraphs[-1][-1].text, block.text):
+            paragraphs[-1].append(block)
+        else:
+            paragraphs.append([block])
+    return paragraphs
+
+
+def _join(blocks: List[Block]) -> str:
+    text = blocks[0].text
+    for block in blocks[1:]:
+        if text.endswith("-") and block.text[:1].islower():
+            text = text[:-1] + block.text
+        else:
+            text = f"{text} {block.text}"
+    return text
+
+
+def _table_text(rows: List[List[Optional[str]]]) -> str:
+    lines = []
+    for i, row in enumerate(rows):
+        lines.append("| " + " | ".join(_clean(cell or "") for cell in row) + " |")
+        if i == 0:
+            lines.append("|" + " --- |" * len(row))
+    return "\n".join(lines)
+
+
+def _tables(page, page_num: int) -> List[Block]:
+    # Tables are found from their ruling lines; pages without vector graphics have none
+    if not page.get_cdrawings():
+        return []
+    tables = []
+    for table in page.find_tables().tables:
+        rows = [row for row in table.extract() if any(cell and cell.strip() for cell in row)]
+        if len(rows) < 2 or table.col_count < 2:
+            continue
+        tables.append(Block("table", page_num, *table.bbox, _table_text(rows)))
+    return tables
+
+
+def _figures(page, page_num: int) -> Tuple[List[Block], List[Tuple]]:
+    """Captioned images on a page, and the rects of the text blocks they took (captions, labels)."""
+    images = []
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        if x1 - x0 >= MIN_FIGURE_SIZE and y1 - y0 >= MIN_FIGURE_SIZE and (x0, y0, x1, y1) not in images:
+            images.append((x0, y0, x1, y1))
+    if not images:
+        return [], []
+    text = _text_blocks(page, page_num)
+    figures, claimed = [], []
+    for rect in images:
+        labels = [b for b in text if _inside(b, rect)]
+        candidates = [
+            b for b in text
+            if _CAPTION.match(b.text) and b.x0 < rect[2] and b.x1 > rect[0]
+            and (0 <= b.y0 - rect[3] <= CAPTION_GAP or 0 <= rect[1] - b.y1 <= CAPTION_GAP)
+        ]
+        if not candidates:
+            continue
+        # Captions below the figure are the convention; prefer the closest one
+        caption = min(candidates, key=lambda b: (b.y0 < rect[3], abs(b.y0 - rect[3])))
+        content = " ".join([caption.text, *(b.text for b in labels)])
+        figures.append(Block("figure", page_num, min(rect[0], caption.x0), min(rect[1], caption.y0),
+                             max(rect[2], caption.x1), max(rect[3], caption.y1), content))
+        claimed.extend((b.x0, b.y0, b.x1, b.y1) for b in [caption, *labels])
+    return figures, claimed
+
+
+def extract_regions(path: str, pages: List[int]) -> Dict[int, Tuple[List[Block], List[Tuple]]]:
+    """
+    Tables and figures of the given 0-based pages, with the rects of text they cover.
+    Runs in pool workers, so it opens the document itself.
+    """
+    import fitz  # PyMuPDF, imported on first use as it is slow to load
+    regions = {}
+    with fitz.open(path) as doc:
+        for page_index in pages:
+            page = doc[page_index]
+            tables = _tables(page, page_index + 1)
+            figures, claimed = _figures(page, page_index + 1)
+            claimed.extend((b.x0, b.y0, b.x1, b.y1) for b in tables)
+            regions[page_index] = (tables + figures, claimed)
+    return regions
+
+
+def layout_chunks(path: str, workers: int = 4, pages_per_task: int = 8) -> List[Dict]:
+    """
+    Chunks of a PDF in reading order: dicts with the chunk "type" ("text", "table" or
+    "figure"), the 1-based "page" it starts on, its "content" and the "bboxes" it
+    covers (one per block, in PDF points with the origin at the top left of the page).
+    Table and figure extraction is spread over `workers` processes in batches of
+    `pages_per_task` pages; small documents are handled in-process.
+    """
+    import fitz  # PyMuPDF, imported on first use as it is slow to load
+    with fitz.open(path) as doc:
+        page_count = doc.page_count
+        batches = [list(range(i, min(i + pages_per_task, page_count))) for i in range(0, page_count, pages_per_task)]
+        executor = None
+        if workers > 1 and len(batches) > 1:
+            # spawn: the parser runs in threads of the API process, which must not be forked
+            executor = ProcessPoolExecutor(max_workers=min(workers, len(batches)),
+                                           mp_context=multiprocessing.get_context("spawn"))
+        try:
+            futures = [executor.submit(extract_regions, path, batch) for batch in batches] if executor else []
+            pages = [(page.rect.width, page.rect.height, _text_blocks(page, page.number + 1)) for page in doc]
+            regions: Dict[int, Tuple[List[Block], List[Tuple]]] = {}
+            if executor:
+                for future in futures:
+                    regions.update(future.result())
+            else:
+                regions = extract_regions(path, list(range(page_count)))
+        finally:
+            if executor:
+                executor.shutdown()
+
+    text: List[Block] = []
+    others: List[Block] = []
+    for page_index, (width, height, blocks) in enumerate(pages):
+        page_regions, claimed = regions.get(page_index, ([], []))
+        blocks = [b for b in blocks if not any(_inside(b, rect) for rect in claimed)]
+        text.extend(reading_order(blocks, width, height))
+        others.extend(page_regions)
+
+    chunks = [{"type": "text", "page": paragraph[0].page, "content": _join(paragraph),
+               "bboxes": [b.bbox for b in paragraph]}
+              for paragraph in merge_paragraphs(text)]
+    chunks.extend({"type": b.kind, "page": b.page, "content": b.text, "bboxes": [b.bbox]} for b in others)
+    chunks.sort(key=lambda chunk: chunk["page"])
+    logger.info(f"Extracted {len(chunks)} chunks ({len(others)} tables and figures) from {page_count} pages of {path}")
+    return chunks
@@ -1,11 +1,11 @@
 import hashlib
 from pathlib import Path
-import fitz  # PyMuPDF
 from typing import List, Dict, Any
 from src.models.chunk import ParagraphChunk
-from src.config.settings import EMBEDDING_MODEL, PDF_LOADER_TYPE
+from src.config.settings import EMBEDDING_MODEL, PDF_LOADER_TYPE, PDF_WORKERS, PDF_PAGES_PER_TASK
 import re as regex
-from .pdf_loaders.factory import PDFLoaderFactory, PDFLoaderType
+
+LAYOUT_LOADER = "layout"
 
 class PDFParser:
     def __init__(self):
@@ -18,6 +18,7 @@ class PDFParser:
     def loader(self):
         """Lazy loader property that initializes the loader only when first accessed."""
         if self._loader is None:
+            from .pdf_loaders.factory import PDFLoaderFactory
             self._loader = PDFLoaderFactory.create(PDF_LOADER_TYPE)
         return self._loader
 
@@ -40,6 +41,9 @@ class PDFParser:
         Returns:
             List of ParagraphChunks
         """
+        if PDF_LOADER_TYPE == LAYOUT_LOADER:
+            return self.parse_pdf_layout(file_path, document_checksum)
+        from .pdf_loaders.factory import PDFLoaderFactory
         self.current_document_id = file_path.name
         self.current_checksum = document_checksum
         
@@ -57,19 +61,52 @@ class PDFParser:
                 title=self.current_document_id,
                 documentChecksum=self.current_checksum,
                 is_chart=(chunk_data.get('type') == 'table' or chunk_data.get('type') == 'image'),
-                page_number=chunk_data.get('offset', 0),  # Use offset instead of page number
+                # Loaders that don't track pages report 0 rather than a character offset
+                page_number=chunk_data.get('page_number') or chunk_data.get('page') or 0,
                 paragraph_or_chart_index=str(chunk_data.get('chunk_index')),
                 text_content=chunk_data.get('content'),
                 embedding_model=EMBEDDING_MODEL,
-                pdf_loader=loader_type
+                pdf_loader=loader_type,
+                bboxes=chunk_data.get('bboxes')
             )
             chunks.append(chunk)
         
         return chunks
 
+    def parse_pdf_layout(self, file_path: Path, document_checksum: str) -> List[ParagraphChunk]:
+        """
+        Parse a PDF with layout-aware chunking (see core.pdf_layout): paragraphs in
+        reading order, merged across column and page breaks, plus tables and captioned
+        figures as chart chunks. Chunks keep their page number and bounding boxes.
+        """
+        from .pdf_layout import layout_chunks
+        self.current_document_id = file_path.name
+        self.current_checksum = document_checksum
+
+        chunks = []
+        counters: Dict[tuple, int] = {}
+        prefixes = {'text': 'p', 'table': 'table-', 'figure': 'figure-'}
+        for chunk_data in layout_chunks(str(file_path), workers=PDF_WORKERS, pages_per_task=PDF_PAGES_PER_TASK):
+            # Indexes count per page and type, as in parse_pdf_old, so chunk ids stay stable
+            key = (chunk_data['page'], chunk_data['type'])
+            idx = counters.get(key, 0)
+            counters[key] = idx + 1
+            chunks.append(ParagraphChunk(
+                title=self.current_document_id,
+                documentChecksum=self.current_checksum,
+                is_chart=chunk_data['type'] != 'text',
+                page_number=chunk_data['page'],
+                paragraph_or_chart_index=f"{prefixes[chunk_data['type']]}{idx}",
+                text_content=chunk_data['content'],
+                embedding_model=EMBEDDING_MODEL,
+                pdf_loader=LAYOUT_LOADER,
+                bboxes=chunk_data['bboxes']
+            ))
+        return chunks
 
     def parse_pdf_old(self, file_path: Path, document_checksum: str) -> List[ParagraphChunk]:
         """Parse a PDF file and return a list of chunks."""
+        import fitz  # PyMuPDF, imported on first use as it is slow to load
         self.current_document_id = file_path.name
         self.current_checksum = document_checksum
         chunks = []
@@ -107,7 +144,8 @@ class PDFParser:
                     page_number=page_num,
                     paragraph_or_chart_index=f"p{idx}",
                     text_content=paragraph,
-                    embedding_model=EMBEDDING_MODEL
+                    embedding_model=EMBEDDING_MODEL,
+                    pdf_loader="fitz"
                 )
                 chunks.append(chunk)
 
@@ -121,7 +159,8 @@ class PDFParser:
                     page_number=page_num,
                     paragraph_or_chart_index=f"chart-{img_idx}",
                     text_content=f"Chart or figure found on page {page_num}",
-                    embedding_model=EMBEDDING_MODEL
+                    embedding_model=EMBEDDING_MODEL,
+                    pdf_loader="fitz"
                 )
                 chunks.append(chunk)
 
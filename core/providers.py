@@ -0,0 +1,234 @@
+import hashlib
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+from .metrics import openai_call, timed
+
+logger = logging.getLogger(__name__)
+
+# Embedding and completion backends behind one interface, so QA, theme extraction and
+# re-embedding don't depend on the OpenAI API directly. Providers are chosen by name
+# (EMBEDDING_PROVIDER / COMPLETION_PROVIDER in config/settings.py):
+#   "openai"                 OpenAI API, or any OpenAI-compatible server (vLLM, llama.cpp,
+#                            Ollama, ...) when a base_url is set
+#   "sentence-transformers"  local CPU/GPU embeddings with batched inference (embeddings only)
+#   "fake"                   deterministic, offline, for tests and benchmarks
+# This module reads no settings itself; callers pass them in.
+
+
+class ProviderError(Exception):
+    """A provider request failed."""
+
+
+class UnsupportedResponseFormat(ProviderError):
+    """The model rejected the requested response_format."""
+
+
+class EmbeddingProvider:
+    name = ""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def embed(self, texts: Sequence[str], operation: str = "embeddings") -> List[List[float]]:
+        """Embeddings of `texts`, in order."""
+        raise NotImplementedError
+
+
+class CompletionProvider:
+    name = ""
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def complete(self, messages: List[Dict], operation: str = "completion", temperature: float = 0.0,
+                 max_tokens: Optional[int] = None, response_format: Optional[Dict] = None) -> str:
+        """Content of the model's reply to chat `messages`."""
+        raise NotImplementedError
+
+    def prompt(self, prompt: str, operation: str = "completion", **kwargs) -> str:
+        return self.complete([{"role": "user", "content": prompt}], operation, **kwargs)
+
+
+# --- OpenAI (and OpenAI-compatible servers) ---
+
+def _openai_client(api_key: Optional[str], base_url: Optional[str]):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key or "not-needed", base_url=base_url)
+
+
+class OpenAIEmbeddings(EmbeddingProvider):
+    name = "openai"
+    # Inputs per request accepted by the embeddings endpoint
+    max_batch_size = 2048
+
+    def __init__(self, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 batch_size: int = 256, client=None):
+        super().__init__(model)
+        self.batch_size = min(batch_size, self.max_batch_size)
+        self.client = client or _openai_client(api_key, base_url)
+
+    def embed(self, texts: Sequence[str], operation: str = "embeddings") -> List[List[float]]:
+        import openai
+        embeddings: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            try:
+                with openai_call(operation, self.model) as call:
+                    response = self.client.embeddings.create(model=self.model, input=list(texts[i:i + self.batch_size]))
+                    call.record_usage(response.usage)
+            except openai.OpenAIError as e:
+                raise ProviderError(str(e)) from e
+            embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return embeddings
+
+
+class OpenAICompletions(CompletionProvider):
+    name = "openai"
+
+    def __init__(self, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None, client=None):
+        super().__init__(model)
+        self.client = client or _openai_client(api_key, base_url)
+
+    def complete(self, messages: List[Dict], operation: str = "completion", temperature: float = 0.0,
+                 max_tokens: Optional[int] = None, response_format: Optional[Dict] = None) -> str:
+        import openai
+        kwargs = {"model": self.model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        if response_format is not None:
+            kwargs["response_format"] = response_format
+        try:
+            with openai_call(operation, self.model) as call:
+                response = self.client.chat.completions.create(**kwargs)
+                call.record_usage(response.usage)
+        except openai.BadRequestError as e:
+            if response_format is not None and ("response_format" in str(e) or "json_schema" in str(e)):
+                raise UnsupportedResponseFormat(str(e)) from e
+            raise ProviderError(str(e)) from e
+        except openai.OpenAIError as e:
+            raise ProviderError(str(e)) from e
+        return response.choices[0].message.content
+
+
+# --- Local models ---
+
+class SentenceTransformerEmbeddings(EmbeddingProvider):
+    """
+    Embeddings from a sentence-transformers model (e.g. all-MiniLM-L6-v2, 384 dims) run
+    in-process. Texts are encoded in batches of `batch_size`; the model is loaded on
+    first use. Vectors are L2-normalized, as the OpenAI ones are.
+    """
+    name = "sentence-transformers"
+
+    def __init__(self, model: str, batch_size: int = 64, device: str = "cpu"):
+        super().__init__(model)
+        self.batch_size = batch_size
+        self.device = device
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ProviderError("The sentence-transformers provider needs `pip install sentence-transformers`") from e
+            try:
+                self._model = SentenceTransformer(self.model, device=self.device)
+            except Exception as e:  # download, unknown model, device (torch raises several types)
+                raise ProviderError(f"Could not load {self.model}: {e}") from e
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self._load().get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str], operation: str = "embeddings") -> List[List[float]]:
+        import numpy as np
+        model = self._load()
+        try:
+            with timed(operation, provider=self.name):
+                vectors = model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                       normalize_embeddings=True, show_progress_bar=False)
+        except Exception as e:  # e.g. out of memory on the device
+            raise ProviderError(str(e)) from e
+        return vectors.astype(np.float32).tolist()
+
+
+# --- Deterministic fakes ---
+
+class FakeEmbeddings(EmbeddingProvider):
+    """Unit vectors seeded by a hash of each text: equal texts get equal embeddings."""
+    name = "fake"
+
+    def __init__(self, model: str = "fake-embedding", dimension: int = 1536):
+        super().__init__(model)
+        self.dimension = dimension
+
+    def embed(self, texts: Sequence[str], operation: str = "embeddings") -> List[List[float]]:
+        import numpy as np
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big")
+            vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+
+
+class FakeCompletions(CompletionProvider):
+    """
+    Replies built from the words of the last message, always the same for the same
+    input: a theme/suggestions JSON object when a response_format is requested, a JSON
+    array of queries when the prompt asks for one, and plain text otherwise.
+    """
+    name = "fake"
+
+    def __init__(self, model: str = "fake-completion"):
+        super().__init__(model)
+
+    def complete(self, messages: List[Dict], operation: str = "completion", temperature: float = 0.0,
+                 max_tokens: Optional[int] = None, response_format: Optional[Dict] = None) -> str:
+        prompt = messages[-1]["content"]
+        words = [w.strip('.,:;"\'?!()[]{}') for w in prompt.split()[-40:]]
+        words = [w for w in words if len(w) > 3] or ["general"]
+        if response_format is not None:
+            return json.dumps({
+                "theme": " ".join(words[:3]).title(),
+                "subthemes": words[3:6],
+                "summary": " ".join(words[:25]),
+                "nodeType": "informational",
+                "suggestions": [" ".join(words[i:i + 2]).title() for i in range(0, min(len(words), 10), 2)]
+            })
+        if "JSON array" in prompt:
+            return json.dumps([" ".join(words[-6:])])
+        return f"{' '.join(words[:30])} [Ref1]"
+
+
+# --- Selection ---
+
+EMBEDDING_PROVIDERS = ("openai", "sentence-transformers", "fake")
+COMPLETION_PROVIDERS = ("openai", "fake")
+
+
+@lru_cache(maxsize=None)
+def get_embedding_provider(name: str, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                           batch_size: int = 256, device: str = "cpu", dimension: int = 1536) -> EmbeddingProvider:
+    """Shared embedding provider for the given configuration."""
+    if name == "openai":
+        return OpenAIEmbeddings(model, api_key=api_key, base_url=base_url, batch_size=batch_size)
+    if name == "sentence-transformers":
+        return SentenceTransformerEmbeddings(model, batch_size=batch_size, device=device)
+    if name == "fake":
+        return FakeEmbeddings(model, dimension=dimension)
+    raise ValueError(f"Unknown embedding provider {name!r}, expected one of {EMBEDDING_PROVIDERS}")
+
+
+@lru_cache(maxsize=None)
+def get_completion_provider(name: str, model: str, api_key: Optional[str] = None,
+                            base_url: Optional[str] = None) -> CompletionProvider:
+    """Shared completion provider for the given configuration."""
+    if name == "openai":
+        return OpenAICompletions(model, api_key=api_key, base_url=base_url)
+    if name == "fake":
+        return FakeCompletions(model)
+    raise ValueError(f"Unknown completion provider {name!r}, expected one of {COMPLETION_PROVIDERS}")
@@ -1,10 +1,7 @@
-from typing import List
-from openai import OpenAI
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 import json
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from opensearchpy import OpenSearch
-from colorama import Fore, Style
 import re
 import logging
 from src.config.settings import (
@@ -16,68 +13,209 @@ from src.config.settings import (
     INDEX_NAME,
     COMPLETION_MODEL,
     MAX_CHUNKS_PER_QUERY,
-    EMBEDDING_MODEL
+    EMBEDDING_MODEL,
+    EMBEDDING_PROVIDER,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DEVICE,
+    COMPLETION_PROVIDER,
+    OPENAI_BASE_URL,
+    VECTOR_DIMENSION,
+    QA_BATCH_CONCURRENCY,
+    QA_BATCH_EMBED_SIZE,
+    QA_BATCH_SEARCH_SIZE
 )
+from .context_builder import ContextBuilder, as_vector
+from .metrics import opensearch_call, timed
+from .providers import CompletionProvider, EmbeddingProvider, get_completion_provider, get_embedding_provider
+from .retrieval_cache import read_index_version, retrieval_cache
+from .search_filters import DEFAULT_FILTERS, SearchFilters, knn_method
+from .tenancy import tenant_index
 
 logger = logging.getLogger(__name__)
 
+# Score of a cosine similarity of 0 between unit vectors in each kNN space: hits
+# below it are unrelated to the question
+MIN_SCORES = {"cosinesimil": .5, "l2": 1 / 3, "innerproduct": 1.0}
+
 class QAService:
-    def __init__(self):
-        self.client = OpenSearch(
+    # ANSI colors for terminal output; disable for files and other non-terminal consumers
+    colors = True
+    # Papers index searched; a user's own index when created with a user_id (see core.tenancy)
+    index_name = INDEX_NAME
+
+    def __init__(self, colors: bool = True, user_id: Optional[str] = None):
+        self.colors = colors
+        self.index_name = tenant_index(INDEX_NAME, user_id)
+
+    # Clients (and the model SDK/colorama imports behind them) are created on
+    # first use, so constructing the service is cheap and doesn't need OpenSearch up.
+
+    @cached_property
+    def client(self):
+        from opensearchpy import OpenSearch
+        from .serialization import get_serializer
+        return OpenSearch(
             hosts=[{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
             http_auth=(OPENSEARCH_USER, OPENSEARCH_PASSWORD),
-            use_ssl=False
+            use_ssl=False,
+            serializer=get_serializer()
         )
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
-        self.llm = ChatOpenAI(
-            model_name=COMPLETION_MODEL,
-            temperature=0,
-            openai_api_key=OPENAI_API_KEY
-        )
-        # Add colors list for cycling through reference colors
-        self.ref_colors = [Fore.CYAN, Fore.GREEN, Fore.YELLOW, Fore.MAGENTA, Fore.BLUE, Fore.RED, Fore.LIGHTBLUE_EX]
 
-    def _search_similar_chunks(self, question: str) -> List[dict]:
-        """Search for similar chunks using hybrid search (KNN + text similarity)."""
-        # Get the embedding for the input question
-        response = self.openai_client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=question
-        )
-        question_embedding = response.data[0].embedding
+    @cached_property
+    def embeddings(self) -> EmbeddingProvider:
+        return get_embedding_provider(EMBEDDING_PROVIDER, EMBEDDING_MODEL, api_key=OPENAI_API_KEY,
+                                      base_url=OPENAI_BASE_URL, batch_size=EMBEDDING_BATCH_SIZE,
+                                      device=EMBEDDING_DEVICE, dimension=VECTOR_DIMENSION)
+
+    @cached_property
+    def completions(self) -> CompletionProvider:
+        return get_completion_provider(COMPLETION_PROVIDER, COMPLETION_MODEL,
+                                       api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+
+    @cached_property
+    def ref_colors(self) -> List[str]:
+        """Colors cycled through for reference tags."""
+        from colorama import Fore
+        return [Fore.CYAN, Fore.GREEN, Fore.YELLOW, Fore.MAGENTA, Fore.BLUE, Fore.RED, Fore.LIGHTBLUE_EX]
 
+    @cached_property
+    def context_builder(self) -> ContextBuilder:
+        return ContextBuilder()
+
+    def _embed(self, text: str) -> List[float]:
+        """Embedding of a question or query."""
+        return self.embeddings.embed([text], "embeddings")[0]
+
+    def _embed_batch(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        """
+        Embeddings of many queries, QA_BATCH_EMBED_SIZE per call. The queries of a failed
+        call get None, and their error by position.
+        """
+        embeddings: List[Optional[List[float]]] = []
+        errors: Dict[int, str] = {}
+        for i in range(0, len(texts), QA_BATCH_EMBED_SIZE):
+            batch = texts[i:i + QA_BATCH_EMBED_SIZE]
+            try:
+                embeddings.extend(self.embeddings.embed(batch, "embeddings_batch"))
+            except Exception as e:
+                logger.error(f"Failed to embed {len(batch)} queries: {str(e)}")
+                embeddings.extend([None] * len(batch))
+                errors.update((i + j, str(e)) for j in range(len(batch)))
+        return embeddings, errors
+
+    def _search_body(self, question_embedding: List[float], filters: SearchFilters = DEFAULT_FILTERS) -> dict:
         # Build hybrid query with both vector and text search
-        hybrid_query = {
-            "knn": {
-                "embedding": {
-                    "vector": question_embedding,
-                    "k": 75,
-                    "boost": 1.0
-                }
-            }
+        knn = {
+            "vector": question_embedding,
+            "k": 75,
+            "boost": 1.0
         }
-
+        # Filters are applied during the kNN search rather than to its top k, where the engine supports it
+        method = knn_method(self.client, self.index_name)
+        hybrid_query = filters.knn_query("embedding", knn, method["engine"])
         # Run the search query with lower min_score
-        response = self.client.search(
-            index=INDEX_NAME,
-            body={
-                "query": hybrid_query,
-                "size": MAX_CHUNKS_PER_QUERY,
-                "_source": ["text_content", "title", "page_number"],
-                "min_score": .5
-            }
-        )
+        return {
+            "query": hybrid_query,
+            "size": MAX_CHUNKS_PER_QUERY,
+            # Chunk embeddings are used to rerank and de-duplicate context
+            "_source": ["text_content", "title", "page_number", "embedding", "documentChecksum",
+                        "is_chart", "paragraph_or_chart_index", "embedding_model", "pdf_loader", "bboxes"],
+            "min_score": self._min_score()
+        }
 
-        results = response['hits']['hits']
-        # Log scores for debugging
+    def _min_score(self) -> float:
+        return MIN_SCORES.get(knn_method(self.client, self.index_name)["space_type"], .5)
+
+    def _cache_key(self, question_embedding: List[float], filters: SearchFilters = DEFAULT_FILTERS) -> str:
+        # Identical (or near-identical) questions reuse results until the index changes
+        version = retrieval_cache.index_version(self.index_name, lambda: read_index_version(self.client, self.index_name))
+        return retrieval_cache.key(question_embedding, index=self.index_name, version=version,
+                                   k=75, size=MAX_CHUNKS_PER_QUERY, min_score=self._min_score(), filters=filters)
+
+    def _store_results(self, cache_key: str, results: List[dict]) -> List[dict]:
         for hit in results:
+            # float32 arrays take a fraction of the memory of float lists while cached
+            hit['_source']['embedding'] = as_vector(hit['_source'].get('embedding'))
+            # Log scores for debugging
             logger.debug(f"Score: {hit['_score']}, Title: {hit['_source']['title']}")
-        
+        retrieval_cache.put(cache_key, results)
+        return list(results)
+
+    def _search_similar_chunks(self, question: str, question_embedding: Optional[List[float]] = None,
+                               filters: SearchFilters = DEFAULT_FILTERS) -> List[dict]:
+        """Search for similar chunks using hybrid search (KNN + text similarity)."""
+        # Get the embedding for the input question
+        if question_embedding is None:
+            question_embedding = self._embed(question)
+
+        cache_key = self._cache_key(question_embedding, filters)
+        cached = retrieval_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Found {len(cached)} cached results for question: {question}")
+            return list(cached)
+
+        with opensearch_call("knn_search"):
+            response = self.client.search(index=self.index_name, body=self._search_body(question_embedding, filters))
+
+        results = response['hits']['hits']
         logger.info(f"Found {len(results)} results for question: {question}")
-        return results
+        return self._store_results(cache_key, results)
+
+    def _search_batch(self, embeddings: List[Optional[List[float]]],
+                      filters: SearchFilters = DEFAULT_FILTERS) -> Tuple[List[List[dict]], Dict[int, str]]:
+        """
+        Results for many query embeddings, using msearch (QA_BATCH_SEARCH_SIZE per request)
+        for cache misses. Queries without an embedding are skipped; queries whose search
+        failed get no results, and their error by position.
+        """
+        results: List[List[dict]] = [[] for _ in embeddings]
+        errors: Dict[int, str] = {}
+        misses = []
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                continue
+            try:
+                cache_key = self._cache_key(embedding, filters)
+            except Exception as e:
+                errors[i] = str(e)
+                continue
+            cached = retrieval_cache.get(cache_key)
+            if cached is not None:
+                results[i] = list(cached)
+            else:
+                misses.append((i, cache_key, embedding))
+
+        for start in range(0, len(misses), QA_BATCH_SEARCH_SIZE):
+            batch = misses[start:start + QA_BATCH_SEARCH_SIZE]
+            try:
+                body = []
+                for _, _, embedding in batch:
+                    body.append({"index": self.index_name})
+                    body.append(self._search_body(embedding, filters))
+                with opensearch_call("knn_msearch"):
+                    response = self.client.msearch(body=body)
+            except Exception as e:
+                logger.error(f"msearch of {len(batch)} queries failed: {str(e)}")
+                errors.update((i, str(e)) for i, _, _ in batch)
+                continue
+            for (i, cache_key, _), item in zip(batch, response['responses']):
+                if 'error' in item:
+                    logger.error(f"Search failed in msearch: {item['error']}")
+                    error = item['error']
+                    errors[i] = error.get('reason', str(error)) if isinstance(error, dict) else str(error)
+                    continue
+                results[i] = self._store_results(cache_key, item['hits']['hits'])
+        return results, errors
+
+    def _invoke_llm(self, operation: str, prompt: str) -> str:
+        """Invoke the completion model (latency and token usage are recorded by the provider)."""
+        return self.completions.prompt(prompt, operation)
 
     def _highlight_references(self, text: str) -> str:
-        """Highlight reference tags with cycling colors."""
+        """Highlight reference tags with cycling colors (unless colors are disabled)."""
+        if not self.colors:
+            return text
+        from colorama import Style
         # Find all unique reference numbers
         pattern = r'\[Ref(\d+)\]'
         matches = re.finditer(pattern, text)
@@ -98,18 +236,33 @@ class QAService:
         
         return result
 
-    def answer_question(self, question: str) -> str:
-        """Answer a question using the indexed papers."""
+    def answer_question(self, question: str, filters: SearchFilters = DEFAULT_FILTERS) -> str:
+        """Answer a question using the indexed papers matching `filters`."""
         # Refine user question, breakdown into one or many searchable queries
-        queries = self._refine_question(question)
+        with timed("qa_refine"):
+            queries = self._refine_question(question)
 
         # for each query, get relevant chunks
         similar_chunks = []
-        for query in queries:
-            # Get relevant chunks
-            partial_chunks = self._search_similar_chunks(query)
-            similar_chunks.extend(partial_chunks)
-            
+        query_embeddings = []
+        with timed("qa_retrieval"):
+            for query in queries:
+                # Get relevant chunks
+                query_embedding = self._embed(query)
+                query_embeddings.append(query_embedding)
+                partial_chunks = self._search_similar_chunks(query, query_embedding, filters)
+                similar_chunks.extend(partial_chunks)
+
+        # De-duplicate, rerank and pack the chunks into the context token budget
+        with timed("qa_context"):
+            similar_chunks = self.context_builder.build(similar_chunks, query_embeddings).hits
+
+        return self._generate_answer(question, similar_chunks)
+
+    def _generate_answer(self, question: str, similar_chunks: List[dict]) -> str:
+        """Answer from the context chunks, or from general knowledge if there are none."""
+        from langchain.prompts import PromptTemplate
+
         if not similar_chunks:
             # Fallback to general knowledge with a disclaimer
             prompt_template = """
@@ -125,11 +278,14 @@ class QAService:
                 input_variables=["question"]
             )
 
-            response = self.llm.invoke(
-                prompt.format(question=question)
-            ).content
+            with timed("qa_generation"):
+                response = self._invoke_llm("qa_fallback_answer", prompt.format(question=question))
 
-            return f"{Fore.YELLOW}Note: No relevant documents found in the index. Providing a general answer:{Style.RESET_ALL}\n\n{response}"
+            note = "Note: No relevant documents found in the index. Providing a general answer:"
+            if self.colors:
+                from colorama import Fore, Style
+                note = f"{Fore.YELLOW}{note}{Style.RESET_ALL}"
+            return f"{note}\n\n{response}"
 
         # Prepare context from chunks
         context = "\n\n".join([
@@ -159,24 +315,30 @@ class QAService:
         )
 
         # Get answer from LLM using invoke instead of predict
-        response = self.llm.invoke(
-            prompt.format(
-                context=context,
-                question=question
+        with timed("qa_generation"):
+            response = self._invoke_llm(
+                "qa_answer",
+                prompt.format(
+                    context=context,
+                    question=question
+                )
             )
-        ).content  # Add .content to get the string response
 
         # Add reference legend
         reference_legend = "\n\nReferences:"
         for idx, hit in enumerate(similar_chunks):
             source = hit['_source']
-            reference_legend += f"\n[Ref{idx+1}] Document: {source['title']}, Page: {source['page_number']}"
+            reference_legend += f"\n[Ref{idx+1}] Document: {source['title']}"
+            # Chunks from loaders without page tracking have page_number 0
+            if source.get('page_number'):
+                reference_legend += f", Page: {source['page_number']}"
 
         response_with_refs = response + reference_legend
         return self._highlight_references(response_with_refs)
     
     def _refine_question(self, question: str) -> List[str]:
         """Refine user question into one or many searchable queries."""
+        from langchain.prompts import PromptTemplate
 
         prompt_template = """
         I have a RAG system for answering questions about a knowledge base.
@@ -199,14 +361,82 @@ class QAService:
             input_variables=["question"]
         )
 
-        response = self.llm.invoke(
+        response = self._invoke_llm(
+            "qa_refine",
             prompt.format(
                 question=question
             )
-        ).content
+        )
 
         # convert response to list of strings
         list_of_queries = json.loads(response)
 
         logger.info(f"Refined question into {len(list_of_queries)} queries: {list_of_queries}")
         return list_of_queries
+
+    def answer_questions(self, questions: List[str], concurrency: int = QA_BATCH_CONCURRENCY,
+                         filters: SearchFilters = DEFAULT_FILTERS) -> Iterator[dict]:
+        """
+        Answer many questions, yielding one result dict per question in input order.
+        Refinement and generation run on up to `concurrency` threads; query embeddings
+        are requested in batches and searches go through msearch. A question that fails
+        yields a result with an "error" instead of stopping the batch.
+        """
+        # Create the shared clients before they are used from worker threads
+        for client in ("completions", "embeddings", "client"):
+            getattr(self, client)
+
+        def refine(question: str) -> List[str]:
+            with timed("qa_refine"):
+                return self._refine_question(question)
+
+        def generate(item: dict) -> dict:
+            if "error" in item:
+                item.pop("hits", None)
+                item.pop("embeddings", None)
+                return item
+            try:
+                with timed("qa_context"):
+                    context = self.context_builder.build(item.pop("hits"), item.pop("embeddings"))
+                with timed("qa_generation"):
+                    answer = self._generate_answer(item["question"], context.hits)
+            except Exception as e:
+                logger.error(f"Failed to answer question {item['question']!r}: {str(e)}")
+                return {"question": item["question"], "queries": item["queries"], "error": str(e)}
+            item["answer"] = answer
+            item["references"] = [
+                {"ref": idx + 1, "title": hit['_source']['title'], "page_number": hit['_source']['page_number'],
+                 "bboxes": hit['_source'].get('bboxes')}
+                for idx, hit in enumerate(context.hits)
+            ]
+            item["context_tokens"] = context.packed_tokens
+            item["context_tokens_saved"] = context.tokens_saved
+            return item
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            items = []
+            for question, future in zip(questions, [executor.submit(refine, q) for q in questions]):
+                try:
+                    items.append({"question": question, "queries": future.result()})
+                except Exception as e:
+                    logger.error(f"Failed to refine question {question!r}: {str(e)}")
+                    items.append({"question": question, "queries": [], "error": str(e)})
+
+            # Embed and search every query of every question in batches
+            queries = [query for item in items for query in item["queries"]]
+            with timed("qa_retrieval"):
+                embeddings, errors = self._embed_batch(queries) if queries else ([], {})
+                hits, search_errors = self._search_batch(embeddings, filters) if embeddings else ([], {})
+            errors.update(search_errors)
+            offset = 0
+            for item in items:
+                count = len(item["queries"])
+                failed = [errors[i] for i in range(offset, offset + count) if i in errors]
+                if failed and "error" not in item:
+                    logger.error(f"Failed to retrieve context for question {item['question']!r}: {failed[0]}")
+                    item["error"] = failed[0]
+                item["embeddings"] = embeddings[offset:offset + count]
+                item["hits"] = [hit for partial in hits[offset:offset + count] for hit in partial]
+                offset += count
+
+            yield from executor.map(generate, items)
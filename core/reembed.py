@@ -0,0 +1,101 @@
+"""
+Re-embed the papers index with the configured embedding provider.
+
+    EMBEDDING_PROVIDER=sentence-transformers EMBEDDING_MODEL=all-MiniLM-L6-v2 \
+        VECTOR_DIMENSION=384 OPENSEARCH_INDEX=papers-minilm \
+        python -m src.core.reembed --source-index papers-index --delete-old
+
+Chunks embedded with a different model are read with a scroll, embedded in batches
+and indexed again under the provider's model name (chunk ids include it). Searches
+only use chunks of the configured EMBEDDING_MODEL (see SearchFilters), so they switch
+over as soon as a document's new chunks are indexed. A model with another dimension
+needs its own index: pass the current one as --source-index. An interrupted run can
+simply be started again, as chunks already re-embedded no longer match the scroll.
+Chunks that fail to index are dead-lettered (see core.index_papers).
+
+With --copy, every chunk of --source-index is copied with its stored embedding into
+the configured index instead (a server-side reindex, nothing is re-embedded). This
+moves papers indexes created with the nmslib engine, which can't filter during the
+kNN search, to the current faiss mapping:
+
+    OPENSEARCH_INDEX=papers-faiss python -m src.core.reembed --source-index papers-index --copy
+"""
+import argparse
+import logging
+import sys
+import time
+from typing import List
+from opensearchpy import helpers
+from ..models.chunk import ParagraphChunk
+from .indexing_service import IndexingService
+
+logger = logging.getLogger(__name__)
+
+CHUNK_FIELDS = ("title", "documentChecksum", "is_chart", "page_number", "paragraph_or_chart_index",
+                "text_content", "embedding_model", "pdf_loader", "bboxes")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Re-embed indexed chunks with the configured embedding provider")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks embedded and indexed per batch")
+    parser.add_argument("--source-index", help="Read chunks from this index (default: the target index)")
+    parser.add_argument("--delete-old", action="store_true",
+                        help="Delete chunks of other models from the target index afterwards")
+    parser.add_argument("--copy", action="store_true",
+                        help="Copy --source-index into the target index with its embeddings, without re-embedding")
+    parser.add_argument("--user", help="Re-embed this user's papers index instead of the shared one")
+    args = parser.parse_args()
+    if args.copy and not args.source_index:
+        parser.error("--copy needs --source-index")
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    service = IndexingService(user_id=args.user)
+    if args.copy:
+        start = time.perf_counter()
+        result = service.copy_from(args.source_index)
+        print(f"Copied {result['copied']} chunks from {args.source_index} to {service.index_name} "
+              f"in {time.perf_counter() - start:.1f}s ({result['failed']} failed)", file=sys.stderr)
+        return 1 if result['failed'] else 0
+    model = service.embeddings.model
+    dimension = len(service.embeddings.embed(["dimension probe"])[0])
+    index_dimension = service.vector_dimension()
+    if index_dimension and index_dimension != dimension:
+        print(f"{model} produces {dimension}-dim vectors but {service.index_name} stores {index_dimension}; "
+              "set OPENSEARCH_INDEX to a new index and VECTOR_DIMENSION, and pass --source-index", file=sys.stderr)
+        return 1
+
+    query = {"query": {"bool": {"must_not": [{"term": {"embedding_model": model}}]}}}
+    start = time.perf_counter()
+    done = 0
+    failed = 0
+    batch: List[ParagraphChunk] = []
+
+    def flush() -> None:
+        nonlocal done, failed
+        result = service.index_chunks(service.embed_chunks(batch), bump_version=False)
+        done += result['indexed']
+        failed += result['errors']
+        batch.clear()
+        print(f"{done} chunks re-embedded ({done / (time.perf_counter() - start):.0f}/s)", file=sys.stderr, flush=True)
+
+    for hit in helpers.scan(service.client, index=args.source_index or service.index_name, query=query,
+                            _source=list(CHUNK_FIELDS), size=args.batch_size):
+        source = hit["_source"]
+        batch.append(ParagraphChunk(**{field: source.get(field) for field in CHUNK_FIELDS}))
+        if len(batch) >= args.batch_size:
+            flush()
+    if batch:
+        flush()
+    # Batches don't invalidate cached searches one by one, the whole run does once
+    if done:
+        service.bump_version()
+
+    if args.delete_old and not failed:
+        service.delete_other_embedding_models(model, wait=True)
+    print(f"Re-embedded {done} chunks with {model} in {time.perf_counter() - start:.1f}s ({failed} failed)",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence
+from ..config.settings import RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_VERSION_TTL
+from .metrics import counter, gauge, opensearch_call
+
+RETRIEVAL_CACHE_REQUESTS = counter("retrieval_cache_requests_total", "Retrieval cache lookups by outcome (hit/miss)")
+RETRIEVAL_CACHE_HIT_RATIO = gauge("retrieval_cache_hit_ratio", "Fraction of retrieval cache lookups that were hits")
+RETRIEVAL_CACHE_ENTRIES = gauge("retrieval_cache_entries", "Entries held in the retrieval cache")
+
+
+class RetrievalCache:
+    """
+    TTL + LRU cache of search results keyed by the query embedding and search parameters.
+
+    Embeddings are quantized to float16 before hashing, so repeated questions (and
+    embeddings that differ only in float noise) share an entry. Keys include the
+    index version, which IndexingService changes on every write; entries for older
+    versions are never looked up again and age out. The version is read through
+    `index_version` and trusted for `version_ttl` seconds, so writes made by other
+    processes are picked up within that window.
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL,
+                 version_ttl: float = RETRIEVAL_CACHE_VERSION_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._versions: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(embedding: Sequence[float], **params) -> str:
+        """Cache key for a query embedding and the parameters of the search."""
+        digest = hashlib.sha1(struct.pack(f"<{len(embedding)}e", *embedding))
+        digest.update(repr(sorted(params.items())).encode("utf-8"))
+        return digest.hexdigest()
+
+    def index_version(self, index: str, fetch: Callable[[], str]) -> str:
+        """Current version of `index`, calling `fetch` when the cached one is older than version_ttl."""
+        now = time.monotonic()
+        cached = self._versions.get(index)
+        if cached is not None and now - cached[1] < self.version_ttl:
+            return cached[0]
+        version = fetch()
+        self._versions[index] = (version, now)
+        return version
+
+    def set_index_version(self, index: str, version: str) -> None:
+        """Record a version change made by this process so it applies immediately."""
+        self._versions[index] = (version, time.monotonic())
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            ratio = self.hits / (self.hits + self.misses)
+        RETRIEVAL_CACHE_REQUESTS.inc(outcome="miss" if entry is None else "hit")
+        RETRIEVAL_CACHE_HIT_RATIO.set(ratio)
+        return None if entry is None else entry[0]
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            size = len(self._entries)
+        RETRIEVAL_CACHE_ENTRIES.set(size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+        RETRIEVAL_CACHE_ENTRIES.set(0)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0}
+
+
+# The index version lives in the index mapping's _meta, so every process sees the same value
+
+def read_index_version(client, index: str) -> str:
+    """Version stored in the `_meta` of `index`'s mapping ("0" if none has been set)."""
+    with opensearch_call("get_mapping"):
+        mapping = client.indices.get_mapping(index=index)
+    # Keyed by the physical index, which differs from `index` when it is an alias
+    meta = mapping.get(index) or next(iter(mapping.values()), {})
+    meta = meta.get("mappings", {}).get("_meta", {})
+    return str(meta.get("version", "0"))
+
+
+def bump_index_version(client, index: str) -> str:
+    """Store a new version for `index` after a write, invalidating cached search results."""
+    version = str(time.time_ns())
+    with opensearch_call("put_mapping"):
+        client.indices.put_mapping(index=index, body={"_meta": {"version": version}})
+    retrieval_cache.set_index_version(index, version)
+    return version
+
+
+# Shared by QAService (reads) and IndexingService (version changes) within a process
+retrieval_cache = RetrievalCache()
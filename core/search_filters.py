@@ -0,0 +1,101 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from ..config.settings import EMBEDDING_MODEL
+from .metrics import opensearch_call
+
+logger = logging.getLogger(__name__)
+
+# kNN engines that apply a knn query's `filter` while searching the graph (OpenSearch
+# 2.9: lucene up to 1024 dimensions, faiss up to 16000). Indexes on other engines
+# (nmslib, used by papers indexes created before filtering) reject the filter, so
+# their results are filtered after the top k are found instead.
+FILTERING_ENGINES = ("lucene", "faiss")
+# OpenSearch's defaults for a knn_vector field without a method
+DEFAULT_KNN_METHOD = {"engine": "nmslib", "space_type": "l2"}
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """
+    Restrictions applied to kNN retrieval over the papers index. They are sent as the
+    knn query's `filter`, so OpenSearch filters while traversing the graph (efficient
+    filtering, faiss and Lucene engines) instead of dropping hits after the top k are
+    found: scoping to a few documents in a large corpus still returns k results at flat
+    latency. Indexes on engines without filtering get the filter applied to the top k.
+
+    By default only chunks embedded with the configured EMBEDDING_MODEL are searched,
+    as vectors from different models are not comparable. Set embedding_model=None to
+    search every model.
+    """
+    document_checksums: Optional[Tuple[str, ...]] = None
+    titles: Optional[Tuple[str, ...]] = None
+    exclude_charts: bool = False
+    embedding_model: Optional[str] = EMBEDDING_MODEL
+    pdf_loader: Optional[str] = None
+
+    def __post_init__(self):
+        # Tuples keep the filters hashable and usable in cache keys
+        for name in ("document_checksums", "titles"):
+            value = getattr(self, name)
+            if value is not None and not isinstance(value, tuple):
+                object.__setattr__(self, name, tuple(value))
+
+    def to_query(self) -> Optional[Dict]:
+        """Bool filter for the knn query, or None when nothing is filtered."""
+        clauses: List[Dict] = []
+        if self.document_checksums is not None:
+            clauses.append({"terms": {"documentChecksum": list(self.document_checksums)}})
+        if self.titles is not None:
+            clauses.append({"terms": {"title": list(self.titles)}})
+        if self.exclude_charts:
+            clauses.append({"term": {"is_chart": False}})
+        if self.embedding_model:
+            clauses.append({"term": {"embedding_model": self.embedding_model}})
+        if self.pdf_loader:
+            clauses.append({"term": {"pdf_loader": self.pdf_loader}})
+        if not clauses:
+            return None
+        return {"bool": {"filter": clauses}}
+
+    def knn_query(self, field: str, knn: Dict, engine: str) -> Dict:
+        """Query for a knn clause on `field`, filtered during the search if `engine` supports it."""
+        knn_filter = self.to_query()
+        if knn_filter is None:
+            return {"knn": {field: knn}}
+        if engine in FILTERING_ENGINES:
+            return {"knn": {field: {**knn, "filter": knn_filter}}}
+        return {"bool": {"must": [{"knn": {field: knn}}], "filter": [knn_filter]}}
+
+
+DEFAULT_FILTERS = SearchFilters()
+
+_knn_methods: Dict[Tuple[str, str], Dict] = {}
+_knn_methods_lock = threading.Lock()
+
+
+def knn_method(client, index_name: str, field: str = "embedding") -> Dict:
+    """
+    Engine and space type of an index's knn_vector field, read from its mapping once
+    per process. An index that can't be read yet gets the defaults, uncached.
+    """
+    key = (index_name, field)
+    with _knn_methods_lock:
+        method = _knn_methods.get(key)
+    if method is not None:
+        return method
+    try:
+        with opensearch_call("get_mapping"):
+            mapping = client.indices.get_mapping(index=index_name)
+    except Exception as e:
+        logger.warning(f"Could not read the mapping of {index_name}: {str(e)}")
+        return DEFAULT_KNN_METHOD
+    properties = next(iter(mapping.values()), {}).get("mappings", {}).get("properties", {})
+    method = {**DEFAULT_KNN_METHOD, **properties.get(field, {}).get("method", {})}
+    if method["engine"] not in FILTERING_ENGINES:
+        logger.warning(f"{index_name}.{field} uses {method['engine']}, so search filters are applied after the "
+                       "top k; copy it to a faiss index with `python -m src.core.reembed --copy` (see the README)")
+    with _knn_methods_lock:
+        _knn_methods[key] = method
+    return method
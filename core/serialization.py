@@ -0,0 +1,49 @@
+import logging
+from typing import Any
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.serializer import JSONSerializer
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Serializer used for OpenSearch requests and responses. Embeddings dominate bulk
+# payloads: the stdlib encoder turns every float32 array into a list of Python floats
+# and formats them one by one, while orjson writes numpy arrays directly.
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class OrjsonSerializer(JSONSerializer):
+    """
+    JSONSerializer backed by orjson, with native numpy support. Types orjson does not
+    handle (Decimal, pandas objects, ...) go through JSONSerializer.default.
+    dumps returns str, as the bulk helpers measure and join actions as text.
+    """
+
+    def loads(self, s: Any) -> Any:
+        try:
+            return orjson.loads(s)
+        except (orjson.JSONDecodeError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data: Any) -> Any:
+        # don't serialize strings
+        if isinstance(data, str):
+            return data
+        try:
+            return orjson.dumps(data, default=self.default, option=ORJSON_OPTIONS).decode("utf-8")
+        except (orjson.JSONEncodeError, TypeError) as e:
+            raise SerializationError(data, e)
+
+
+def get_serializer() -> JSONSerializer:
+    """The fastest available serializer for OpenSearch clients: orjson if installed."""
+    if orjson is None:
+        logger.info("orjson not installed, using the stdlib JSON serializer")
+        return JSONSerializer()
+    return OrjsonSerializer()
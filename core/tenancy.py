@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import re
+from typing import Dict, List, Optional
+from .metrics import opensearch_call
+
+logger = logging.getLogger(__name__)
+
+# Per-user isolation: each user gets their own index per base index ("themes",
+# the papers index), reached through an alias `<base>-tenant-<user>` that points at
+# the physical index `<alias>-000001`. Queries only touch that user's shards, and
+# dropping a user deletes their indexes, a metadata operation independent of how
+# much data other users have. Requests without a user id use the shared base index.
+
+TENANT_HEADER = "X-User-Id"
+TENANT_MARKER = "-tenant-"
+# User ids used verbatim in index names. They can't contain "-", so they never look
+# like a hashed key ("h-<sha1>") or another user's physical index ("<key>-000001").
+_SAFE = re.compile(r"[a-z0-9][a-z0-9_]{0,63}")
+
+
+def tenant_key(user_id: str) -> str:
+    """
+    Index-name-safe key for a user id: the id itself if it is safe as is, otherwise
+    a hash of the exact id. Distinct ids always get distinct keys.
+    """
+    if _SAFE.fullmatch(user_id):
+        return user_id
+    return f"h-{hashlib.sha1(user_id.encode('utf-8')).hexdigest()}"
+
+
+def tenant_index(base: str, user_id: Optional[str]) -> str:
+    """Index (alias) name holding `user_id`'s documents for the `base` index."""
+    if not user_id:
+        return base
+    return f"{base}{TENANT_MARKER}{tenant_key(user_id)}"
+
+
+def is_tenant_index(index_name: str) -> bool:
+    return TENANT_MARKER in index_name
+
+
+def ensure_index(client, index_name: str, body: Dict) -> bool:
+    """
+    Create `index_name` with `body` if it doesn't exist. Tenant indexes are created as
+    `<alias>-000001` behind the alias so they can later be rebuilt and swapped.
+    Returns True if an index was created.
+    """
+    if client.indices.exists(index=index_name):
+        return False
+    if is_tenant_index(index_name):
+        body = {**body, "aliases": {index_name: {}}}
+        with opensearch_call("create_index"):
+            client.indices.create(index=f"{index_name}-000001", body=body)
+    else:
+        with opensearch_call("create_index"):
+            client.indices.create(index=index_name, body=body)
+    logger.info(f"Created index {index_name}")
+    return True
+
+
+def drop_tenant(client, bases: List[str], user_id: str) -> List[str]:
+    """Delete every index behind `user_id`'s aliases for the given base indexes."""
+    dropped = []
+    for base in bases:
+        alias = tenant_index(base, user_id)
+        if not client.indices.exists_alias(name=alias):
+            continue
+        with opensearch_call("get_alias"):
+            indices = list(client.indices.get_alias(name=alias))
+        with opensearch_call("delete_index"):
+            client.indices.delete(index=",".join(indices))
+        dropped.extend(indices)
+    logger.info(f"Dropped indexes of user {tenant_key(user_id)}: {dropped}")
+    return dropped
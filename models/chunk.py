@@ -1,7 +1,8 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence
+import numpy as np
 
-@dataclass
+@dataclass(slots=True)
 class ParagraphChunk:
     title: str
     documentChecksum: str
@@ -11,4 +12,15 @@ class ParagraphChunk:
     text_content: str
     embedding_model: str
     pdf_loader: str
-    embedding: Optional[List[float]] = None 
\ No newline at end of file
+    # Stored as a float32 array: ~6 KB per 1536-dim vector instead of ~50 KB as a list of floats
+    embedding: Optional[np.ndarray] = None
+    # Regions the chunk was read from: [{"page", "x0", "y0", "x1", "y1"}] in PDF points (layout loader only)
+    bboxes: Optional[List[Dict]] = None
+
+    def __post_init__(self):
+        if self.embedding is not None:
+            self.set_embedding(self.embedding)
+
+    def set_embedding(self, values: Sequence[float]) -> None:
+        """Store an embedding (list, array or buffer) as a contiguous float32 array."""
+        self.embedding = np.asarray(values, dtype=np.float32)
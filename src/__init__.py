@@ -0,0 +1,8 @@
+# The Python code imports the project as the `src` package (src.core, src.models,
+# src.config), laid out here as core/, models/ and backend/config/. Pointing the
+# package's path at the repository root and backend/ resolves those imports, so
+# the CLIs run from the repository root with `python -m src.core.<module>`.
+import os
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+__path__ = [_ROOT, os.path.join(_ROOT, "backend")]